@@ -0,0 +1,179 @@
+"""
+Capture backends: where input events and screen frames come from.
+
+A backend delivers keyboard, mouse button/scroll and raw mouse events to a
+sink with the InputLogger callbacks (on_press, on_release, on_click,
+on_scroll, on_raw_mouse, poll_mouse) and provides a frame source for the
+screenshot pipeline. combined_logger implements it with pynput, Windows raw input and
+ImageGrab; SyntheticBackend generates configurable load on any platform,
+which benchmarks.end_to_end uses to drive the real logging and screenshot
+pipeline headless.
+"""
+import random
+import threading
+import time
+
+from scheduler import DeadlineScheduler, CATCH_UP
+from screenshot_pipeline import SyntheticFrameSource
+
+
+class CaptureBackend:
+    """
+    Interface of a capture backend.
+
+    start() begins delivering input events to the sink (from any thread),
+    stop() ends it, and grab() returns one PIL image of the screen.
+    """
+
+    def start(self, sink):
+        raise NotImplementedError
+
+    def stop(self):
+        pass
+
+    def grab(self):
+        raise NotImplementedError
+
+
+class SyntheticKey:
+    """Stand-in for a pynput KeyCode (a character key)."""
+
+    def __init__(self, char):
+        self.char = char
+
+    def __str__(self):
+        return repr(self.char)
+
+
+class SyntheticSpecialKey:
+    """Stand-in for a pynput Key member (a special key, without `char`)."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return f"Key.{self.name}"
+
+
+CHORD_KEYS = [SyntheticSpecialKey('shift'), SyntheticSpecialKey('ctrl'), SyntheticSpecialKey('space')] + \
+    [SyntheticKey(char) for char in 'wasdqer12345']
+
+
+class SyntheticBackend(CaptureBackend):
+    """
+    Backend generating input at configurable rates, and synthetic frames.
+
+    Raw mouse deltas are delivered at `mouse_rate` Hz (in batches of the events
+    due every `tick` seconds, like a busy message loop), key chords (press
+    `chord_size` keys, hold, release them) arrive `chord_rate` times per second
+    and clicks and scrolls at their own rates. Timing follows deadline
+    schedules, so the average rates are exact; `lag_ns` collects how late each
+    batch was delivered relative to its due time.
+
+    Args:
+        mouse_rate: Raw mouse events per second
+        chord_rate: Key chords per second
+        chord_size: Keys pressed together in a chord
+        click_rate: Mouse clicks (press + release) per second
+        scroll_rate: Scroll events per second
+        tick: Delivery period of the raw mouse batches in seconds
+        frame_size: (width, height) of the synthetic frames
+        seed: Random seed for the generated deltas and keys
+    """
+
+    def __init__(self, mouse_rate=8000, chord_rate=2.0, chord_size=3, click_rate=1.0, scroll_rate=1.0,
+                 tick=0.001, frame_size=(1920, 1080), seed=0):
+        self.mouse_rate = mouse_rate
+        self.chord_rate = chord_rate
+        self.chord_size = chord_size
+        self.click_rate = click_rate
+        self.scroll_rate = scroll_rate
+        self.tick = tick
+        self.frames = SyntheticFrameSource(*frame_size)
+        self.random = random.Random(seed)
+
+        self.lag_ns = []
+        self._running = False
+        self._threads = []
+
+        # Counters reported by stats()
+        self.mouse_events = 0
+        self.key_events = 0
+        self.click_events = 0
+        self.scroll_events = 0
+
+    def start(self, sink):
+        self._running = True
+        loops = [(self._mouse_loop, "SyntheticMouse")]
+        if self.chord_rate > 0:
+            loops.append((self._key_loop, "SyntheticKeys"))
+        if self.click_rate > 0 or self.scroll_rate > 0:
+            loops.append((self._button_loop, "SyntheticButtons"))
+        self._threads = [threading.Thread(target=loop, args=(sink,), name=name, daemon=True)
+                         for loop, name in loops]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._running = False
+        for thread in self._threads:
+            thread.join()
+
+    def grab(self):
+        return self.frames()
+
+    def stats(self):
+        """Return the number of events delivered per source."""
+        return {
+            'mouse_events': self.mouse_events,
+            'key_events': self.key_events,
+            'click_events': self.click_events,
+            'scroll_events': self.scroll_events,
+        }
+
+    def _mouse_loop(self, sink):
+        if self.mouse_rate <= 0:
+            return
+        scheduler = DeadlineScheduler(1 / self.tick, policy=CATCH_UP)
+        rng = random.Random(self.random.random())
+        start = None
+        while self._running:
+            deadline = scheduler.wait()
+            now = time.perf_counter()
+            if start is None:
+                start = deadline
+            due = int((deadline - start) * self.mouse_rate) + 1
+            self.lag_ns.append(int((now - deadline) * 1e9))
+            while self.mouse_events < due:
+                sink.on_raw_mouse(rng.randint(-3, 3) or 1, rng.randint(-3, 3))
+                self.mouse_events += 1
+            sink.poll_mouse()
+
+    def _key_loop(self, sink):
+        scheduler = DeadlineScheduler(self.chord_rate, policy=CATCH_UP)
+        rng = random.Random(self.random.random())
+        while self._running:
+            scheduler.wait()
+            chord = rng.sample(CHORD_KEYS, min(self.chord_size, len(CHORD_KEYS)))
+            for key in chord:
+                sink.on_press(key)
+            # Held keys auto-repeat, which the logger must not log again
+            for key in chord:
+                sink.on_press(key)
+            for key in reversed(chord):
+                sink.on_release(key)
+            self.key_events += 3 * len(chord)
+
+    def _button_loop(self, sink):
+        rate = self.click_rate + self.scroll_rate
+        scheduler = DeadlineScheduler(rate, policy=CATCH_UP)
+        rng = random.Random(self.random.random())
+        while self._running:
+            scheduler.wait()
+            if rng.random() * rate < self.click_rate:
+                sink.on_click(0, 0, 'Button.left', True)
+                sink.on_click(0, 0, 'Button.left', False)
+                self.click_events += 2
+            else:
+                sink.on_scroll(0, 0, 0, rng.choice((-1, 1)))
+                self.scroll_events += 1
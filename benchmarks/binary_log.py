@@ -0,0 +1,88 @@
+"""
+Compare loading mouse movements from a text log (regex per line, as in
+visualize_mouse_data.parse_log_file) with memory-mapping the binary format.
+
+Run from the repository root:
+    python -m benchmarks.binary_log --hours 1
+"""
+import argparse
+import os
+import re
+import tempfile
+import time
+
+import numpy as np
+
+from binary_log import EVENT_MOUSE_MOVE, read_binary_log, text_to_binary
+
+
+def write_text_log(path, moves, start=1711031445.0, rate=1000):
+    """Write a synthetic text log with `moves` raw mouse movements at `rate` Hz."""
+    rng = np.random.default_rng(0)
+    dx = rng.integers(-5, 6, moves)
+    dy = rng.integers(-5, 6, moves)
+    with open(path, 'w') as f:
+        f.write("--- Logging session started at 2024-03-21 14:30:45.000 ---\n")
+        for i in range(moves):
+            f.write(f"{start + i / rate:.3f} - MOUSE MOVED: {dx[i]}, {dy[i]}\n")
+
+
+def load_text(path):
+    timestamps, xs, ys = [], [], []
+    x = y = 0
+    with open(path, 'r') as f:
+        for line in f:
+            match = re.match(r'(\d+\.\d+) - MOUSE MOVED: (-?\d+), (-?\d+)', line)
+            if match:
+                x += int(match.group(2))
+                y += int(match.group(3))
+                timestamps.append(float(match.group(1)))
+                xs.append(x)
+                ys.append(y)
+    return np.array(timestamps), np.array(xs), np.array(ys)
+
+
+def load_binary(path):
+    records, _ = read_binary_log(path)
+    moves = records[records['type'] == EVENT_MOUSE_MOVE]
+    return moves['t_ns'] / 1e9, np.cumsum(moves['dx']), np.cumsum(moves['dy'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--hours', type=float, default=0.25)
+    parser.add_argument('--rate', type=int, default=1000)
+    args = parser.parse_args()
+    moves = int(args.hours * 3600 * args.rate)
+
+    with tempfile.TemporaryDirectory() as directory:
+        text_path = os.path.join(directory, 'session_log.txt')
+        write_text_log(text_path, moves, rate=args.rate)
+
+        start = time.perf_counter()
+        binary_path = text_to_binary(text_path)
+        convert = time.perf_counter() - start
+
+        start = time.perf_counter()
+        text_result = load_text(text_path)
+        text_load = time.perf_counter() - start
+
+        start = time.perf_counter()
+        binary_result = load_binary(binary_path)
+        binary_load = time.perf_counter() - start
+
+        assert np.array_equal(text_result[1], binary_result[1])
+        assert np.array_equal(text_result[2], binary_result[2])
+
+        text_size = os.path.getsize(text_path)
+        binary_size = os.path.getsize(binary_path)
+
+    print(f"Moves: {moves:,} ({args.hours} h at {args.rate} Hz)")
+    print(f"Size   : text {text_size / 1e6:.1f} MB, binary {binary_size / 1e6:.1f} MB")
+    print(f"Convert: {convert:.2f} s")
+    print(f"Load   : text {text_load * 1000:.0f} ms, binary {binary_load * 1000:.1f} ms "
+          f"({text_load / binary_load:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Check that the vectorized find_center_return_mask removes exactly the same
+movements as the original pure-Python find_center_returns loop on
+randomized inputs, and time it on large synthetic sessions.
+
+Run from the repository root:
+    python -m benchmarks.center_returns --check 500 --sizes 1000000 10000000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from clean_mouse_data import find_center_return_mask
+
+
+def reference_center_returns(timestamps, dx, dy, window_size=20, time_threshold=0.05, position_threshold=2):
+    """The original find_center_returns loop, on plain lists."""
+    if len(timestamps) < 2:
+        return set()
+
+    cumulative_x = []
+    cumulative_y = []
+    cum_x = 0
+    cum_y = 0
+    for mx, my in zip(dx, dy):
+        cum_x += mx
+        cum_y += my
+        cumulative_x.append(cum_x)
+        cumulative_y.append(cum_y)
+
+    movements_to_remove = set()
+    n = len(timestamps)
+    i = 0
+    while i < n - 1:
+        end = min(i + window_size, n)
+        if end - i < 2:
+            break
+        for j in range(1, end - i):
+            dist_from_start = np.sqrt((cumulative_x[i + j] - cumulative_x[i])**2 +
+                                      (cumulative_y[i + j] - cumulative_y[i])**2)
+            time_diff = timestamps[i + j] - timestamps[i]
+            if dist_from_start <= position_threshold and time_diff <= time_threshold:
+                for k in range(i + 1, i + j + 1):
+                    movements_to_remove.add(k)
+                i = i + j
+                break
+        i += 1
+    return movements_to_remove
+
+
+def synthetic_moves(n, seed=0, correction_rate=0.05, rate=1000):
+    """
+    Random raw mouse deltas at `rate` Hz with injected game corrections:
+    a burst of movement immediately followed by its exact inverse.
+    """
+    rng = np.random.default_rng(seed)
+    timestamps = 1711031445.0 + np.cumsum(rng.exponential(1 / rate, n))
+    dx = rng.integers(-6, 7, n)
+    dy = rng.integers(-6, 7, n)
+    starts = np.flatnonzero(rng.random(n - 8) < correction_rate)
+    for length in (1, 2, 3):
+        s = starts[starts % 3 == length - 1]
+        for k in range(length):
+            dx[s + length + k] = -dx[s + k]
+            dy[s + length + k] = -dy[s + k]
+    return timestamps, dx, dy
+
+
+def check_equivalence(cases, seed=0):
+    rng = np.random.default_rng(seed)
+    for case in range(cases):
+        n = int(rng.integers(0, 400))
+        timestamps, dx, dy = synthetic_moves(max(n, 9), seed=case, correction_rate=rng.uniform(0, 0.3),
+                                             rate=int(rng.choice([100, 1000, 8000])))
+        timestamps, dx, dy = timestamps[:n], dx[:n], dy[:n]
+        params = {
+            'window_size': int(rng.integers(1, 30)),
+            'time_threshold': float(rng.choice([0.001, 0.005, 0.05, 1.0])),
+            'position_threshold': float(rng.choice([0, 1, 2, 2.5, 5])),
+        }
+        expected = reference_center_returns(timestamps.tolist(), dx.tolist(), dy.tolist(), **params)
+        actual = set(np.flatnonzero(find_center_return_mask(timestamps, dx, dy, **params)).tolist())
+        if expected != actual:
+            raise AssertionError(f"Case {case} differs for n={n}, {params}: "
+                                 f"{sorted(expected ^ actual)[:10]}")
+    print(f"Equivalence: {cases} randomized cases identical")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--check', type=int, default=300, help="Number of randomized equivalence cases")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000_000, 10_000_000])
+    parser.add_argument('--reference-size', type=int, default=200_000,
+                        help="Largest size the pure-Python loop is timed on")
+    args = parser.parse_args()
+
+    check_equivalence(args.check)
+
+    for n in args.sizes:
+        timestamps, dx, dy = synthetic_moves(n)
+        start = time.perf_counter()
+        remove = find_center_return_mask(timestamps, dx, dy)
+        vectorized = time.perf_counter() - start
+        line = f"{n:>11,} moves: vectorized {vectorized:7.2f} s, removed {int(remove.sum()):,}"
+        if n <= args.reference_size:
+            start = time.perf_counter()
+            reference_center_returns(timestamps.tolist(), dx.tolist(), dy.tolist())
+            reference = time.perf_counter() - start
+            line += f", reference {reference:7.2f} s ({reference / vectorized:.0f}x)"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
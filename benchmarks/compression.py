@@ -0,0 +1,87 @@
+"""
+Compare log compression codecs and levels: bytes on disk, write speed, full
+parse throughput and the cost of reading a short time window (one block
+decompressed) on a deterministic synthetic session.
+
+Run from the repository root:
+    python -m benchmarks.compression --moves 1000000 --codecs zlib:1 zlib:6 gzip:6 lzma:1 lzma:6
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.session_generator import generate_session
+from log_frames import CODEC_NONE, DEFAULT_BLOCK_SIZE, FrameWriter, open_log
+from log_index import build_index, read_window
+from log_parser import parse_log
+
+DEFAULT_CODECS = ['zlib:1', 'zlib:6', 'zlib:9', 'gzip:6', 'lzma:0', 'lzma:6']
+
+
+def compress_log(text_path, path, codec, level, block_size):
+    """Write the text log `text_path` as a compressed log. Returns elapsed seconds."""
+    start = time.perf_counter()
+    with open(text_path, 'r') as src, FrameWriter(path, codec, level, block_size, mode='wb') as dst:
+        for block in iter(lambda: src.read(block_size), ''):
+            dst.write(block)
+    return time.perf_counter() - start
+
+
+def bench_log(path, moves, windows, window_s, seed=0):
+    """Parse the whole log, then read `windows` random windows of `window_s` seconds through its index."""
+    start = time.perf_counter()
+    data = parse_log(path)
+    parse = time.perf_counter() - start
+    assert len(data.moves['t_ns']) == moves
+
+    index = build_index(path)
+    rng = np.random.default_rng(seed)
+    span = index.last_t_ns - index.first_t_ns - int(window_s * 1e9)
+    starts = index.first_t_ns + (rng.random(windows) * span).astype(np.int64)
+    start = time.perf_counter()
+    for begin in starts:
+        read_window(path, int(begin), int(begin + window_s * 1e9), index)
+    window = (time.perf_counter() - start) / windows
+    return {'bytes': os.path.getsize(path), 'moves_per_sec': moves / parse, 'window_ms': window * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--moves', type=int, default=1_000_000)
+    parser.add_argument('--codecs', nargs='+', default=DEFAULT_CODECS, help="codec:level pairs")
+    parser.add_argument('--block-kb', type=int, default=DEFAULT_BLOCK_SIZE // 1024)
+    parser.add_argument('--windows', type=int, default=50, help="Random windows to read per log")
+    parser.add_argument('--window-seconds', type=float, default=1.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        text_path = os.path.join(directory, 'session_log.txt')
+        generate_session(text_path, args.moves)
+        results = [dict(bench_log(text_path, args.moves, args.windows, args.window_seconds),
+                        name='text', write_mb_per_sec=None)]
+        text_bytes = results[0]['bytes']
+        for spec in [CODEC_NONE + ':0'] + args.codecs:
+            codec, level = spec.split(':')
+            path = os.path.join(directory, f"{codec}{level}_log.txt")
+            elapsed = compress_log(text_path, path, codec, int(level), args.block_kb * 1024)
+            result = bench_log(path, args.moves, args.windows, args.window_seconds)
+            results.append(dict(result, name='framed' if codec == CODEC_NONE else spec,
+                                write_mb_per_sec=text_bytes / elapsed / 1e6))
+            # Everything the tools read must match the text log exactly
+            with open_log(path) as f, open(text_path, 'rb') as g:
+                assert f.read() == g.read()
+            os.remove(path)
+
+    print(f"Moves: {args.moves:,}, text log {text_bytes / 1e6:.1f} MB, blocks of {args.block_kb} KB")
+    print(f"{'codec':<10}{'MB on disk':>12}{'ratio':>8}{'write MB/s':>12}{'parse moves/s':>16}{'window read':>14}")
+    for r in results:
+        write = f"{r['write_mb_per_sec']:>12.1f}" if r['write_mb_per_sec'] is not None else f"{'':>12}"
+        print(f"{r['name']:<10}{r['bytes'] / 1e6:>12.2f}{text_bytes / r['bytes']:>8.1f}{write}"
+              f"{r['moves_per_sec']:>16,.0f}{r['window_ms']:>12.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Measure log throughput and input-thread write() latency at every durability
+level of the LogWriter (buffered, group commit, strict), with and without
+framing, and check that a binary session killed mid-write is recovered and
+decoded at every level that syncs.
+
+fsync cost depends entirely on the disk, so run it on the drive the logs
+are written to (a tmpfs makes every level look free):
+
+Run from the repository root:
+    python -m benchmarks.durability --events 100000 --strict-events 2000 --directory logs
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from binary_log import EVENT_KEY_PRESS, EVENT_MOUSE_MOVE, BinaryLogWriter, Event, read_binary_log
+from log_frames import recover
+from log_parser import parse_log
+from log_writer import DURABILITY_BUFFERED, DURABILITY_GROUP, DURABILITY_STRICT, LogWriter
+
+
+def run_producers(writer, events, producers):
+    """Call writer.write() `events` times spread over `producers` threads. Returns (elapsed, latencies in ns)."""
+    per_thread = events // producers
+    latencies = [np.zeros(per_thread, dtype=np.int64) for _ in range(producers)]
+
+    def produce(out):
+        for i in range(per_thread):
+            start = time.perf_counter_ns()
+            writer.write(f"{time.time_ns() / 1e9:.9f} - MOUSE MOVED: {i % 7 - 3}, {i % 5 - 2}")
+            out[i] = time.perf_counter_ns() - start
+
+    threads = [threading.Thread(target=produce, args=(out,)) for out in latencies]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start, np.concatenate(latencies)
+
+
+def bench_level(directory, durability, framed, events, producers, sync_ms, sync_events):
+    path = os.path.join(directory, f"{durability}{'_framed' if framed else ''}_log.txt")
+    writer = LogWriter(path, durability=durability, sync_interval=sync_ms / 1000, sync_events=sync_events,
+                       framed=framed, block=True)
+    enqueue, latencies = run_producers(writer, events, producers)
+    start = time.perf_counter()
+    writer.close()
+    elapsed = enqueue + time.perf_counter() - start
+    stats = writer.stats()
+    moves = len(parse_log(path, moves_only=True).moves['t_ns'])
+    return {
+        'durability': durability,
+        'framed': framed,
+        'events': stats['written'],
+        'events_per_sec': stats['written'] / elapsed,
+        'write_p50_us': float(np.percentile(latencies, 50)) / 1000,
+        'write_p99_us': float(np.percentile(latencies, 99)) / 1000,
+        'write_max_us': float(latencies.max()) / 1000,
+        'syncs': stats['syncs'],
+        'max_sync_ms': stats['max_sync_ms'],
+        'bytes': os.path.getsize(path),
+        'readable': moves == stats['written'] and recover(path, dry_run=True)['truncated'] == 0,
+    }
+
+
+def killed_session_events(events):
+    """Events of the killed binary session: movements with a key press (of 50 different keys) every 10th."""
+    return [Event(1_700_000_000_000_000_000 + i * 1_000_000, EVENT_KEY_PRESS, f"key_{i // 10 % 50}", 0, 0)
+            if i % 10 == 0 else Event(1_700_000_000_000_000_000 + i * 1_000_000, EVENT_MOUSE_MOVE, None, 1, -1)
+            for i in range(events)]
+
+
+def write_and_die(path, durability, events, sync_ms, sync_events):
+    """Write a binary session and exit without closing the writer, as if the logger was killed."""
+    writer = BinaryLogWriter(path, durability=durability, sync_interval=sync_ms / 1000, sync_events=sync_events,
+                             block=True)
+    writer.write("--- Logging session started at 2023-11-14 22:13:20.000 ---")
+    for event in killed_session_events(events):
+        writer.write(event)
+    writer.flush()
+    os._exit(0)
+
+
+def bench_killed_binary(directory, durability, events, sync_ms, sync_events):
+    """Kill a binary session after `events` events, recover its log and decode it."""
+    path = os.path.join(directory, f"{durability}_killed_log.bin")
+    child = multiprocessing.Process(target=write_and_die, args=(path, durability, events, sync_ms, sync_events))
+    child.start()
+    child.join()
+    result = recover(path)
+    records, names = read_binary_log(path)
+    expected = ['--- Logging session started at 2023-11-14 22:13:20.000 ---'] + [
+        event.name for event in killed_session_events(events) if event.event_type == EVENT_KEY_PRESS]
+    decoded = [names[code] if code < len(names) else None for code, event_type in
+               zip(records['code'].tolist(), records['type'].tolist()) if event_type != EVENT_MOUSE_MOVE]
+    return {
+        'durability': durability,
+        'records': result['records'],
+        'journal': result['journal'],
+        'decoded': decoded == expected,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=100000)
+    parser.add_argument('--strict-events', type=int, default=2000,
+                        help="Events for the strict level, which waits for an fsync per batch")
+    parser.add_argument('--producers', type=int, default=1)
+    parser.add_argument('--sync-ms', type=float, default=50)
+    parser.add_argument('--sync-events', type=int, default=10000)
+    parser.add_argument('--directory', default=None, help="Where to write the logs (default: the temp directory)")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory(dir=args.directory) as directory:
+        for durability in (DURABILITY_BUFFERED, DURABILITY_GROUP, DURABILITY_STRICT):
+            events = args.strict_events if durability == DURABILITY_STRICT else args.events
+            for framed in (False, True):
+                results.append(bench_level(directory, durability, framed, events, args.producers,
+                                           args.sync_ms, args.sync_events))
+        killed = [bench_killed_binary(directory, durability, args.strict_events, args.sync_ms, args.sync_events)
+                  for durability in (DURABILITY_BUFFERED, DURABILITY_GROUP, DURABILITY_STRICT)]
+
+    print(f"Producer threads: {args.producers}, group commit every {args.sync_ms:g} ms or {args.sync_events} lines")
+    print(f"{'level':<16}{'events':>9}{'events/s':>13}{'write p50':>11}{'p99':>10}{'max':>11}"
+          f"{'syncs':>8}{'max sync':>10}{'bytes':>12}")
+    for r in results:
+        name = r['durability'] + (' framed' if r['framed'] else '')
+        print(f"{name:<16}{r['events']:>9}{r['events_per_sec']:>13,.0f}{r['write_p50_us']:>9.1f}us"
+              f"{r['write_p99_us']:>8.1f}us{r['write_max_us']:>9.1f}us{r['syncs']:>8}{r['max_sync_ms']:>8.2f}ms"
+              f"{r['bytes']:>12,}" + ("" if r['readable'] else "  UNREADABLE"))
+
+    # Buffered binary logs only get their string table on close, so their names cannot be decoded
+    print(f"\nBinary session killed after {args.strict_events} events, then recovered:")
+    print(f"{'level':<16}{'records':>9}{'journal':>9}  names")
+    for r in killed:
+        expected = r['durability'] == DURABILITY_BUFFERED or r['decoded']
+        print(f"{r['durability']:<16}{r['records']:>9}{'yes' if r['journal'] else 'no':>9}  "
+              + ("decoded" if r['decoded'] else "lost") + ("" if expected else "  UNREADABLE"))
+
+
+if __name__ == "__main__":
+    main()
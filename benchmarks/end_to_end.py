@@ -0,0 +1,146 @@
+"""
+Drive the real input logging, log writer and screenshot pipeline with the
+synthetic capture backend and report end-to-end latency and throughput.
+
+Latencies are measured from the moment an event enters the input logger
+(or a frame is grabbed) until it has been written to the file, so they
+include formatting, queueing, batching and encoding. Runs headless.
+
+Run from the repository root:
+    python -m benchmarks.end_to_end --seconds 10 --mouse-rate 8000 --fps 60
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from backends import SyntheticBackend
+from binary_log import BinaryLogWriter
+from input_logger import InputLogger
+from live_cleaning import CleaningLogWriter
+from log_writer import LogWriter
+from screenshot_pipeline import ScreenshotPipeline
+from session_clock import SessionClock
+
+
+class LatencyProbe:
+    """
+    LogWriter mixin recording, for every item, the time from write() until its
+    batch has been written and flushed. Items leave the queue in FIFO order.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._submitted = deque()
+        self._probe_lock = threading.Lock()
+        self.latencies_ns = []
+        super().__init__(*args, **kwargs)
+
+    def write(self, message):
+        with self._probe_lock:
+            submitted = time.perf_counter_ns()
+            written = super().write(message)
+            if written:
+                self._submitted.append(submitted)
+        return written
+
+    def _write_batch(self, batch):
+        super()._write_batch(batch)
+        now = time.perf_counter_ns()
+        for _ in batch:
+            self.latencies_ns.append(now - self._submitted.popleft())
+
+
+class ProbedLogWriter(LatencyProbe, LogWriter):
+    pass
+
+
+class ProbedBinaryLogWriter(LatencyProbe, BinaryLogWriter):
+    pass
+
+
+class ProbedCleaningLogWriter(LatencyProbe, CleaningLogWriter):
+    pass
+
+
+def percentiles_ms(values_ns):
+    if len(values_ns) == 0:
+        return "n/a"
+    p50, p99, p999 = np.percentile(values_ns, [50, 99, 99.9]) / 1e6
+    return f"p50 {p50:7.3f} ms, p99 {p99:7.3f} ms, p99.9 {p999:7.3f} ms, max {max(values_ns) / 1e6:7.3f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--mouse-rate', type=float, default=8000, help="Raw mouse events per second")
+    parser.add_argument('--chord-rate', type=float, default=2, help="Key chords per second")
+    parser.add_argument('--chord-size', type=int, default=3)
+    parser.add_argument('--click-rate', type=float, default=1)
+    parser.add_argument('--scroll-rate', type=float, default=1)
+    parser.add_argument('--aggregation', type=float, default=0, help="Raw mouse bin width in ms (0 = none)")
+    parser.add_argument('--format', choices=('text', 'binary'), default='text')
+    parser.add_argument('--live-cleaning', action='store_true', help="Also write the cleaned log while logging (text)")
+    parser.add_argument('--fps', type=float, default=60, help="Screenshot rate (0 disables screenshots)")
+    parser.add_argument('--workers', type=int, default=None, help="Screenshot encoder processes")
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    args = parser.parse_args()
+
+    backend = SyntheticBackend(mouse_rate=args.mouse_rate, chord_rate=args.chord_rate, chord_size=args.chord_size,
+                               click_rate=args.click_rate, scroll_rate=args.scroll_rate,
+                               frame_size=(args.width, args.height))
+    with tempfile.TemporaryDirectory() as folder:
+        log_path = os.path.join(folder, f"session_log.{'bin' if args.format == 'binary' else 'txt'}")
+        clock = SessionClock()
+        if args.format == 'binary':
+            writer = ProbedBinaryLogWriter(log_path)
+        elif args.live_cleaning:
+            writer = ProbedCleaningLogWriter(log_path, clock=clock.now_ns, max_delay=0.1 + 2 * args.aggregation / 1000)
+        else:
+            writer = ProbedLogWriter(log_path)
+        input_logger = InputLogger(writer, mouse_bin_ns=int(args.aggregation * 1e6), clock=clock.now_ns)
+        pipeline = None
+        if args.fps > 0:
+            pipeline = ScreenshotPipeline(os.path.join(folder, 'screenshots'), backend.grab,
+                                          frequency=args.fps, workers=args.workers, clock=clock.now_ns)
+            pipeline.start()
+
+        start = time.perf_counter()
+        backend.start(input_logger)
+        time.sleep(args.seconds)
+        elapsed = time.perf_counter() - start
+        backend.stop()
+        input_logger.flush_mouse()
+        writer.close()
+        if pipeline:
+            pipeline.stop()
+        log_size = os.path.getsize(log_path)
+
+    events = backend.stats()
+    writer_stats = writer.stats()
+    delivered = sum(events.values())
+    print(f"Generated over {elapsed:.1f} s: " + ", ".join(f"{name} {count:,}" for name, count in events.items()))
+    print(f"Input throughput:  {delivered / elapsed:10,.0f} events/s delivered, "
+          f"{writer_stats['written'] / elapsed:10,.0f} log records/s written, "
+          f"dropped {writer_stats['dropped']:,}, log size {log_size / 1e6:.1f} MB")
+    print(f"Delivery lag:      {percentiles_ms(backend.lag_ns)}")
+    print(f"Event to disk:     {percentiles_ms(writer.latencies_ns)}")
+    if 'cleaned_moves' in writer_stats:
+        print(f"Live cleaning:     removed {writer_stats['cleaned_removed']:,} of {writer_stats['cleaned_moves']:,} "
+              f"movements, late {writer_stats['late_moves']}, at most {writer_stats['max_clean_pending']} "
+              f"lines pending, decided within {(writer.cleaning_params['time_threshold'] + writer.max_delay_ns / 1e9 + 2 * writer.flush_interval) * 1000:.0f} ms")
+    if pipeline:
+        stats = pipeline.stats()
+        timing = pipeline.scheduler.stats()
+        print(f"Screenshots:       target {stats['target_fps']:g} fps, captured {stats['capture_fps']:.1f} fps, "
+              f"encoded {stats['encoded_fps']:.1f} fps, dropped {stats['dropped']}, "
+              f"tick jitter p99 {timing.get('jitter_p99_ms', 0):.3f} ms")
+        print(f"Grab to file:      {percentiles_ms([latency * 1e9 for latency in pipeline.latencies])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Time building the key state index and answering "what was held at t" on a
+synthetic session, and check every answer against a full replay of the key
+and button events. With --late-ms, movements are written up to that long
+after their timestamp (as aggregated movements are), so the record times of
+the log are not sorted.
+
+Run from the repository root:
+    python -m benchmarks.key_state --moves 1000000 --late-ms 0 33.3
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.session_generator import BUTTONS, KEYS, START_TEXT, format_events, generate_events
+from binary_log import (EVENT_BUTTON_PRESS, EVENT_BUTTON_RELEASE, EVENT_KEY_PRESS, EVENT_KEY_RELEASE,
+                        EVENT_MOUSE_MOVE, text_to_binary)
+from key_state import build_key_index, vk_for_name
+
+
+def write_log(path, events, late_ns, seed=0):
+    """
+    Write the events in the order the logger would: movements up to late_ns after their time.
+    Returns the number of records earlier than a record before them.
+    """
+    rng = np.random.default_rng(seed)
+    written = events['t_ns'].copy()
+    moves = events['type'] == EVENT_MOUSE_MOVE
+    written[moves] += rng.integers(0, late_ns + 1, int(moves.sum()))
+    order = np.argsort(written, kind='stable')
+    with open(path, 'w') as f:
+        f.write(f"--- Logging session started at {START_TEXT} ---\n")
+        f.writelines(format_events({column: values[order] for column, values in events.items()}))
+    t_ns = events['t_ns'][order]
+    return int(np.count_nonzero(t_ns < np.maximum.accumulate(t_ns)))
+
+
+def reference_states(events):
+    """(times, states): the held set after every key and button event, replayed in time order."""
+    kinds = {EVENT_KEY_PRESS: (KEYS, True), EVENT_KEY_RELEASE: (KEYS, False),
+             EVENT_BUTTON_PRESS: (BUTTONS, True), EVENT_BUTTON_RELEASE: (BUTTONS, False)}
+    times, states = [], []
+    state = 0
+    for t_ns, event_type, name in zip(events['t_ns'].tolist(), events['type'].tolist(), events['name'].tolist()):
+        if event_type in kinds:
+            names, pressed = kinds[event_type]
+            bit = 1 << vk_for_name(names[name])
+            state = state | bit if pressed else state & ~bit
+            times.append(t_ns)
+            states.append(state)
+    return np.array(times, dtype=np.int64), states
+
+
+def check_queries(index, times, states, queries):
+    """Mean seconds per query; every answer must match the replay."""
+    start = time.perf_counter()
+    answers = [index.state_at(int(t_ns)) for t_ns in queries]
+    elapsed = (time.perf_counter() - start) / len(queries)
+    for t_ns, answer in zip(queries.tolist(), answers):
+        i = int(np.searchsorted(times, t_ns, side='right')) - 1
+        expected = states[i] if i >= 0 else 0
+        assert answer == expected, f"state at {t_ns}: {answer:x}, expected {expected:x}"
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--moves', type=int, default=1_000_000)
+    parser.add_argument('--key-rate', type=float, default=5.0, help="Key presses per second")
+    parser.add_argument('--late-ms', type=float, nargs='+', default=[0.0, 33.3],
+                        help="Maximum delay of the movements (2 bins of MOUSE_AGGREGATION_MS)")
+    parser.add_argument('--queries', type=int, default=2000)
+    args = parser.parse_args()
+
+    events, _ = generate_events(args.moves, key_rate=args.key_rate)
+    times, states = reference_states(events)
+    rng = np.random.default_rng(1)
+    first, last = int(events['t_ns'][0]), int(events['t_ns'][-1])
+    # Random times, plus the exact times of key events and the nanoseconds around them
+    queries = np.concatenate((rng.integers(first - 1000, last + 1000, args.queries),
+                              rng.choice(times, args.queries // 2) + rng.integers(-1, 2, args.queries // 2)))
+
+    print(f"Moves: {args.moves:,}, key and button events: {len(times):,}, queries: {len(queries):,}")
+    print(f"{'late ms':>8}{'format':>8}{'build s':>10}{'entries':>10}{'unsorted':>10}{'query us':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for late_ms in args.late_ms:
+            text_path = os.path.join(directory, 'session_log.txt')
+            unsorted = write_log(text_path, events, int(late_ms * 1e6))
+            binary_path = text_to_binary(text_path)
+            for name, path in (('text', text_path), ('binary', binary_path)):
+                start = time.perf_counter()
+                index = build_key_index(path)
+                build = time.perf_counter() - start
+                assert np.all(np.diff(index.t_ns) >= 0), "index times are not sorted"
+                query = check_queries(index, times, states, queries)
+                print(f"{late_ms:>8.1f}{name:>8}{build:>10.2f}{len(index):>10,}{unsorted:>10}{query * 1e6:>10.1f}")
+            os.remove(binary_path)
+
+
+if __name__ == "__main__":
+    main()
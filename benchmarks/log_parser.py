@@ -0,0 +1,96 @@
+"""
+Compare lines/sec of the shared log_parser against the per-line regex
+parsers it replaces (visualize_mouse_data.parse_log_file and
+clean_mouse_data.parse_log_line as they were before).
+
+Run from the repository root:
+    python -m benchmarks.log_parser --lines 2000000
+"""
+import argparse
+import os
+import re
+import tempfile
+import time
+
+import numpy as np
+
+from log_parser import parse_log
+
+
+def write_mixed_log(path, lines, seed=0):
+    """Synthetic session: mostly raw mouse moves, with key presses, clicks, scrolls and markers."""
+    rng = np.random.default_rng(seed)
+    t = 1711031445.0 + np.cumsum(rng.exponential(0.001, lines))
+    kind = rng.random(lines)
+    dx = rng.integers(-8, 9, lines)
+    dy = rng.integers(-8, 9, lines)
+    with open(path, 'w') as f:
+        f.write("--- Logging session started at 2024-03-21 14:30:45.000 ---\n")
+        for i in range(lines):
+            if kind[i] < 0.02:
+                f.write(f"{t[i]:.3f} - {'PRESSED : w' if i % 2 else 'RELEASED: w'}\n")
+            elif kind[i] < 0.03:
+                f.write(f"{t[i]:.3f} - MOUSE {'PRESSED :' if i % 2 else 'RELEASED:'} Button.left\n")
+            elif kind[i] < 0.035:
+                f.write(f"{t[i]:.3f} - MOUSE SCROLLED: 0, {1 if i % 2 else -1}\n")
+            else:
+                f.write(f"{t[i]:.3f} - MOUSE MOVED: {dx[i]}, {dy[i]}\n")
+        f.write(f"{t[-1]:.3f} --- Logging session ended ---\n")
+
+
+def legacy_parse_log_file(file_path):
+    """The original visualize_mouse_data.parse_log_file."""
+    timestamps = []
+    movements_x = []
+    movements_y = []
+    cumulative_x = 0
+    cumulative_y = 0
+    with open(file_path, 'r') as f:
+        for line in f:
+            match = re.match(r'(\d+\.\d+) - MOUSE MOVED: (-?\d+), (-?\d+)', line)
+            if match:
+                cumulative_x += int(match.group(2))
+                cumulative_y += int(match.group(3))
+                timestamps.append(float(match.group(1)))
+                movements_x.append(cumulative_x)
+                movements_y.append(cumulative_y)
+    return np.array(timestamps), np.array(movements_x), np.array(movements_y)
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--lines', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'session_log.txt')
+        write_mixed_log(path, args.lines)
+        size = os.path.getsize(path)
+
+        legacy_time, (legacy_t, legacy_x, legacy_y) = timed(legacy_parse_log_file, path)
+        moves_time, moves = timed(parse_log, path, moves_only=True)
+        full_time, full = timed(parse_log, path)
+
+    _, x, y = moves.mouse_positions()
+    assert np.array_equal(x, legacy_x) and np.array_equal(y, legacy_y)
+    assert len(full.moves['t_ns']) == len(legacy_t)
+
+    lines = full.n_lines
+    print(f"{lines:,} lines, {size / 1e6:.1f} MB "
+          f"({len(full.keys['line'])} keys, {len(full.buttons['line'])} clicks, "
+          f"{len(full.scrolls['line'])} scrolls, {len(full.messages['line'])} messages)")
+    for name, elapsed in (('legacy regex per line', legacy_time),
+                          ('log_parser (moves only)', moves_time),
+                          ('log_parser (all events)', full_time)):
+        print(f"{name:24}: {lines / elapsed:>12,.0f} lines/s  {size / 1e6 / elapsed:6.1f} MB/s "
+              f"({legacy_time / elapsed:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
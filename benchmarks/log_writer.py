@@ -0,0 +1,90 @@
+"""
+Measure sustained log throughput of the per-event open/append/close writer
+against the batched background LogWriter.
+
+Run from the repository root:
+    python -m benchmarks.log_writer --events 200000 --producers 4
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from log_writer import LogWriter
+
+
+def legacy_write_log(log_file, message):
+    """The original combined_logger.write_log: open, append one line, close."""
+    try:
+        with open(log_file, 'a') as f:
+            f.write(message + '\n')
+    except Exception as e:
+        print(f"Error writing to log: {e}")
+
+
+def run_producers(write, events, producers):
+    """Call write() `events` times spread over `producers` threads. Returns elapsed seconds."""
+    per_thread = events // producers
+
+    def produce():
+        for i in range(per_thread):
+            write(f"{time.time():.3f} - MOUSE MOVED: {i % 7 - 3}, {i % 5 - 2}")
+
+    threads = [threading.Thread(target=produce) for _ in range(producers)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start
+
+
+def bench_legacy(directory, events, producers):
+    path = os.path.join(directory, 'legacy_log.txt')
+    elapsed = run_producers(lambda m: legacy_write_log(path, m), events, producers)
+    return {'elapsed': elapsed, 'events_per_sec': events / elapsed, 'dropped': 0}
+
+
+def bench_writer(directory, events, producers, max_queue):
+    path = os.path.join(directory, 'batched_log.txt')
+    writer = LogWriter(path, max_queue=max_queue)
+    enqueue = run_producers(writer.write, events, producers)
+    start = time.perf_counter()
+    writer.close()
+    drain = time.perf_counter() - start
+    stats = writer.stats()
+    elapsed = enqueue + drain
+    return {
+        'elapsed': elapsed,
+        'enqueue_elapsed': enqueue,
+        'events_per_sec': stats['written'] / elapsed,
+        'enqueue_per_sec': events / enqueue,
+        'dropped': stats['dropped'],
+        'max_queue_depth': stats['max_queue_depth'],
+        'batches': stats['batches'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=200000)
+    parser.add_argument('--producers', type=int, default=1)
+    parser.add_argument('--max-queue', type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        legacy = bench_legacy(directory, args.events, args.producers)
+        batched = bench_writer(directory, args.events, args.producers, args.max_queue)
+
+    print(f"Events: {args.events}, producer threads: {args.producers}")
+    print(f"legacy write_log : {legacy['events_per_sec']:>12,.0f} events/s")
+    print(f"LogWriter        : {batched['events_per_sec']:>12,.0f} events/s sustained "
+          f"({batched['enqueue_per_sec']:,.0f} events/s on the input thread)")
+    print(f"                   dropped={batched['dropped']}, max_queue_depth={batched['max_queue_depth']}, "
+          f"batches={batched['batches']}")
+    print(f"Speedup: {batched['events_per_sec'] / legacy['events_per_sec']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Compare the achieved screenshot rate of the old synchronous grab+save loop
+with the producer/consumer ScreenshotPipeline, using synthetic frames, and
+the PNG-per-frame output with the segmented frame store (--store).
+--dedup skips unchanged frames, --repeat simulates idle stretches and
+--profile selects the encoding profile (encoding_profiles.py).
+
+Run from the repository root:
+    python -m benchmarks.screenshot_pipeline --seconds 5 --fps 60 --store --dedup 0 --repeat 10
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from encoding_profiles import PROFILES, get_profile
+from frame_dedup import FrameChangeDetector
+from frame_store import FrameStore, FrameStoreWriter
+from screenshot_pipeline import ScreenshotPipeline, SyntheticFrameSource, screenshot_filename
+
+
+def run_synchronous(folder, grab, frequency, seconds):
+    """The original capture_screenshots loop: grab, save as PNG, sleep 1/frequency."""
+    interval = 1 / frequency
+    frames = 0
+    start = time.monotonic()
+    while time.monotonic() - start < seconds:
+        grab().save(os.path.join(folder, screenshot_filename(time.time_ns())), "PNG")
+        frames += 1
+        time.sleep(interval)
+    return frames / (time.monotonic() - start)
+
+
+def make_detector(threshold):
+    return FrameChangeDetector(threshold) if threshold is not None else None
+
+
+def describe(stats):
+    line = f"dropped={stats['dropped']}, failed={stats['failed']}"
+    if stats['duplicates']:
+        line += f", duplicates={stats['duplicates']}, saved ~{stats['bytes_saved'] / 1e6:.1f} MB"
+    return line
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--fps', type=int, default=60)
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--drop-policy', default='oldest')
+    parser.add_argument('--store', action='store_true', help="Also run the pipeline with the frame store")
+    parser.add_argument('--dedup', type=float, default=None,
+                        help="Skip frames within this tile difference of the last saved one (0 = exact duplicates)")
+    parser.add_argument('--profile', default='png', choices=[profile.name for profile in PROFILES],
+                        help="Encoding profile of the pipeline runs")
+    parser.add_argument('--repeat', type=int, default=1, help="Each synthetic frame is grabbed this many times")
+    args = parser.parse_args()
+    profile = get_profile(args.profile)
+
+    with tempfile.TemporaryDirectory() as directory:
+        sync_fps = run_synchronous(os.path.join(directory), SyntheticFrameSource(args.width, args.height),
+                                   args.fps, args.seconds)
+
+        pipeline = ScreenshotPipeline(os.path.join(directory, 'pipeline'),
+                                      SyntheticFrameSource(args.width, args.height, args.repeat),
+                                      frequency=args.fps, workers=args.workers, drop_policy=args.drop_policy,
+                                      dedup=make_detector(args.dedup), profile=profile)
+        pipeline.start()
+        time.sleep(args.seconds)
+        pipeline.stop()
+        stats = pipeline.stats()
+        png_files = len(os.listdir(os.path.join(directory, 'pipeline')))
+
+        if args.store:
+            store_dir = os.path.join(directory, 'frames')
+            frame_store = FrameStoreWriter(store_dir)
+            store_pipeline = ScreenshotPipeline(store_dir, SyntheticFrameSource(args.width, args.height, args.repeat),
+                                                frequency=args.fps, workers=args.workers,
+                                                drop_policy=args.drop_policy, frame_store=frame_store,
+                                                dedup=make_detector(args.dedup), profile=profile)
+            store_pipeline.start()
+            time.sleep(args.seconds)
+            store_pipeline.stop()
+            frame_store.close()
+            store_stats = store_pipeline.stats()
+            store_files = len(os.listdir(store_dir))
+
+            # Random access: decode frames in random order
+            store = FrameStore(store_dir)
+            order = list(range(len(store)))[::-7]
+            start = time.perf_counter()
+            for i in order:
+                store.frame(i)
+            read_ms = (time.perf_counter() - start) / max(len(order), 1) * 1000
+            store.close()
+
+    print(f"Target: {args.fps} fps, {args.width}x{args.height}, {args.seconds} s, profile {profile.name}")
+    print(f"synchronous grab+save : {sync_fps:6.1f} fps")
+    print(f"ScreenshotPipeline    : {stats['capture_fps']:6.1f} fps captured, {stats['encoded_fps']:6.1f} fps encoded "
+          f"({pipeline.workers} workers, {describe(stats)}, "
+          f"{png_files} files, {stats['bytes_written'] / max(stats['encoded'], 1) / 1e3:.0f} kB/frame)")
+    if args.store:
+        print(f"with frame store      : {store_stats['capture_fps']:6.1f} fps captured, "
+              f"{store_stats['encoded_fps']:6.1f} fps stored ({describe(store_stats)}, {store_files} files, "
+              f"{store_stats['bytes_written'] / max(store_stats['encoded'], 1) / 1e3:.0f} kB/frame, "
+              f"compression {frame_store.stats()['ratio']:.1f}x, random read {read_ms:.1f} ms/frame)")
+    timing = pipeline.scheduler.stats()
+    print(f"capture tick jitter   : mean {timing['jitter_mean_ms']:.3f} ms, p99 {timing['jitter_p99_ms']:.3f} ms, "
+          f"max {timing['jitter_max_ms']:.3f} ms (skipped={timing['skipped']}, overruns={timing['overruns']})")
+
+
+if __name__ == "__main__":
+    main()
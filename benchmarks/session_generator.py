@@ -0,0 +1,151 @@
+"""
+Deterministic generator of realistic synthetic sessions in the exact text
+format written by combined_logger: raw mouse deltas (with injected game
+"center-return" corrections), key presses and releases, clicks and scrolls
+between the session start and end markers. Timestamps have nanosecond
+decimals like current logs, or milliseconds like older ones with
+--millisecond-timestamps.
+
+Run from the repository root:
+    python -m benchmarks.session_generator logs/synthetic_log.txt --hours 1
+"""
+import argparse
+
+import numpy as np
+
+from binary_log import (format_event, format_timestamp, EVENT_KEY_PRESS, EVENT_KEY_RELEASE, EVENT_MOUSE_MOVE,
+                        EVENT_BUTTON_PRESS, EVENT_BUTTON_RELEASE, EVENT_SCROLL)
+
+START_NS = 1711031445_000_000_000
+START_TEXT = "2024-03-21 14:30:45.000"
+# Key names as combined_logger logs them (key.char for character keys, the Key member otherwise)
+KEYS = ['w', 'a', 's', 'd', 'e', 'r', 'q', '1', '2', 'Key.shift', 'Key.space', 'Key.ctrl_l']
+BUTTONS = ['Button.left', 'Button.right']
+WRITE_CHUNK = 100_000
+
+
+def _corrections(rng, dx, dy, rate):
+    """
+    Overwrite movements right after random bursts with their exact inverse, like
+    the game re-centering the cursor. Returns the number of corrections injected.
+    """
+    n = len(dx)
+    if n < 8:
+        return 0
+    starts = np.flatnonzero(rng.random(n - 8) < rate)
+    # Corrections must not overlap, so keep starts at least 8 moves apart
+    starts = starts[np.concatenate(([True], np.diff(starts) >= 8))] if len(starts) else starts
+    for length in (1, 2, 3):
+        s = starts[starts % 3 == length - 1]
+        for k in range(length):
+            dx[s + length + k] = -dx[s + k]
+            dy[s + length + k] = -dy[s + k]
+    return len(starts)
+
+
+def _press_release(rng, count, duration_ns, hold_s, names, press_type, release_type):
+    """Press/release event pairs at random times with exponential hold durations."""
+    press_t = np.sort(rng.integers(0, duration_ns, count)) + START_NS
+    release_t = press_t + (rng.exponential(hold_s, count) * 1e9).astype(np.int64) + 1_000_000
+    name = rng.integers(0, len(names), count)
+    return (np.concatenate((press_t, release_t)),
+            np.concatenate((np.full(count, press_type), np.full(count, release_type))),
+            np.concatenate((name, name)))
+
+
+def generate_events(moves, mouse_rate=1000, seed=0, correction_rate=0.02, key_rate=2.0, click_rate=0.5,
+                    scroll_rate=0.5):
+    """
+    Generate the events of a session with `moves` raw mouse movements at about `mouse_rate` Hz.
+
+    Returns (events, corrections) where events is a dict of time-sorted columns
+    t_ns, type, name (index into KEYS/BUTTONS), dx, dy.
+    """
+    rng = np.random.default_rng(seed)
+    move_t = START_NS + np.cumsum(rng.exponential(1e9 / mouse_rate, moves)).astype(np.int64)
+    duration_ns = int(move_t[-1] - START_NS) if moves else 1_000_000_000
+
+    # Smooth hand motion: velocity changes every 100 ms, plus sensor noise
+    control = np.arange(0, duration_ns + 200_000_000, 100_000_000)
+    dx, dy = (np.rint(np.interp(move_t - START_NS, control, rng.uniform(-8, 8, len(control)))
+                      + rng.normal(0, 0.7, moves)).astype(np.int64) for _ in range(2))
+    # The logger never writes zero movements
+    dx[(dx == 0) & (dy == 0)] = 1
+    corrections = _corrections(rng, dx, dy, correction_rate)
+    seconds = duration_ns / 1e9
+
+    key_t, key_type, key_name = _press_release(rng, int(seconds * key_rate), duration_ns, 0.2, KEYS,
+                                               EVENT_KEY_PRESS, EVENT_KEY_RELEASE)
+    click_t, click_type, click_name = _press_release(rng, int(seconds * click_rate), duration_ns, 0.08, BUTTONS,
+                                                     EVENT_BUTTON_PRESS, EVENT_BUTTON_RELEASE)
+    scrolls = int(seconds * scroll_rate)
+    scroll_t = np.sort(rng.integers(0, duration_ns, scrolls)) + START_NS
+    scroll_dy = rng.choice([-1, 1], scrolls)
+
+    columns = {
+        't_ns': np.concatenate((move_t, key_t, click_t, scroll_t)),
+        'type': np.concatenate((np.full(moves, EVENT_MOUSE_MOVE), key_type, click_type,
+                                np.full(scrolls, EVENT_SCROLL))),
+        'name': np.concatenate((np.zeros(moves, dtype=np.int64), key_name, click_name,
+                                np.zeros(scrolls, dtype=np.int64))),
+        'dx': np.concatenate((dx, np.zeros(len(key_t) + len(click_t) + scrolls, dtype=np.int64))),
+        'dy': np.concatenate((dy, np.zeros(len(key_t) + len(click_t), dtype=np.int64), scroll_dy)),
+    }
+    order = np.argsort(columns['t_ns'], kind='stable')
+    return {column: values[order] for column, values in columns.items()}, corrections
+
+
+def format_events(events, timestamp_digits=9):
+    """Text log lines (with newlines) for generated events."""
+    names = {EVENT_KEY_PRESS: KEYS, EVENT_KEY_RELEASE: KEYS, EVENT_BUTTON_PRESS: BUTTONS,
+             EVENT_BUTTON_RELEASE: BUTTONS}
+    lines = []
+    for t_ns, event_type, name, dx, dy in zip(*(events[column].tolist()
+                                                for column in ('t_ns', 'type', 'name', 'dx', 'dy'))):
+        table = names.get(event_type)
+        lines.append(format_event(t_ns, event_type, table[name] if table else None, dx, dy,
+                                  timestamp_digits) + '\n')
+    return lines
+
+
+def generate_session(path, moves, mouse_rate=1000, seed=0, correction_rate=0.02, key_rate=2.0,
+                     click_rate=0.5, scroll_rate=0.5, timestamp_digits=9):
+    """
+    Write a synthetic session log to `path`. The same arguments always produce the same file.
+
+    Returns a dict with the number of lines, movements and injected corrections.
+    """
+    events, corrections = generate_events(moves, mouse_rate, seed, correction_rate, key_rate, click_rate,
+                                          scroll_rate)
+    n = len(events['t_ns'])
+    with open(path, 'w') as f:
+        f.write(f"--- Logging session started at {START_TEXT} ---\n")
+        for begin in range(0, n, WRITE_CHUNK):
+            f.writelines(format_events({column: values[begin:begin + WRITE_CHUNK]
+                                        for column, values in events.items()}, timestamp_digits))
+        end_ns = int(events['t_ns'][-1]) if n else START_NS
+        f.write(f"{format_timestamp(end_ns, timestamp_digits)} --- Logging session ended ---\n")
+    return {'lines': n + 2, 'moves': moves, 'corrections': corrections,
+            'seconds': (end_ns - START_NS) / 1e9}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('output', help="Log file to write")
+    parser.add_argument('--hours', type=float, default=None, help="Session length (overrides --moves)")
+    parser.add_argument('--moves', type=int, default=1_000_000)
+    parser.add_argument('--mouse-rate', type=float, default=1000, help="Raw mouse events per second")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--millisecond-timestamps', action='store_true',
+                        help="Write timestamps with 3 decimals like logs recorded before the session clock")
+    args = parser.parse_args()
+
+    moves = int(args.hours * 3600 * args.mouse_rate) if args.hours else args.moves
+    summary = generate_session(args.output, moves, mouse_rate=args.mouse_rate, seed=args.seed,
+                               timestamp_digits=3 if args.millisecond_timestamps else 9)
+    print(f"Wrote {args.output}: {summary['lines']:,} lines, {summary['moves']:,} moves, "
+          f"{summary['corrections']:,} center-return corrections, {summary['seconds'] / 3600:.2f} h")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""
+Benchmark suite covering capture, parse, clean and plot on deterministic
+synthetic sessions (see benchmarks.session_generator), at several sizes.
+
+Every stage is timed (best of --repeat runs) and, in a separate pass so
+tracing doesn't distort the timings, its peak Python/NumPy memory is
+measured with tracemalloc. Results can be written as JSON and compared
+with a previous run to catch regressions.
+
+Run from the repository root:
+    python -m benchmarks.suite --sizes 100000 1000000 --output baseline.json
+    python -m benchmarks.suite --sizes 100000 1000000 --compare baseline.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+from benchmarks.session_generator import generate_session
+from binary_log import EVENT_MOUSE_MOVE
+from clean_mouse_data import MouseMovement, clean_log_file, find_center_returns, parse_log_line
+from input_logger import InputLogger
+from log_cache import CACHE_DIR_NAME, clear_memo
+from log_writer import LogWriter
+import visualize_mouse_data
+
+
+class Stage:
+    """
+    One benchmarked operation.
+
+    setup(session) prepares whatever the operation needs (untimed) and returns
+    the callable to time; it is called again before every run. The callable
+    returns the number of items it processed.
+    """
+
+    def __init__(self, name, setup, unit):
+        self.name = name
+        self.setup = setup
+        self.unit = unit
+
+
+def _cache_dir(session):
+    return os.path.join(os.path.dirname(session['path']), CACHE_DIR_NAME)
+
+
+def setup_write_log(session):
+    path = os.path.join(os.path.dirname(session['path']), 'capture_log.txt')
+    if os.path.exists(path):
+        os.remove(path)
+    moves = [(t, dx, dy) for t, dx, dy in zip(session['t_ns'], session['dx'], session['dy'])]
+
+    def run():
+        # Blocking writer so every event is written instead of dropped under the flood
+        writer = LogWriter(path, block=True)
+        input_logger = InputLogger(writer)
+        for t_ns, dx, dy in moves:
+            input_logger.log_event(EVENT_MOUSE_MOVE, dx=dx, dy=dy, t_ns=t_ns)
+        writer.close()
+        return len(moves)
+    return run
+
+
+def setup_parse_log_line(session):
+    with open(session['path'], 'r') as f:
+        lines = f.readlines()
+
+    def run():
+        for line in lines:
+            parse_log_line(line)
+        return len(lines)
+    return run
+
+
+def setup_find_center_returns(session):
+    movements = [MouseMovement(t / 1e9, dx, dy, '', i)
+                 for i, (t, dx, dy) in enumerate(zip(session['t_ns'], session['dx'], session['dy']))]
+
+    def run():
+        find_center_returns(movements)
+        return len(movements)
+    return run
+
+
+def setup_clean_log_file(session):
+    def run():
+        clean_log_file(session['path'])
+        return session['lines']
+    return run
+
+
+def setup_parse_log_file_cold(session):
+    clear_memo()
+    shutil.rmtree(_cache_dir(session), ignore_errors=True)
+
+    def run():
+        return len(visualize_mouse_data.parse_log_file(session['path'])[0])
+    return run
+
+
+def setup_parse_log_file_cached(session):
+    visualize_mouse_data.parse_log_file(session['path'])
+    clear_memo()
+
+    def run():
+        return len(visualize_mouse_data.parse_log_file(session['path'])[0])
+    return run
+
+
+def setup_plot(session):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    clear_memo()
+    shutil.rmtree(_cache_dir(session), ignore_errors=True)
+
+    def run():
+        # Whole session in one window, as plot_time_window draws it
+        index = visualize_mouse_data.load_index(session['path'])
+        lod = visualize_mouse_data.load_lod(session['path'], index=index)
+        duration = (index.last_t_ns - index.first_t_ns) / 1e9
+        t, x, y = visualize_mouse_data.load_time_window(session['path'], index, 0, duration, lod)
+        count, distance = visualize_mouse_data.window_stats(index, lod, 0, duration)
+        fig, (ax1, ax2, ax3) = plt.subplots(1, 3, figsize=(15, 5))
+        ax1.plot(x, y, 'b-', linewidth=1)
+        ax2.plot(t, x, 'b-', linewidth=1)
+        ax3.plot(t, y, 'b-', linewidth=1)
+        fig.savefig(io.BytesIO(), format='png', dpi=100)
+        plt.close(fig)
+        return count
+    return run
+
+
+STAGES = [
+    Stage('capture.write_log', setup_write_log, 'events'),
+    Stage('clean.parse_log_line', setup_parse_log_line, 'lines'),
+    Stage('clean.find_center_returns', setup_find_center_returns, 'moves'),
+    Stage('clean.clean_log_file', setup_clean_log_file, 'lines'),
+    Stage('plot.parse_log_file_cold', setup_parse_log_file_cold, 'moves'),
+    Stage('plot.parse_log_file_cached', setup_parse_log_file_cached, 'moves'),
+    Stage('plot.render_full_window', setup_plot, 'moves'),
+]
+
+
+def make_session(folder, moves, seed=0):
+    """Generate a session log and keep its movement columns for the in-memory stages."""
+    path = os.path.join(folder, 'session_log.txt')
+    summary = generate_session(path, moves, seed=seed)
+    t_ns, cum_x, cum_y = visualize_mouse_data.load_log(path).mouse_positions()
+    clear_memo()
+    shutil.rmtree(os.path.join(folder, CACHE_DIR_NAME), ignore_errors=True)
+    return {
+        'path': path,
+        'lines': summary['lines'],
+        'bytes': os.path.getsize(path),
+        't_ns': t_ns.tolist(),
+        'dx': np.diff(cum_x, prepend=0).tolist(),
+        'dy': np.diff(cum_y, prepend=0).tolist(),
+    }
+
+
+def run_stage(stage, session, repeat, memory):
+    best = None
+    for _ in range(repeat):
+        run = stage.setup(session)
+        start = time.perf_counter()
+        items = run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    peak = None
+    if memory:
+        run = stage.setup(session)
+        tracemalloc.start()
+        try:
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return {
+        'stage': stage.name,
+        'size': None,
+        'items': items,
+        'unit': stage.unit,
+        'seconds': best,
+        'items_per_s': items / best if best else None,
+        'peak_mb': peak / 1e6 if peak is not None else None,
+    }
+
+
+def metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit or None,
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def compare(results, baseline_path, threshold):
+    """Print the time ratio of every stage against a baseline run. Returns the number of regressions."""
+    with open(baseline_path, 'r') as f:
+        baseline = {(r['stage'], r['size']): r for r in json.load(f)['results']}
+    regressions = 0
+    print(f"\nCompared with {baseline_path} (regression threshold +{threshold:.0%}):")
+    for result in results:
+        before = baseline.get((result['stage'], result['size']))
+        if before is None:
+            print(f"  {result['stage']:30} {result['size']:>11,}: not in baseline")
+            continue
+        ratio = result['seconds'] / before['seconds']
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        elif ratio < 1 - threshold:
+            flag = '  faster'
+        memory = ''
+        if result['peak_mb'] is not None and before.get('peak_mb'):
+            memory = f", peak memory {result['peak_mb'] / before['peak_mb']:.2f}x"
+        print(f"  {result['stage']:30} {result['size']:>11,}: {before['seconds']:8.3f} s -> "
+              f"{result['seconds']:8.3f} s ({ratio:.2f}x){memory}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000],
+                        help="Session sizes in raw mouse movements")
+    parser.add_argument('--stages', nargs='+', default=None, help="Only run stages whose name contains one of these")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per stage (the fastest is reported)")
+    parser.add_argument('--no-memory', action='store_true', help="Skip the peak memory pass")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    parser.add_argument('--compare', help="JSON results of a previous run to compare against")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="Relative slowdown reported as a regression (default 0.10)")
+    args = parser.parse_args()
+
+    stages = [stage for stage in STAGES if not args.stages or any(key in stage.name for key in args.stages)]
+    results = []
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as folder:
+            session = make_session(folder, size, args.seed)
+            print(f"Session with {size:,} moves: {session['lines']:,} lines, {session['bytes'] / 1e6:.1f} MB")
+            for stage in stages:
+                result = run_stage(stage, session, args.repeat, not args.no_memory)
+                result['size'] = size
+                results.append(result)
+                memory = f", peak {result['peak_mb']:8.1f} MB" if result['peak_mb'] is not None else ''
+                print(f"  {stage.name:30} {result['seconds']:8.3f} s  "
+                      f"{result['items_per_s']:>12,.0f} {stage.unit}/s{memory}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'meta': metadata(), 'results': results}, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,388 @@
+"""
+Compact binary session log format.
+
+A binary log is a fixed 32-byte header, a flat array of fixed-width records
+and a trailing JSON string table:
+
+    header:  magic, version, record size, record count, string table offset
+    records: RECORD_DTYPE (24 bytes each)
+    table:   JSON list of key/button names and verbatim message lines
+
+`code` indexes the string table: it holds the key or button name for
+key/button events, the hexadecimal state of key state checkpoints and the
+whole original line for messages (session
+markers, errors, anything that is not a plain input event). Converting a
+text log to binary and back reproduces it line for line.
+
+The string table is only written when the log is closed. With 'group' or
+'strict' durability the writer also appends every new string to a name
+journal next to the log (`_log.bin.names`, one JSON string per line) and
+syncs it before the records that use it, so a log cut short by a crash can
+still be decoded; the journal is removed once the table is on disk.
+
+Records are not framed (a checksum per batch would break the flat array that
+readers memory-map). Instead, the records at the end of an unfinished log
+that the writer cannot have produced (unknown type, non-zero padding, a
+delta on an event without one, a time that is not positive or goes back
+more than MAX_EVENT_DELAY_NS) are taken for a torn tail: readers ignore them
+and log_frames.recover() truncates them.
+
+Usage:
+    python binary_log.py logs/2024-03-21 14-30-45_log.txt   # -> _log.bin
+    python binary_log.py logs/2024-03-21 14-30-45_log.bin   # -> _log.txt
+"""
+import json
+import os
+import re
+import struct
+import sys
+from collections import namedtuple
+
+import numpy as np
+
+from log_frames import open_log
+from log_parser import timestamp_to_ns
+from log_writer import DURABILITY_BUFFERED, LogWriter
+
+MAGIC = b'GDCLOG\x00\x01'
+VERSION = 1
+HEADER = struct.Struct('<8sHHIQQ')  # magic, version, record_size, reserved, n_records, table_offset
+# Appended to the log path for the name journal of an unfinished log
+JOURNAL_SUFFIX = '.names'
+
+# Event types stored in the `type` field
+EVENT_MESSAGE = 0
+EVENT_KEY_PRESS = 1
+EVENT_KEY_RELEASE = 2
+EVENT_MOUSE_MOVE = 3
+EVENT_BUTTON_PRESS = 4
+EVENT_BUTTON_RELEASE = 5
+EVENT_SCROLL = 6
+EVENT_KEY_STATE = 7
+
+RECORD_DTYPE = np.dtype({
+    'names': ['t_ns', 'code', 'dx', 'dy', 'type'],
+    'formats': ['<i8', '<u4', '<i4', '<i4', 'u1'],
+    'offsets': [0, 8, 12, 16, 20],
+    'itemsize': 24,
+})
+
+# Text prefixes written by combined_logger for each event type
+EVENT_PREFIXES = {
+    EVENT_KEY_PRESS: 'PRESSED : ',
+    EVENT_KEY_RELEASE: 'RELEASED: ',
+    EVENT_MOUSE_MOVE: 'MOUSE MOVED: ',
+    EVENT_BUTTON_PRESS: 'MOUSE PRESSED : ',
+    EVENT_BUTTON_RELEASE: 'MOUSE RELEASED: ',
+    EVENT_SCROLL: 'MOUSE SCROLLED: ',
+    EVENT_KEY_STATE: 'KEY STATE: ',
+}
+DELTA_EVENTS = (EVENT_MOUSE_MOVE, EVENT_SCROLL)
+# Latest an event is written after later ones: aggregated mouse movements are logged up to two
+# bins (MOUSE_AGGREGATION in combined_logger) plus the writer's flush interval late
+MAX_EVENT_DELAY_NS = 1_000_000_000
+
+_EVENT_RE = re.compile(
+    r'(\d+)\.(\d+) - '
+    r'(PRESSED : |RELEASED: |MOUSE MOVED: |MOUSE PRESSED : |MOUSE RELEASED: |MOUSE SCROLLED: |KEY STATE: )(.*)$',
+    re.DOTALL)
+_DELTA_RE = re.compile(r'(-?\d+), (-?\d+)$')
+_TIMESTAMP_RE = re.compile(r'(\d+)\.(\d+)')
+_PREFIX_TYPES = {prefix: event_type for event_type, prefix in EVENT_PREFIXES.items()}
+
+
+def format_timestamp(t_ns, digits=9):
+    """
+    Format an integer nanosecond timestamp as seconds with `digits` decimals: 9
+    as combined_logger writes them, 3 for the millisecond format of older logs.
+    """
+    return f"{t_ns // 1_000_000_000}.{t_ns % 1_000_000_000 // 10 ** (9 - digits):0{digits}d}"
+
+
+def format_event(t_ns, event_type, name=None, dx=0, dy=0, digits=9):
+    """Format one input event as a text log line (without the newline)."""
+    prefix = EVENT_PREFIXES[event_type]
+    if event_type in DELTA_EVENTS:
+        return f"{format_timestamp(t_ns, digits)} - {prefix}{dx}, {dy}"
+    return f"{format_timestamp(t_ns, digits)} - {prefix}{name}"
+
+
+class Event(namedtuple('Event', ['t_ns', 'event_type', 'name', 'dx', 'dy'])):
+    """
+    One input event as queued by the input logger. str() formats it as a text
+    log line, so a LogWriter formats it on its own thread; BinaryLogWriter
+    stores it without any formatting.
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        return format_event(*self)
+
+
+def parse_text_line(line, last_t_ns=0):
+    """
+    Parse a text log line into (t_ns, event_type, name, dx, dy).
+
+    Lines that are not input events become EVENT_MESSAGE with the whole line
+    as name and their own timestamp if they start with one, otherwise
+    `last_t_ns` so records stay in time order.
+    """
+    line = line.rstrip('\n')
+    match = _EVENT_RE.match(line)
+    if match:
+        t_ns = timestamp_to_ns(match.group(1), match.group(2))
+        event_type = _PREFIX_TYPES[match.group(3)]
+        rest = match.group(4)
+        if event_type not in DELTA_EVENTS:
+            return t_ns, event_type, rest, 0, 0
+        delta = _DELTA_RE.match(rest)
+        if delta:
+            return t_ns, event_type, None, int(delta.group(1)), int(delta.group(2))
+
+    timestamp = _TIMESTAMP_RE.match(line)
+    if timestamp:
+        last_t_ns = timestamp_to_ns(timestamp.group(1), timestamp.group(2))
+    return last_t_ns, EVENT_MESSAGE, line, 0, 0
+
+
+class StringTable:
+    """Interning table mapping names/messages to record codes."""
+
+    def __init__(self):
+        self.strings = []
+        self._codes = {}
+
+    def code(self, name):
+        name = str(name)
+        code = self._codes.get(name)
+        if code is None:
+            code = len(self.strings)
+            self.strings.append(name)
+            self._codes[name] = code
+        return code
+
+
+def encode_records(events, table):
+    """Pack a list of (t_ns, event_type, name, dx, dy) tuples into record bytes."""
+    records = np.zeros(len(events), dtype=RECORD_DTYPE)
+    if events:
+        t_ns, event_types, names, dx, dy = zip(*events)
+        records['t_ns'] = t_ns
+        records['type'] = event_types
+        records['code'] = [0 if name is None else table.code(name) for name in names]
+        records['dx'] = dx
+        records['dy'] = dy
+    return records.tobytes()
+
+
+def _write_header(f, n_records, table_offset):
+    f.seek(0)
+    f.write(HEADER.pack(MAGIC, VERSION, RECORD_DTYPE.itemsize, 0, n_records, table_offset))
+
+
+def journal_path(path):
+    """Name journal of a binary log."""
+    return path + JOURNAL_SUFFIX
+
+
+def read_journal(path):
+    """String table of an unfinished binary log from its name journal ([] if there is none)."""
+    names = []
+    try:
+        with open(journal_path(path), 'rb') as f:
+            for line in f:
+                try:
+                    names.append(json.loads(line))
+                except ValueError:
+                    # Torn last line
+                    break
+    except FileNotFoundError:
+        pass
+    return names
+
+
+class BinaryLogWriter(LogWriter):
+    """
+    LogWriter producing the binary format.
+
+    `write()` accepts either Events or (t_ns, event_type, name, dx, dy) tuples,
+    which skip text formatting entirely, or plain text lines, which are
+    parsed on the writer thread. The record count and string table are
+    written on close; a file that was never closed is still readable
+    (the count is then derived from the file size). Unless durability is
+    buffered, new strings also go to the name journal, which is synced
+    before the log, so the records on disk can always be decoded.
+    """
+    _journal = None
+
+    def __init__(self, path, framed=False, **kwargs):
+        if framed:
+            raise ValueError("Binary logs cannot be framed; framing applies to text logs")
+        super().__init__(path, **kwargs)
+
+    def _open(self):
+        self._table = StringTable()
+        self._n_records = 0
+        self._last_t_ns = 0
+        f = open(self.path, 'wb')
+        _write_header(f, 0, 0)
+        if self.durability != DURABILITY_BUFFERED:
+            self._journal = open(journal_path(self.path), 'wb')
+            self._journaled = 0
+        return f
+
+    def _encode(self, batch):
+        events = []
+        for item in batch:
+            if isinstance(item, str):
+                item = parse_text_line(item, self._last_t_ns)
+            self._last_t_ns = item[0]
+            events.append(item)
+        self._n_records += len(events)
+        data = encode_records(events, self._table)
+        if self._journal is not None and self._journaled < len(self._table.strings):
+            # Written (and flushed) before the records that use the new codes
+            self._journal.write(b''.join(json.dumps(name).encode('utf-8') + b'\n'
+                                         for name in self._table.strings[self._journaled:]))
+            self._journal.flush()
+            self._journaled = len(self._table.strings)
+        return data
+
+    def _sync(self):
+        if self._journal is not None:
+            try:
+                os.fsync(self._journal.fileno())
+            except Exception as e:
+                print(f"Error syncing name journal: {e}")
+        super()._sync()
+
+    def _finish(self):
+        table_offset = self._file.tell()
+        self._file.write(json.dumps(self._table.strings).encode('utf-8'))
+        _write_header(self._file, self._n_records, table_offset)
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+            # The journal is only dropped once the table that replaces it is on disk
+            try:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                os.remove(journal_path(self.path))
+            except OSError as e:
+                print(f"Error removing name journal: {e}")
+
+
+def intact_records(records):
+    """
+    Number of records of an unfinished log before its torn tail: the trailing records the
+    writer cannot have produced are not counted (see the module docstring).
+    """
+    if len(records) == 0:
+        return 0
+    records = np.asarray(records)
+    t_ns = records['t_ns']
+    types = records['type']
+    padding = records.view(np.uint8).reshape(len(records), RECORD_DTYPE.itemsize)[:, 21:]
+    # Latest time before every record (0 before the first timestamp: session markers have none)
+    latest = np.maximum.accumulate(np.concatenate(([0], t_ns[:-1])))
+    valid = ((types <= EVENT_KEY_STATE) & ~padding.any(axis=1)
+             & (np.isin(types, DELTA_EVENTS) | ((records['dx'] == 0) & (records['dy'] == 0)))
+             & ((t_ns > 0) | ((t_ns == 0) & (latest == 0))) & (t_ns >= latest - MAX_EVENT_DELAY_NS))
+    intact = np.flatnonzero(valid)
+    return int(intact[-1]) + 1 if len(intact) else 0
+
+
+def read_binary_log(path):
+    """
+    Memory-map a binary log.
+
+    Returns (records, names) where records is a read-only np.memmap with
+    RECORD_DTYPE and names is the string table indexed by `records['code']`
+    (read from the name journal if the log was never closed).
+    """
+    with open(path, 'rb') as f:
+        magic, version, record_size, _, n_records, table_offset = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"Not a binary session log: {path}")
+        if record_size != RECORD_DTYPE.itemsize:
+            raise ValueError(f"Unsupported record size {record_size} in {path}")
+        if table_offset:
+            f.seek(table_offset)
+            names = json.loads(f.read().decode('utf-8'))
+        else:
+            # Writer did not finish: the string table is only in its name journal, count from file size
+            n_records = (os.path.getsize(path) - HEADER.size) // record_size
+            names = read_journal(path)
+
+    if n_records == 0:
+        return np.zeros(0, dtype=RECORD_DTYPE), names
+    records = np.memmap(path, dtype=RECORD_DTYPE, mode='r', offset=HEADER.size, shape=(n_records,))
+    if not table_offset:
+        records = records[:intact_records(records)]
+    return records, names
+
+
+def text_to_binary(text_path, binary_path=None):
+    """Convert a text `_log.txt` file to the binary format. Returns the output path."""
+    if binary_path is None:
+        binary_path = os.path.splitext(text_path)[0] + '.bin'
+    table = StringTable()
+    n_records = 0
+    last_t_ns = 0
+    with open_log(text_path, 'r') as src, open(binary_path, 'wb') as dst:
+        _write_header(dst, 0, 0)
+        chunk = []
+        for line in src:
+            event = parse_text_line(line, last_t_ns)
+            last_t_ns = event[0]
+            chunk.append(event)
+            if len(chunk) >= 65536:
+                dst.write(encode_records(chunk, table))
+                n_records += len(chunk)
+                chunk = []
+        dst.write(encode_records(chunk, table))
+        n_records += len(chunk)
+        table_offset = dst.tell()
+        dst.write(json.dumps(table.strings).encode('utf-8'))
+        _write_header(dst, n_records, table_offset)
+    return binary_path
+
+
+def binary_to_text(binary_path, text_path=None):
+    """
+    Convert a binary log back to the text format. Returns the output path.
+
+    Logs whose events all fall on whole milliseconds were recorded (or
+    converted from text) with the older millisecond timestamps and are
+    written back in that format.
+    """
+    if text_path is None:
+        text_path = os.path.splitext(binary_path)[0] + '.txt'
+    records, names = read_binary_log(binary_path)
+    events = records['t_ns'][records['type'] != EVENT_MESSAGE]
+    digits = 3 if np.all(events % 1_000_000 == 0) else 9
+    with open(text_path, 'w') as f:
+        for t_ns, code, dx, dy, event_type in records.tolist():
+            # An unfinished log without a name journal has no string table; keep the codes visible
+            name = names[code] if code < len(names) else f"<string {code}>"
+            if event_type == EVENT_MESSAGE:
+                f.write(name + '\n')
+            else:
+                f.write(format_event(t_ns, event_type, name, dx, dy, digits) + '\n')
+    return text_path
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python binary_log.py <log file> [...]")
+        return
+    for path in sys.argv[1:]:
+        if path.endswith('.bin'):
+            output_file = binary_to_text(path)
+        else:
+            output_file = text_to_binary(path)
+        print(f"Created: {output_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,24 @@
 import os
-import re
+import math
+import json
+import time
+import argparse
 import numpy as np
 from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
+from log_frames import FrameWriter, log_compression, open_log
+from log_parser import MOVE_LINE_RE
+from log_segments import (cleaned_manifest_path, list_sessions, load_manifest as load_session_manifest,
+                          segment_files, write_manifest)
+
+# Name of the file in the logs directory recording what has already been cleaned
+MANIFEST_NAME = ".clean_manifest.json"
 
 def parse_log_line(line):
     """Parse a log line and return timestamp and movement data if it's a mouse movement."""
     # Match timestamp and mouse movement data
-    match = re.match(r'(\d+\.\d+) - MOUSE MOVED: (-?\d+), (-?\d+)', line)
+    match = MOVE_LINE_RE.match(line)
     if match:
         timestamp = float(match.group(1))
         dx = int(match.group(2))
@@ -25,6 +36,66 @@ class MouseMovement:
         self.cumulative_x = 0  # Will be set later
         self.cumulative_y = 0  # Will be set later
 
+def find_center_return_mask(timestamps, dx, dy, window_size=20, time_threshold=0.05, position_threshold=2):
+    """
+    Vectorized find_center_returns working on arrays.
+    
+    For every start index i the first j in the window whose cumulative position is
+    within position_threshold of i (and within time_threshold seconds) is found with
+    one array comparison per window offset. The greedy skip over the matches is then
+    walked from match to match only, so runs without corrections cost nothing.
+    
+    Args:
+        timestamps: Array of movement timestamps (seconds)
+        dx, dy: Arrays of raw movement deltas
+        window_size, time_threshold, position_threshold: As in find_center_returns
+    
+    Returns:
+        Boolean array, True for movements to remove
+    """
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    n = len(timestamps)
+    remove = np.zeros(n, dtype=bool)
+    if n < 2:
+        return remove
+
+    cum_x = np.cumsum(dx, dtype=np.int64)
+    cum_y = np.cumsum(dy, dtype=np.int64)
+
+    # first_match[i] = smallest offset j (1 <= j < window_size, i + j < n) returning to
+    # the start of window i, or 0 if the window has none. Offsets are visited from the
+    # largest down so the smallest one is written last.
+    first_match = np.zeros(n, dtype=np.int64)
+    for j in range(min(window_size, n) - 1, 0, -1):
+        dist_from_start = np.sqrt((cum_x[j:] - cum_x[:-j]) ** 2 + (cum_y[j:] - cum_y[:-j]) ** 2)
+        hit = (dist_from_start <= position_threshold) & (timestamps[j:] - timestamps[:-j] <= time_threshold)
+        first_match[:n - j][hit] = j
+
+    # next_match[i] = first index >= i that has a match (n if none)
+    has_match = first_match > 0
+    next_match = np.where(has_match, np.arange(n), n)
+    next_match = np.minimum.accumulate(next_match[::-1])[::-1]
+
+    # Greedy walk: a match at i removes i+1..i+j and resumes at i+j+1
+    starts = []
+    ends = []
+    i = 0
+    while i < n - 1:
+        i = int(next_match[i])
+        if i >= n - 1:
+            break
+        j = int(first_match[i])
+        starts.append(i + 1)
+        ends.append(i + j + 1)
+        i = i + j + 1
+
+    if starts:
+        delta = np.zeros(n + 1, dtype=np.int64)
+        np.add.at(delta, starts, 1)
+        np.add.at(delta, ends, -1)
+        remove = np.cumsum(delta[:n]) > 0
+    return remove
+
 def find_center_returns(movements, window_size=20, time_threshold=0.05, position_threshold=2):
     """
     Find sequences of movements that return to a center point.
@@ -38,110 +109,366 @@ def find_center_returns(movements, window_size=20, time_threshold=0.05, position
     if len(movements) < 2:
         return set()
 
+    timestamps = np.fromiter((m.timestamp for m in movements), dtype=np.float64, count=len(movements))
+    dx = np.fromiter((m.dx for m in movements), dtype=np.int64, count=len(movements))
+    dy = np.fromiter((m.dy for m in movements), dtype=np.int64, count=len(movements))
+
     # Calculate cumulative positions
-    cum_x = 0
-    cum_y = 0
-    for m in movements:
-        cum_x += m.dx
-        cum_y += m.dy
+    for m, cum_x, cum_y in zip(movements, np.cumsum(dx).tolist(), np.cumsum(dy).tolist()):
         m.cumulative_x = cum_x
         m.cumulative_y = cum_y
 
-    movements_to_remove = set()
-    i = 0
+    remove = find_center_return_mask(timestamps, dx, dy, window_size, time_threshold, position_threshold)
+    return set(np.flatnonzero(remove).tolist())
+
+class CenterReturnFilter:
+    """
+    Incremental version of find_center_returns with a bounded lookahead.
     
-    while i < len(movements) - 1:
-        # Look for potential center returns in a sliding window
-        window = movements[i:min(i + window_size, len(movements))]
-        if len(window) < 2:
-            break
-            
-        # Check if this window contains a return to center
-        start_x = window[0].cumulative_x
-        start_y = window[0].cumulative_y
-        start_time = window[0].timestamp
-        
-        # Find any points in the window that return close to the starting position
-        for j in range(1, len(window)):
-            end_x = window[j].cumulative_x
-            end_y = window[j].cumulative_y
-            end_time = window[j].timestamp
-            
-            # Check if position is close to start position
-            dist_from_start = np.sqrt((end_x - start_x)**2 + (end_y - start_y)**2)
-            time_diff = end_time - start_time
-            
-            if dist_from_start <= position_threshold and time_diff <= time_threshold:
-                # This sequence returns to center quickly - mark all movements in between for removal
-                for k in range(i + 1, i + j + 1):
-                    movements_to_remove.add(k)
-                i = i + j  # Skip the processed movements
-                break
-        i += 1
-    
-    return movements_to_remove
-
-def clean_log_file(input_file):
-    """Clean a log file by removing game-induced counter-movements."""
-    # Create output filename in the same directory as input
-    input_dir = os.path.dirname(input_file)
-    base_name = os.path.basename(input_file)
-    base, ext = os.path.splitext(base_name)
-    output_file = os.path.join(input_dir, f"{base}_cleaned{ext}")
+    Movements and other log lines are pushed in file order; decided lines come back
+    out in the same order with removed movements left out. Only the current window
+    (window_size movements and the lines between them) is held in memory, and the
+    removals are exactly those of find_center_returns with the same parameters.
+    """
+    
+    def __init__(self, window_size=20, time_threshold=0.05, position_threshold=2):
+        self.window_size = window_size
+        self.time_threshold = time_threshold
+        self.position_threshold = position_threshold
+        self.cumulative_x = 0
+        self.cumulative_y = 0
+        self.moves_seen = 0
+        self.moves_removed = 0
+        # Summed deltas of the removed movements
+        self.removed_x = 0
+        self.removed_y = 0
+        # Pending entries in file order: [payload, is_movement, timestamp, cum_x, cum_y, removed]
+        self._pending = deque()
+        # Pending movement entries; _window[0] is the current window start (always kept)
+        self._window = deque()
     
-    # Read all lines
-    with open(input_file, 'r') as f:
-        lines = f.readlines()
+    def push_movement(self, timestamp, dx, dy, payload):
+        """Add a movement. Returns the list of payloads that are now decided and kept."""
+        self.cumulative_x += dx
+        self.cumulative_y += dy
+        entry = [payload, True, timestamp, self.cumulative_x, self.cumulative_y, False]
+        self.moves_seen += 1
+        self._pending.append(entry)
+        self._window.append(entry)
+        while len(self._window) >= self.window_size and len(self._window) >= 2:
+            self._advance()
+        return self._drain()
     
-    # Process lines and identify movements
-    movements = []
-    non_movement_lines = []
+    def push_line(self, payload):
+        """Add a non-movement line. Returns the list of payloads that are now decided."""
+        self._pending.append([payload, False])
+        return self._drain()
     
-    for i, line in enumerate(lines):
+    def finish(self):
+        """Decide the remaining (shorter) windows at end of input and return the rest."""
+        while len(self._window) >= 2:
+            self._advance()
+        return self._drain()
+    
+    def expire(self, timestamp):
+        """
+        Decide the windows starting more than time_threshold before `timestamp`, given that
+        no movement pushed later is earlier than it: none of those can match a later
+        movement, so they are decided like at the end of input. Returns the decided payloads.
+        """
+        while len(self._window) >= 2 and timestamp - self._window[0][2] > self.time_threshold:
+            self._advance()
+        return self._drain()
+    
+    @property
+    def pending(self):
+        """Number of pushed entries not decided yet."""
+        return len(self._pending)
+    
+    def _advance(self):
+        # Evaluate the window starting at _window[0], exactly like find_center_returns
+        window = self._window
+        start = window[0]
+        start_x, start_y, start_time = start[3], start[4], start[2]
+        for j in range(1, min(self.window_size, len(window))):
+            end = window[j]
+            dist_from_start = math.sqrt((end[3] - start_x)**2 + (end[4] - start_y)**2)
+            if dist_from_start <= self.position_threshold and end[2] - start_time <= self.time_threshold:
+                # Remove the movements in between and continue after the return point
+                window.popleft()
+                for _ in range(j):
+                    window.popleft()[5] = True
+                self.moves_removed += j
+                self.removed_x += end[3] - start_x
+                self.removed_y += end[4] - start_y
+                return
+        window.popleft()
+    
+    def _drain(self):
+        # Everything before the second movement of the window is decided
+        stop = self._window[1] if len(self._window) > 1 else None
+        pending = self._pending
+        decided = []
+        while pending and pending[0] is not stop:
+            entry = pending.popleft()
+            if not entry[1] or not entry[5]:
+                decided.append(entry[0])
+        return decided
+
+def clean_lines(lines, window_size=20, time_threshold=0.05, position_threshold=2, center_filter=None):
+    """Generator yielding the lines of a log with game-induced counter-movements removed."""
+    if center_filter is None:
+        center_filter = CenterReturnFilter(window_size, time_threshold, position_threshold)
+    for line in lines:
         parsed = parse_log_line(line)
         if parsed:
             timestamp, dx, dy = parsed
-            movements.append(MouseMovement(timestamp, dx, dy, line, i))
+            yield from center_filter.push_movement(timestamp, dx, dy, line)
         else:
-            non_movement_lines.append((i, line))
-    
-    # Find movements to remove
-    indices_to_remove = find_center_returns(movements)
+            yield from center_filter.push_line(line)
+    yield from center_filter.finish()
+
+def cleaned_path(input_file):
+    """Output path for the cleaned version of a log file."""
+    # Create output filename in the same directory as input
+    input_dir = os.path.dirname(input_file)
+    base_name = os.path.basename(input_file)
+    base, ext = os.path.splitext(base_name)
+    return os.path.join(input_dir, f"{base}_cleaned{ext}")
+
+def write_atomically(output_file, lines, compression=None):
+    """
+    Write lines to a temporary file next to output_file and rename it into place.
+    With compression, a (codec, level) pair, the file is written as a compressed log.
+    """
+    tmp_file = f"{output_file}.tmp"
+    try:
+        with (FrameWriter(tmp_file, *compression, mode='wb') if compression else open(tmp_file, 'w')) as f:
+            f.writelines(lines)
+        os.replace(tmp_file, output_file)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+def clean_log_file(input_file, window_size=20, time_threshold=0.05, position_threshold=2):
+    """
+    Clean a log file by removing game-induced counter-movements.
     
-    # Write cleaned data
-    with open(output_file, 'w') as f:
-        current_movement = 0
-        for i, line in enumerate(lines):
-            if current_movement < len(movements) and i == movements[current_movement].line_number:
-                if current_movement not in indices_to_remove:
-                    f.write(line)
-                current_movement += 1
-            else:
-                # Write non-movement lines
-                f.write(line)
+    The file is streamed: lines are read, decided and written incrementally, so memory
+    use depends on window_size and not on the length of the log. The output only
+    appears under its final name once it is complete.
+    """
+    return clean_log_file_with_stats(input_file, window_size, time_threshold, position_threshold)['output_file']
+
+def clean_log_file_with_stats(input_file, window_size=20, time_threshold=0.05, position_threshold=2):
+    """Like clean_log_file, but return a dict with the output path and movement counts."""
+    output_file = cleaned_path(input_file)
+    center_filter = CenterReturnFilter(window_size, time_threshold, position_threshold)
+    with open_log(input_file, 'r') as src:
+        # Cleaned copies of compressed logs are compressed the same way
+        write_atomically(output_file, clean_lines(src, center_filter=center_filter), log_compression(input_file))
+    return {
+        'output_file': output_file,
+        'moves': center_filter.moves_seen,
+        'removed': center_filter.moves_removed,
+        # Summed deltas of the kept movements
+        'dx': center_filter.cumulative_x - center_filter.removed_x,
+        'dy': center_filter.cumulative_y - center_filter.removed_y,
+    }
+
+def record_cleaned_files(logs_dir, results, params):
+    """
+    Add logs cleaned outside of clean_logs (while logging, see live_cleaning.py) to the manifest,
+    so that clean_logs skips them while they are unchanged. `results` are dicts like the ones of
+    clean_log_file_with_stats, with the path of the cleaned log as 'input_file'.
+    Returns the updated manifest.
+    """
+    manifest = load_manifest(logs_dir)
+    for result in results:
+        stat = os.stat(result['input_file'])
+        manifest[os.path.basename(result['input_file'])] = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'params': params,
+            'output': os.path.basename(result['output_file']),
+            'moves': result['moves'],
+            'removed': result['removed'],
+            'dx': result['dx'],
+            'dy': result['dy'],
+        }
+    save_manifest(logs_dir, manifest)
+    return manifest
+
+def list_log_files(logs_dir):
+    """Original (not cleaned) log files in logs_dir."""
+    return sorted(f for f in os.listdir(logs_dir)
+                  if f.endswith('_log.txt') and not f.endswith('_cleaned_log.txt'))
+
+def list_session_segments(logs_dir):
+    """(manifest, complete segment files) of every segmented text session in logs_dir."""
+    sessions = []
+    for manifest_file in list_sessions(logs_dir):
+        try:
+            session = load_session_manifest(manifest_file)
+            if session['format'] == 'text':
+                sessions.append((manifest_file, segment_files(manifest_file, session, complete_only=True)))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error reading session manifest {os.path.basename(manifest_file)}: {e}")
+    return sessions
+
+def write_cleaned_session(manifest_file, manifest):
+    """
+    Write the manifest of the cleaned segments of a session: the leading segments that have
+    been cleaned, with their movement counts and totals (and so start positions) after cleaning.
+    """
+    session = load_session_manifest(manifest_file)
+    segments = []
+    start_x = start_y = 0
+    for segment in session['segments']:
+        entry = manifest.get(segment['file'])
+        if not segment['complete'] or entry is None or 'dx' not in entry:
+            break
+        segments.append(dict(segment, file=entry['output'], moves=entry['moves'] - entry['removed'],
+                             dx=entry['dx'], dy=entry['dy'], start_x=start_x, start_y=start_y))
+        start_x += entry['dx']
+        start_y += entry['dy']
+    session['complete'] = session['complete'] and len(segments) == len(session['segments'])
+    session['segments'] = segments
+    write_manifest(cleaned_manifest_path(manifest_file), session)
+
+def load_manifest(logs_dir):
+    try:
+        with open(os.path.join(logs_dir, MANIFEST_NAME), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(logs_dir, manifest):
+    write_atomically(os.path.join(logs_dir, MANIFEST_NAME), [json.dumps(manifest, indent=1, sort_keys=True)])
+
+def is_up_to_date(entry, stat, params, output_file):
+    """True if the manifest entry matches the current input file and cleaner parameters."""
+    return (entry is not None
+            and entry.get('size') == stat.st_size
+            and entry.get('mtime_ns') == stat.st_mtime_ns
+            and entry.get('params') == params
+            and os.path.exists(output_file))
+
+def clean_logs(logs_dir, workers=None, force=False, window_size=20, time_threshold=0.05, position_threshold=2):
+    """
+    Clean every log in logs_dir on a process pool, skipping files whose size, mtime and
+    cleaner parameters match the manifest from a previous run.
+
+    The complete segments of segmented sessions are cleaned like separate logs, in
+    parallel, and each session gets a manifest of its cleaned segments. A correction
+    spanning a segment boundary (at most one window of movements) is not removed.
     
-    return output_file
+    Returns a summary dict with file, byte and movement counts and the elapsed time.
+    """
+    params = {'window_size': window_size, 'time_threshold': time_threshold,
+              'position_threshold': position_threshold}
+    manifest = load_manifest(logs_dir)
+
+    sessions = list_session_segments(logs_dir)
+    log_paths = [os.path.join(logs_dir, log_file) for log_file in list_log_files(logs_dir)]
+    log_paths += [segment for _, segments in sessions for segment in segments]
+
+    pending = []
+    skipped = 0
+    for full_path in log_paths:
+        log_file = os.path.basename(full_path)
+        stat = os.stat(full_path)
+        if not force and is_up_to_date(manifest.get(log_file), stat, params, cleaned_path(full_path)):
+            skipped += 1
+            continue
+        pending.append((log_file, full_path, stat))
+
+    summary = {'files': len(pending), 'skipped': skipped, 'failed': 0, 'bytes': 0,
+               'moves': 0, 'removed': 0, 'elapsed': 0.0}
+    if not pending:
+        write_cleaned_sessions(sessions, manifest)
+        return summary
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(clean_log_file_with_stats, full_path, **params): (log_file, stat)
+                   for log_file, full_path, stat in pending}
+        for future in as_completed(futures):
+            log_file, stat = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                summary['failed'] += 1
+                print(f"Error cleaning {log_file}: {e}")
+                continue
+            print(f"Created cleaned file: {os.path.basename(result['output_file'])} "
+                  f"({result['removed']} of {result['moves']} movements removed)")
+            summary['bytes'] += stat.st_size
+            summary['moves'] += result['moves']
+            summary['removed'] += result['removed']
+            manifest[log_file] = {
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'params': params,
+                'output': os.path.basename(result['output_file']),
+                'moves': result['moves'],
+                'removed': result['removed'],
+                'dx': result['dx'],
+                'dy': result['dy'],
+            }
+            # Save after every file so an interrupted run keeps its progress
+            save_manifest(logs_dir, manifest)
+    write_cleaned_sessions(sessions, manifest)
+    summary['elapsed'] = time.perf_counter() - start
+    return summary
+
+def write_cleaned_sessions(sessions, manifest):
+    for manifest_file, _ in sessions:
+        try:
+            write_cleaned_session(manifest_file, manifest)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error writing cleaned session manifest for {os.path.basename(manifest_file)}: {e}")
 
 def main():
+    parser = argparse.ArgumentParser(description="Remove game-induced counter-movements from mouse logs.")
+    parser.add_argument('--logs-dir', default="logs",
+                        help="Directory containing the _log.txt files and segmented session manifests")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--force', action='store_true', help="Clean all files, even unchanged ones")
+    parser.add_argument('--window-size', type=int, default=20)
+    parser.add_argument('--time-threshold', type=float, default=0.05)
+    parser.add_argument('--position-threshold', type=float, default=2)
+    args = parser.parse_args()
+
     # Look for logs in the logs directory
-    logs_dir = "logs"
+    logs_dir = args.logs_dir
     if not os.path.exists(logs_dir):
         print(f"Logs directory '{logs_dir}' not found")
         return
     
-    # Process all log files in the logs directory
-    log_files = [f for f in os.listdir(logs_dir) 
-                 if f.endswith('_log.txt') and not f.endswith('_cleaned_log.txt')]
-    
-    if not log_files:
-        print("No log files found in logs directory")
-        return
-    
-    for log_file in log_files:
-        full_path = os.path.join(logs_dir, log_file)
-        print(f"Processing {log_file}...")
-        output_file = clean_log_file(full_path)
-        print(f"Created cleaned file: {os.path.basename(output_file)}")
+    # Imported here: session_catalog imports this module
+    from session_catalog import open_catalog
+
+    with open_catalog(logs_dir, workers=args.workers) as catalog:
+        if not any(row['format'] == 'text' for row in catalog.sessions()):
+            print("No log files found in logs directory")
+            return
+        
+        summary = clean_logs(logs_dir, workers=args.workers, force=args.force, window_size=args.window_size,
+                             time_threshold=args.time_threshold, position_threshold=args.position_threshold)
+        elapsed = summary['elapsed']
+        print(f"\nCleaned {summary['files'] - summary['failed']} file(s), skipped {summary['skipped']} unchanged, "
+              f"{summary['failed']} failed")
+        if elapsed > 0:
+            print(f"Throughput: {summary['bytes'] / 1e6 / elapsed:.1f} MB/s, "
+                  f"{summary['moves'] / elapsed:,.0f} moves/s "
+                  f"({summary['removed']} of {summary['moves']} movements removed in {elapsed:.2f} s)")
+        # The catalog picks up the new cleaned logs and their removal percentages
+        catalog.refresh(args.workers)
+        pending = [row['log'] for row in catalog.sessions(cleaned=False) if row['format'] == 'text']
+        if pending:
+            print(f"Not cleaned: {', '.join(pending)}")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
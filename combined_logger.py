@@ -1,14 +1,24 @@
 import tkinter as tk
-import time
+import json
 from datetime import datetime
 import os
-import threading
 from PIL import ImageGrab
 import ctypes
 from ctypes import wintypes
 import win32con
 import win32gui
 from pynput import mouse, keyboard
+from log_writer import LogWriter
+from log_segments import SegmentedBinaryLogWriter, SegmentedLogWriter
+from live_cleaning import CleaningLogWriter, CleaningSegmentedLogWriter
+from screenshot_pipeline import ScreenshotPipeline
+from frame_store import FrameStoreWriter
+from frame_dedup import FrameChangeDetector
+from encoding_profiles import PROFILES, calibrate, get_profile, select_profile
+from binary_log import BinaryLogWriter, format_timestamp
+from session_clock import SessionClock
+from backends import CaptureBackend
+from input_logger import InputLogger
 
 # Define WM_INPUT since it's not in win32con
 WM_INPUT = 0x00FF
@@ -16,6 +26,28 @@ WM_INPUT = 0x00FF
 # Configuration options
 ENABLE_SCREENSHOTS = True  # Set to False to disable screenshot capture
 SCREENSHOT_FREQUENCY = 60  # Screenshots per second
+SCREENSHOT_WORKERS = None  # Encoder processes (None = CPU count - 1)
+SCREENSHOT_DROP_POLICY = 'oldest'  # When encoders fall behind: 'oldest', 'newest' or 'block'
+SCREENSHOT_TICK_POLICY = 'skip'  # When a capture tick is missed: 'skip' it or 'catch_up'
+SCREENSHOT_STORAGE = 'png'  # 'png' for one file per screenshot, 'store' to append them to a segmented frame store (see frame_store.py)
+SCREENSHOT_PROFILE = 'auto'  # Encoding profile name from encoding_profiles.PROFILES, or 'auto' to measure them at startup and use the best one that sustains SCREENSHOT_FREQUENCY
+SCREENSHOT_REGION = None  # (left, top, right, bottom) part of the screen to keep, None for the full screen
+SCREENSHOT_MAX_MB_PER_S = 100  # Disk write budget for the 'auto' profile choice, None for no limit
+SCREENSHOT_DEDUP = 0  # Skip screenshots unchanged since the last saved one: 0 = exact duplicates only, >0 = max tile difference in gray levels (see frame_dedup.py), None = save every frame
+LOG_FORMAT = 'text'  # 'text' for _log.txt, 'binary' for the compact _log.bin format (see binary_log.py)
+LOG_ROTATE_MB = None  # Start a new log segment when the current one reaches this size (see log_segments.py), None for a single log file
+LOG_ROTATE_MINUTES = None  # Start a new log segment after this many minutes, None for no time limit
+LOG_DURABILITY = 'buffered'  # When log lines are forced to disk: 'buffered' (by the OS), 'group' (fsync every LOG_SYNC_MS or LOG_SYNC_EVENTS) or 'strict' (every line, before the input callback returns)
+LOG_SYNC_MS = 50  # Maximum time between fsyncs with 'group' durability
+LOG_SYNC_EVENTS = 10000  # Number of lines that triggers an fsync with 'group' durability
+LOG_FRAMING = False  # Write text logs as checksummed frames so a tail torn by a crash is detected (see log_frames.py)
+LOG_COMPRESSION = None  # Compress text logs in independently readable blocks: 'zlib', 'gzip' or 'lzma' (implies LOG_FRAMING), None to store them as text
+LOG_COMPRESSION_LEVEL = 6  # Compression level, 0 (fastest) to 9 (smallest)
+LOG_BLOCK_KB = 256  # Text per compressed block; larger blocks compress better, smaller ones make windowed reads cheaper
+LIVE_CLEANING = False  # Write the cleaned log (as clean_mouse_data.py would, default parameters) while logging text logs, so the cleaning pass can skip the session (see live_cleaning.py)
+KEY_STATE_CHECKPOINT = 1.0  # Seconds between full key/button state records in the log (see key_state.py), 0 to disable
+MOUSE_AGGREGATION = 0  # Sum raw mouse deltas into bins of this many ms, 'frame' for one bin per screenshot, 0 to log every event
+DEBUG_RAW_INPUT = False  # Print every raw mouse movement to the console
 
 # Define folders for data storage
 screenshot_folder = "screenshots"
@@ -25,55 +57,200 @@ logs_folder = "logs"
 os.makedirs(screenshot_folder, exist_ok=True)
 os.makedirs(logs_folder, exist_ok=True)
 
-# Variable to control screenshot thread
-taking_screenshots = ENABLE_SCREENSHOTS
+# Clock for every timestamp of the session (wall time anchored once, then perf_counter_ns),
+# created by start_log()
+session_clock = None
 
-# Generate a unique file name based on the current timestamp
-log_file = os.path.join(logs_folder, datetime.now().strftime('%Y-%m-%d %H-%M-%S') + '_log.txt')
+# Log file and its background writer, created by start_log() (not at import time, because
+# the screenshot encoder processes re-import this module on Windows)
+log_file = None
+log_writer = None
 
-# Open the file in append mode to log data
-with open(log_file, 'a') as f:
-    f.write(f"--- Logging session started at {datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]} ---\n")
+# Session metadata (settings, screenshot calibration and profile), kept in <session>_meta.json next to the log
+metadata_file = None
+session_metadata = {}
+
+# Screenshot pipeline (and its frame store when SCREENSHOT_STORAGE = 'store'), created by start_screenshots()
+screenshot_pipeline = None
+frame_store = None
+
+# Turns the input callbacks into log events (key state tracking, raw mouse aggregation, ESC x5),
+# created by start_log()
+input_logger = None
 
 # Global variables
-stop_program = False
-esc_pressed = 0
 window = None
-keyboard_listener = None
-mouse_listener = None
+backend = None
 original_wnd_proc = None
 
-# Dictionary to track the state of each key (pressed or released)
-key_states = {}
-
-# Function to write to log file
+# Function to create the session log file, start its background writer and the input logger
+def start_log():
+    global log_file, log_writer, input_logger, metadata_file, session_clock
+    session_clock = SessionClock()
+    started_at = datetime.fromtimestamp(session_clock.anchor_wall_ns / 1e9)
+    # Generate a unique file name based on the session start time
+    session_base = os.path.join(logs_folder, started_at.strftime('%Y-%m-%d %H-%M-%S'))
+
+    # Raw mouse deltas are summed into bins of MOUSE_AGGREGATION before being logged
+    if MOUSE_AGGREGATION == 'frame':
+        mouse_bin_ns = int(1e9 / SCREENSHOT_FREQUENCY)
+    else:
+        mouse_bin_ns = int(MOUSE_AGGREGATION * 1e6)
+
+    # Background writer that batches log lines instead of reopening the file per event; with rotation
+    # the session is written as numbered segments listed in <session>_manifest.json
+    writer_options = dict(durability=LOG_DURABILITY, sync_interval=LOG_SYNC_MS / 1000, sync_events=LOG_SYNC_EVENTS)
+    live_cleaning = LIVE_CLEANING and LOG_FORMAT != 'binary'
+    if LOG_FORMAT != 'binary':
+        writer_options.update(framed=LOG_FRAMING, compression=LOG_COMPRESSION,
+                              compression_level=LOG_COMPRESSION_LEVEL, block_size=LOG_BLOCK_KB * 1024)
+    if live_cleaning:
+        # A mouse bin is logged when the next one starts or at the next poll, up to two bins late
+        writer_options.update(clock=session_clock.now_ns, max_delay=0.1 + 2 * mouse_bin_ns / 1e9)
+    if LOG_ROTATE_MB is not None or LOG_ROTATE_MINUTES is not None:
+        if LOG_FORMAT == 'binary':
+            writer_class = SegmentedBinaryLogWriter
+        else:
+            writer_class = CleaningSegmentedLogWriter if live_cleaning else SegmentedLogWriter
+        log_writer = writer_class(
+            session_base,
+            rotate_bytes=int(LOG_ROTATE_MB * 1e6) if LOG_ROTATE_MB is not None else None,
+            rotate_seconds=LOG_ROTATE_MINUTES * 60 if LOG_ROTATE_MINUTES is not None else None,
+            # Every segment starts with the full key state
+            on_rotate=lambda number: input_logger.request_checkpoint(),
+            **writer_options)
+        log_file = log_writer.path
+    else:
+        log_file = session_base + ('_log.bin' if LOG_FORMAT == 'binary' else '_log.txt')
+        if LOG_FORMAT == 'binary':
+            writer_class = BinaryLogWriter
+        else:
+            writer_class = CleaningLogWriter if live_cleaning else LogWriter
+        log_writer = writer_class(log_file, **writer_options)
+    log_writer.write(f"--- Logging session started at {started_at.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]} ---")
+
+    # Settings and, once screenshots start, the encoding calibration are kept next to the log
+    metadata_file = session_base + '_meta.json'
+    update_metadata(log_file=os.path.basename(getattr(log_writer, 'manifest_path', log_file)), clock=session_clock.stats(), settings={
+        'LOG_FORMAT': LOG_FORMAT, 'MOUSE_AGGREGATION': MOUSE_AGGREGATION, 'KEY_STATE_CHECKPOINT': KEY_STATE_CHECKPOINT,
+        'LOG_ROTATE_MB': LOG_ROTATE_MB, 'LOG_ROTATE_MINUTES': LOG_ROTATE_MINUTES,
+        'LOG_DURABILITY': LOG_DURABILITY, 'LOG_SYNC_MS': LOG_SYNC_MS, 'LOG_SYNC_EVENTS': LOG_SYNC_EVENTS,
+        'LOG_FRAMING': LOG_FRAMING and LOG_FORMAT != 'binary',
+        'LOG_COMPRESSION': LOG_COMPRESSION if LOG_FORMAT != 'binary' else None,
+        'LOG_COMPRESSION_LEVEL': LOG_COMPRESSION_LEVEL, 'LOG_BLOCK_KB': LOG_BLOCK_KB, 'LIVE_CLEANING': live_cleaning,
+        'ENABLE_SCREENSHOTS': ENABLE_SCREENSHOTS, 'SCREENSHOT_FREQUENCY': SCREENSHOT_FREQUENCY,
+        'SCREENSHOT_STORAGE': SCREENSHOT_STORAGE, 'SCREENSHOT_PROFILE': SCREENSHOT_PROFILE,
+        'SCREENSHOT_REGION': SCREENSHOT_REGION, 'SCREENSHOT_DEDUP': SCREENSHOT_DEDUP})
+
+    input_logger = InputLogger(log_writer, mouse_bin_ns=mouse_bin_ns, on_stop=stop_by_esc,
+                               clock=session_clock.now_ns, checkpoint_ns=int(KEY_STATE_CHECKPOINT * 1e9))
+
+# Function to add entries to the session metadata and rewrite its file (replaced atomically)
+def update_metadata(**entries):
+    session_metadata.update(entries)
+    tmp_file = metadata_file + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(session_metadata, f, indent=1)
+    os.replace(tmp_file, metadata_file)
+
+# Function to write to log file (queued and written by the background writer thread;
+# lines are dropped and counted if the queue is full)
 def write_log(message):
-    try:
-        with open(log_file, 'a') as f:
-            f.write(message + '\n')
-    except Exception as e:
-        print(f"Error writing to log: {e}")
-
-# Function to get a timestamp in Unix format with milliseconds
+    log_writer.write(message)
+
+# Function to emit the pending mouse bin and log the aggregation counters
+def stop_mouse_aggregation():
+    input_logger.flush_mouse()
+    aggregator = input_logger.mouse_aggregator
+    if aggregator.bin_ns:
+        stats = aggregator.stats()
+        write_log(f"{get_timestamp()} - Mouse aggregation stats: bin_ms={aggregator.bin_ns / 1e6:g}, "
+                  f"events={stats['events']}, emitted={stats['emitted']}, cancelled={stats['cancelled']}, "
+                  f"total_dx={stats['total_dx']}, total_dy={stats['total_dy']}")
+
+# Function to record the writer counters and flush everything to disk
+def close_log():
+    clock = session_clock.stats()
+    update_metadata(clock=clock)
+    write_log(f"{get_timestamp()} - Session clock stats: drift_us={clock['drift_ns'] / 1000:.1f}, "
+              f"anchor_uncertainty_us={clock['anchor_uncertainty_ns'] / 1000:.1f}")
+    stats = log_writer.stats()
+    write_log(f"{get_timestamp()} - Log writer stats: written={stats['written']}, "
+              f"dropped={stats['dropped']}, max_queue_depth={stats['max_queue_depth']}, "
+              f"batches={stats['batches']}, syncs={stats['syncs']}, max_sync_ms={stats['max_sync_ms']:.1f}" + (f", segments={stats['segments']}" if 'segments' in stats else ""))
+    log_writer.close()
+    if 'cleaned_moves' in stats:
+        stats = log_writer.stats()
+        status = (f"{stats['late_moves']} late movements, left for clean_mouse_data.py" if stats['late_moves']
+                  else "recorded as cleaned")
+        print(f"Live cleaning: {stats['cleaned_removed']} of {stats['cleaned_moves']} movements removed ({status})")
+
+# Function to get the current session time as a Unix timestamp with nanoseconds
 def get_timestamp():
-    return f"{time.time():.3f}"
-
-# Function to capture screenshots at high frequency
-def capture_screenshots(frequency=60):
-    global taking_screenshots
-    interval = 1 / frequency  # Calculate the interval in seconds
-    while taking_screenshots and not stop_program:
-        try:
-            # Generate the screenshot file name with milliseconds
-            timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S-%f')[:-3]  # Trim to milliseconds
-            screenshot_path = os.path.join(screenshot_folder, f"screenshot_{timestamp}.png")
-            
-            # Capture the screen and save it
-            ImageGrab.grab().save(screenshot_path, "PNG")
-            time.sleep(interval)  # Wait for the next capture
-        except Exception as e:
-            write_log(f"{get_timestamp()} - Screenshot error: {str(e)}")
-            time.sleep(1)  # Wait a bit before retrying
+    return format_timestamp(session_clock.now_ns())
+
+# Function to pick the screenshot encoding profile; with SCREENSHOT_PROFILE = 'auto' every profile is
+# measured on a few grabbed frames and the best one that sustains the frequency is used
+def choose_profile(frequency, grab):
+    profiles = [profile.replace(region=SCREENSHOT_REGION) for profile in PROFILES]
+    if SCREENSHOT_PROFILE != 'auto':
+        profile = get_profile(SCREENSHOT_PROFILE, profiles)
+        update_metadata(screenshot_profile=profile.describe())
+        return profile
+
+    calibration = calibrate(grab, profiles, workers=SCREENSHOT_WORKERS,
+                            store_level=frame_store.compression_level if frame_store is not None else None)
+    budget = SCREENSHOT_MAX_MB_PER_S * 1e6 if SCREENSHOT_MAX_MB_PER_S is not None else None
+    selected = select_profile(calibration, frequency, max_bytes_per_second=budget)
+    profile = get_profile(selected['profile'], profiles)
+    write_log(f"{get_timestamp()} - Screenshot profile: {profile.name}, max_fps={selected['max_fps']}, "
+              f"encode_ms={selected['encode_ms']}, bytes_per_frame={selected['bytes_per_frame']}, "
+              f"grab_ms={calibration['grab_ms']}")
+    if selected['max_fps'] < frequency or (calibration['max_grab_fps'] or frequency) < frequency:
+        write_log(f"{get_timestamp()} - Warning: no screenshot profile sustains {frequency} fps on this machine")
+    update_metadata(screenshot_profile=profile.describe(), screenshot_calibration=calibration)
+    return profile
+
+# Function to start capturing screenshots at high frequency; grabbing happens on its own
+# thread and encoding in a pool of worker processes
+def start_screenshots(frequency=60, grab=ImageGrab.grab):
+    global screenshot_pipeline, frame_store
+    if SCREENSHOT_STORAGE == 'store':
+        # One store per session, named after the log file
+        session = os.path.basename(log_file).rsplit('_log.', 1)[0]
+        frame_store = FrameStoreWriter(os.path.join(screenshot_folder, session + '_frames'))
+    screenshot_pipeline = ScreenshotPipeline(
+        screenshot_folder, grab, frequency=frequency, workers=SCREENSHOT_WORKERS,
+        drop_policy=SCREENSHOT_DROP_POLICY, tick_policy=SCREENSHOT_TICK_POLICY, log=lambda message: write_log(f"{get_timestamp()} - {message}"),
+        frame_store=frame_store,
+        dedup=FrameChangeDetector(SCREENSHOT_DEDUP) if SCREENSHOT_DEDUP is not None else None,
+        profile=choose_profile(frequency, grab), clock=session_clock.now_ns)
+    screenshot_pipeline.start()
+
+# Function to stop the screenshot pipeline, finish pending encodes and log its counters
+def stop_screenshots():
+    if screenshot_pipeline is None:
+        return
+    screenshot_pipeline.stop()
+    if frame_store is not None:
+        frame_store.close()
+        store_stats = frame_store.stats()
+        write_log(f"{get_timestamp()} - Frame store stats: frames={store_stats['frames']}, "
+                  f"keyframes={store_stats['keyframes']}, lost={store_stats['lost']}, "
+                  f"stored_bytes={store_stats['stored_bytes']}, ratio={store_stats['ratio']:.1f}")
+    stats = screenshot_pipeline.stats()
+    update_metadata(screenshot_stats=stats)
+    write_log(f"{get_timestamp()} - Screenshot stats: profile={stats['profile']}, target_fps={stats['target_fps']}, "
+              f"capture_fps={stats['capture_fps']:.1f}, encoded_fps={stats['encoded_fps']:.1f}, "
+              f"grabbed={stats['grabbed']}, encoded={stats['encoded']}, dropped={stats['dropped']}, "
+              f"failed={stats['failed']}, duplicates={stats['duplicates']}, bytes_saved={stats['bytes_saved']}")
+    timing = screenshot_pipeline.scheduler.stats()
+    if timing['ticks']:
+        write_log(f"{get_timestamp()} - Screenshot timing: ticks={timing['ticks']}, "
+                  f"achieved_hz={timing['achieved_hz']:.2f}, skipped={timing['skipped']}, "
+                  f"overruns={timing['overruns']}, jitter_mean_ms={timing['jitter_mean_ms']:.3f}, "
+                  f"jitter_std_ms={timing['jitter_std_ms']:.3f}, jitter_p99_ms={timing['jitter_p99_ms']:.3f}, "
+                  f"jitter_max_ms={timing['jitter_max_ms']:.3f}, max_overrun_ms={timing['max_overrun_ms']:.3f}")
 
 # Windows structures for raw input
 class RAWINPUTDEVICE(ctypes.Structure):
@@ -157,70 +334,43 @@ RIDEV_INPUTSINK = 0x00000100
 # Additional constants not always in win32con
 RID_INPUT = 0x10000003
 
-# Define how to handle key presses
-def on_press(key):
-    global key_states
-    
-    # Convert key to string representation for dictionary key
-    key_str = str(key)
-    
-    # Only log if the key wasn't already pressed
-    if key_str not in key_states or key_states[key_str] == 'released':
-        try:
-            write_log(f"{get_timestamp()} - PRESSED : {key.char}")
-        except AttributeError:
-            write_log(f"{get_timestamp()} - PRESSED : {key}")
-        
-        # Update key state
-        key_states[key_str] = 'pressed'
-
-# Define how to handle key releases
-def on_release(key):
-    global stop_program, keyboard_listener, mouse_listener, key_states
-    
-    # Convert key to string representation for dictionary key
-    key_str = str(key)
-    
-    # Only log if the key was previously pressed
-    if key_str not in key_states or key_states[key_str] == 'pressed':
-        try:
-            write_log(f"{get_timestamp()} - RELEASED: {key.char}")
-        except AttributeError:
-            write_log(f"{get_timestamp()} - RELEASED: {key}")
-        
-        # Update key state
-        key_states[key_str] = 'released'
-
-    # Keep the 'Esc' key logging but terminate on five 'Esc' presses
-    if key == keyboard.Key.esc:
-        global esc_pressed
-        esc_pressed += 1
-        if esc_pressed == 5:
-            write_log(f"{get_timestamp()} --- Logging session ended by pressing ESC 5 times ---")
-            stop_program = True
-            # Stop both listeners when Esc is pressed five times
-            if keyboard_listener:
-                keyboard_listener.stop()
-            if mouse_listener:
-                mouse_listener.stop()
-            if window:
-                window.destroy()  # Close the tkinter window
-            return False  # Stop the keyboard listener
-    else:
-        esc_pressed = 0
-
-# Define how to handle mouse clicks (using pynput)
-def on_click(x, y, button, pressed):
-    if stop_program:
-        return False
-    if pressed:
-        write_log(f"{get_timestamp()} - MOUSE PRESSED : {button}")
-    else:
-        write_log(f"{get_timestamp()} - MOUSE RELEASED: {button}")
-
-# Define how to handle mouse scroll (using pynput)
-def on_scroll(x, y, dx, dy):
-    write_log(f"{get_timestamp()} - MOUSE SCROLLED: {dx}, {dy}")
+# Buffer reused for every WM_INPUT; a mouse RAWINPUT always fits in it
+raw_input_buffer = RAWINPUT()
+raw_input_size = wintypes.UINT()
+
+# Capture backend for Windows: pynput keyboard and mouse listeners, raw input (delivered
+# to the window procedure, see create_window) and ImageGrab for screenshots
+class WindowsBackend(CaptureBackend):
+    def __init__(self):
+        self.sink = None
+        self.keyboard_listener = None
+        self.mouse_listener = None
+
+    def start(self, sink):
+        self.sink = sink
+        self.keyboard_listener = keyboard.Listener(on_press=sink.on_press, on_release=sink.on_release)
+        self.mouse_listener = mouse.Listener(on_click=sink.on_click, on_scroll=sink.on_scroll)
+        self.keyboard_listener.start()
+        self.mouse_listener.start()
+
+    def stop(self):
+        if self.keyboard_listener:
+            self.keyboard_listener.stop()
+        if self.mouse_listener:
+            self.mouse_listener.stop()
+
+    def grab(self):
+        return ImageGrab.grab()
+
+# Called by the input logger (on the keyboard listener thread) when ESC is pressed five times
+def stop_by_esc():
+    write_log(f"{get_timestamp()} --- Logging session ended by pressing ESC 5 times ---")
+    log_writer.flush()
+    # Stop both listeners when Esc is pressed five times
+    if backend:
+        backend.stop()
+    if window:
+        window.destroy()  # Close the tkinter window
 
 # Function to setup raw input for mouse
 def setup_raw_input(hwnd):
@@ -247,46 +397,29 @@ def setup_raw_input(hwnd):
 # Function to process raw input data - ONLY for mouse movement
 def process_raw_input(lparam):
     try:
-        buffer_size = wintypes.UINT()
-        
-        # Get the size of the input data
-        result = ctypes.windll.user32.GetRawInputData(
-            lparam, 
-            RID_INPUT,
-            None, 
-            ctypes.byref(buffer_size), 
-            ctypes.sizeof(RAWINPUTHEADER)
-        )
-        
-        if buffer_size.value <= 0:
-            return
-            
-        # Create a buffer to receive the input data
-        raw_buffer = (ctypes.c_byte * buffer_size.value)()
-        
-        # Get the raw input data
+        # Read the input straight into the preallocated buffer with a single call
+        raw_input_size.value = ctypes.sizeof(RAWINPUT)
         size = ctypes.windll.user32.GetRawInputData(
             lparam, 
             RID_INPUT, 
-            raw_buffer, 
-            ctypes.byref(buffer_size), 
+            ctypes.byref(raw_input_buffer), 
+            ctypes.byref(raw_input_size), 
             ctypes.sizeof(RAWINPUTHEADER)
         )
         
-        if size != buffer_size.value:
+        # (UINT)-1 on error, including inputs larger than a mouse RAWINPUT
+        if size == 0 or size == 0xFFFFFFFF:
             return
-            
-        # Cast the raw buffer to a RAWINPUT structure
-        raw_input = ctypes.cast(raw_buffer, ctypes.POINTER(RAWINPUT)).contents
         
         # Process mouse input - ONLY for movement
-        if raw_input.header.dwType == RIM_TYPEMOUSE:
-            mouse = raw_input._u1.mouse
+        if raw_input_buffer.header.dwType == RIM_TYPEMOUSE:
+            mouse = raw_input_buffer._u1.mouse
             
             # Log relative movements (this is what we want - hardware movements)
             if mouse.lLastX != 0 or mouse.lLastY != 0:
-                write_log(f"{get_timestamp()} - MOUSE MOVED: {mouse.lLastX}, {mouse.lLastY}")
-                print(f"Mouse moved: {mouse.lLastX}, {mouse.lLastY}")  # Debug print
+                input_logger.on_raw_mouse(mouse.lLastX, mouse.lLastY)
+                if DEBUG_RAW_INPUT:
+                    print(f"Mouse moved: {mouse.lLastX}, {mouse.lLastY}")
     except Exception as e:
         print(f"Error processing raw input: {e}")
         write_log(f"{get_timestamp()} - Error processing raw input: {str(e)}")
@@ -323,15 +456,13 @@ def create_window():
 
     # Define action on window close
     def on_closing():
-        global stop_program, taking_screenshots
-        stop_program = True  # Set flag to stop listeners
-        taking_screenshots = False  # Stop the screenshot thread
+        input_logger.stopped = True  # Set flag to stop listeners
+        input_logger.flush_mouse()
         write_log(f"{get_timestamp()} --- Logging session ended by window close ---")
+        log_writer.flush()
         # Stop both listeners
-        if keyboard_listener:
-            keyboard_listener.stop()
-        if mouse_listener:
-            mouse_listener.stop()
+        if backend:
+            backend.stop()
         window.destroy()  # Close the window
 
     window.protocol("WM_DELETE_WINDOW", on_closing)
@@ -355,27 +486,34 @@ def create_window():
     # Set the window procedure
     original_wnd_proc = win32gui.SetWindowLong(hwnd, win32con.GWL_WNDPROC, wnd_proc)
     
+    # Emit mouse bins that ended without a later event closing them (runs on the same thread as wnd_proc)
+    if input_logger.mouse_aggregator.bin_ns:
+        poll_ms = max(1, input_logger.mouse_aggregator.bin_ns // 1_000_000)
+        
+        def poll_mouse_aggregator():
+            input_logger.poll_mouse()
+            window.after(poll_ms, poll_mouse_aggregator)
+        
+        window.after(poll_ms, poll_mouse_aggregator)
+    
     return window
 
 def main():
-    global keyboard_listener, mouse_listener, window
+    global backend, window
     
-    # Start the screenshot thread if enabled
+    backend = WindowsBackend()
+    start_log()
+
+    # Start the screenshot pipeline if enabled
     if ENABLE_SCREENSHOTS:
-        screenshot_thread = threading.Thread(target=capture_screenshots, args=(SCREENSHOT_FREQUENCY,), daemon=True)
-        screenshot_thread.start()
+        start_screenshots(SCREENSHOT_FREQUENCY, backend.grab)
     
     try:
         # Create the tkinter window first
         window = create_window()
         
-        # Set up listeners for both keyboard and mouse
-        keyboard_listener = keyboard.Listener(on_press=on_press, on_release=on_release)
-        mouse_listener = mouse.Listener(on_click=on_click, on_scroll=on_scroll)
-        
-        # Start the listeners
-        keyboard_listener.start()
-        mouse_listener.start()
+        # Start the keyboard and mouse listeners
+        backend.start(input_logger)
         
         # Run the tkinter main loop
         window.mainloop()
@@ -385,17 +523,16 @@ def main():
         write_log(f"{get_timestamp()} - Error in main function: {str(e)}")
     finally:
         # Clean up
-        global stop_program, taking_screenshots
-        stop_program = True
-        taking_screenshots = False
+        input_logger.stopped = True
         
         # Stop listeners if they exist
-        if keyboard_listener:
-            keyboard_listener.stop()
-        if mouse_listener:
-            mouse_listener.stop()
+        backend.stop()
+
+        stop_mouse_aggregation()
+        stop_screenshots()
             
         write_log(f"{get_timestamp()} --- Logging session ended ---")
+        close_log()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
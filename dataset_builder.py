@@ -0,0 +1,544 @@
+"""
+Build frame/action training datasets from recorded sessions.
+
+For every screenshot of a session the builder computes the input state at
+the moment it was captured: which keys and mouse buttons were held, which
+were pressed since the previous frame, and the mouse and scroll deltas
+accumulated since the previous frame. Frames and log events are joined in
+a single sorted merge pass: the log is read in chunks (text or binary),
+and every frame captured more than MAX_EVENT_DELAY_NS before the last event
+of a chunk is final once that chunk has been applied (the events after that
+point are carried over to the next chunk, which can still hold aggregated
+movements that belong before them), so neither the log nor the frames are
+ever held in memory as a whole.
+
+Frames come from the session's frame store (`screenshots/<session>_frames`)
+when there is one, or else from the PNG/JPEG/... files in the screenshot
+folder, named after their capture time in Unix nanoseconds (files of older
+sessions are named after the local time with millisecond precision, which
+is converted back to Unix time here). Frames skipped as duplicates of the previous one (duplicate_frames.txt) are
+included with the image they are the same as.
+
+Each session is written to `<out_dir>/<session>/` as compressed NumPy shards
+of `shard_frames` frames (`shard_00000.npz`, ...) plus `manifest.json` with
+the input names. Shard arrays, one row per frame:
+
+    t_ns     capture time (Unix nanoseconds)
+    source   screenshot file name, or frame index in the frame store
+    held     inputs held at capture time (np.packbits over manifest 'inputs')
+    pressed  inputs pressed since the previous frame (same layout)
+    mouse    (dx, dy) raw mouse movement since the previous frame
+    scroll   (dx, dy) scrolling since the previous frame
+    image    the frame pixels (unless built with --no-images)
+
+Sessions are converted in parallel:
+    python dataset_builder.py logs screenshots dataset --workers 4
+"""
+import argparse
+import itertools
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+from PIL import Image
+
+from clean_mouse_data import cleaned_path
+from binary_log import (read_binary_log, EVENT_MESSAGE, EVENT_KEY_PRESS, EVENT_KEY_RELEASE, EVENT_MOUSE_MOVE,
+                        EVENT_BUTTON_PRESS, EVENT_BUTTON_RELEASE, EVENT_SCROLL, MAX_EVENT_DELAY_NS)
+from frame_store import FrameStore
+from log_frames import open_log
+from log_parser import iter_chunks, parse_bytes, session_start_ns, MESSAGE_SESSION_START, MESSAGE_SESSION_END
+from log_segments import cleaned_manifest_path, is_manifest, list_sessions, segment_files
+from screenshot_pipeline import DUPLICATES_NAME
+
+SHARD_FRAMES = 1000
+# Width of the held/pressed bit sets; inputs beyond this many distinct names are ignored
+INPUT_SLOTS = 256
+CHUNK_RECORDS = 1_000_000
+MANIFEST_NAME = 'manifest.json'
+
+_SESSION_RE = re.compile(r'(.*?)(?:_log(?:\.\d+)?(?:_cleaned)?\.(?:txt|bin)|(?:_cleaned)?_manifest\.json)$')
+_SCREENSHOT_RE = re.compile(r'screenshot_(?:(\d+)|(\d{4}-\d\d-\d\d_\d\d-\d\d-\d\d)-(\d{3}))\.(?:png|jpg|webp|ppm|pgm)$')
+_DUPLICATE_RE = re.compile(r'(\S+) same as (\S+)$')
+
+
+def screenshot_time_ns(filename):
+    """
+    Unix time in nanoseconds of a screenshot file name, or None. Accepts both
+    screenshot_<unix ns>.png and the older screenshot_<local time>-<ms>.png.
+    """
+    match = _SCREENSHOT_RE.match(filename)
+    if match is None:
+        return None
+    if match.group(1):
+        return int(match.group(1))
+    local = datetime.strptime(match.group(2), '%Y-%m-%d_%H-%M-%S')
+    return int(local.timestamp()) * 1_000_000_000 + int(match.group(3)) * 1_000_000
+
+
+def session_name(log_path):
+    """Session name of a log file or manifest ('2024-03-21 14-30-45' for '2024-03-21 14-30-45_log.txt')."""
+    name = os.path.basename(log_path)
+    match = _SESSION_RE.match(name)
+    return match.group(1) if match else os.path.splitext(name)[0]
+
+
+class ScreenshotFolder:
+    """
+    Frames stored as one image file each, in capture order.
+
+    Args:
+        folder: Screenshot directory (shared by all sessions)
+        start_ns, end_ns: Only frames captured in this time range are listed
+    """
+
+    def __init__(self, folder, start_ns=None, end_ns=None):
+        self.folder = folder
+        files = {}
+        for name in os.listdir(folder):
+            t_ns = screenshot_time_ns(name)
+            if t_ns is not None:
+                files[name] = (t_ns, name)
+        duplicates = os.path.join(folder, DUPLICATES_NAME)
+        if os.path.exists(duplicates):
+            with open(duplicates, 'r') as f:
+                for line in f:
+                    match = _DUPLICATE_RE.search(line.rstrip('\n'))
+                    t_ns = screenshot_time_ns(match.group(1)) if match else None
+                    if t_ns is not None:
+                        files[match.group(1)] = (t_ns, match.group(2))
+        frames = sorted((t_ns, name, image) for name, (t_ns, image) in files.items()
+                        if (start_ns is None or t_ns >= start_ns) and (end_ns is None or t_ns <= end_ns))
+        self.timestamps = np.array([frame[0] for frame in frames], dtype=np.int64)
+        self.sources = [frame[1] for frame in frames]
+        self._images = [frame[2] for frame in frames]
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def image(self, i):
+        return Image.open(os.path.join(self.folder, self._images[i]))
+
+    def close(self):
+        pass
+
+
+class StoreFrames:
+    """Frames of a session's frame store (exact capture times)."""
+
+    def __init__(self, folder):
+        self.store = FrameStore(folder)
+        self.timestamps = self.store.timestamps
+        self.sources = np.arange(len(self.store))
+
+    def __len__(self):
+        return len(self.store)
+
+    def image(self, i):
+        return self.store.frame(i)
+
+    def close(self):
+        self.store.close()
+
+
+def open_frames(log_path, screenshot_dir, start_ns=None, end_ns=None):
+    """The session's frame store if it has one, otherwise its screenshot files."""
+    store = os.path.join(screenshot_dir, session_name(log_path) + '_frames')
+    if os.path.isdir(store):
+        return StoreFrames(store)
+    return ScreenshotFolder(screenshot_dir, start_ns, end_ns)
+
+
+class EventChunk:
+    """
+    Time-sorted input events of one part of a log.
+
+    `code` indexes the builder's input names; `start_ns`/`end_ns` are the
+    session start and (last) end markers found in the chunk, or None.
+    """
+
+    def __init__(self, t_ns, event_type, code, dx, dy, start_ns=None, end_ns=None):
+        order = np.argsort(t_ns, kind='stable')
+        self.t_ns = t_ns[order]
+        self.type = event_type[order]
+        self.code = code[order]
+        self.dx = dx[order]
+        self.dy = dy[order]
+        self.start_ns = start_ns
+        self.end_ns = end_ns
+
+    def split(self, t_ns):
+        """(events before t_ns, events at or after t_ns) as two EventChunks."""
+        i = int(np.searchsorted(self.t_ns, t_ns, side='left'))
+        columns = (self.t_ns, self.type, self.code, self.dx, self.dy)
+        return (EventChunk(*(column[:i] for column in columns), self.start_ns, self.end_ns),
+                EventChunk(*(column[i:] for column in columns)))
+
+    def join(self, chunk):
+        """These events and those of a later chunk (with its markers) as one EventChunk."""
+        columns = zip((self.t_ns, self.type, self.code, self.dx, self.dy),
+                      (chunk.t_ns, chunk.type, chunk.code, chunk.dx, chunk.dy))
+        return EventChunk(*(np.concatenate(pair) for pair in columns), chunk.start_ns, chunk.end_ns)
+
+
+class InputNames:
+    """Input name <-> slot assignment, in order of first appearance."""
+
+    def __init__(self):
+        self.names = []
+        self.slots = {}
+
+    def slot(self, name):
+        slot = self.slots.get(name)
+        if slot is None:
+            slot = self.slots[name] = len(self.names) if len(self.names) < INPUT_SLOTS else -1
+            if slot >= 0:
+                self.names.append(name)
+        return slot
+
+    def slot_array(self, names):
+        """Slots for a local name table, as an array indexed by local code."""
+        return np.array([self.slot(name) for name in names] or [-1], dtype=np.int32)
+
+
+def _text_chunks(log_path, inputs):
+    with open_log(log_path) as f:
+        for chunk in iter_chunks(f):
+            data = parse_bytes(chunk)
+            slots = inputs.slot_array(data.names)
+            messages = data.messages
+            starts = messages['t_ns'][messages['kind'] == MESSAGE_SESSION_START]
+            ends = messages['t_ns'][messages['kind'] == MESSAGE_SESSION_END]
+            parts = [
+                (data.moves, np.full(len(data.moves['t_ns']), EVENT_MOUSE_MOVE), None),
+                (data.scrolls, np.full(len(data.scrolls['t_ns']), EVENT_SCROLL), None),
+                (data.keys, np.where(data.keys['pressed'], EVENT_KEY_PRESS, EVENT_KEY_RELEASE), slots),
+                (data.buttons, np.where(data.buttons['pressed'], EVENT_BUTTON_PRESS, EVENT_BUTTON_RELEASE), slots),
+            ]
+            yield EventChunk(
+                np.concatenate([columns['t_ns'] for columns, _, _ in parts]),
+                np.concatenate([types for _, types, _ in parts]).astype(np.uint8),
+                np.concatenate([table[columns['code']] if table is not None
+                                else np.full(len(columns['t_ns']), -1, dtype=np.int32)
+                                for columns, _, table in parts]),
+                np.concatenate([columns.get('dx', np.zeros(len(columns['t_ns']), dtype=np.int32))
+                                for columns, _, _ in parts]),
+                np.concatenate([columns.get('dy', np.zeros(len(columns['t_ns']), dtype=np.int32))
+                                for columns, _, _ in parts]),
+                start_ns=int(starts[0]) if len(starts) else None,
+                end_ns=int(ends[-1]) if len(ends) else None)
+
+
+def _binary_chunks(log_path, inputs):
+    records, names = read_binary_log(log_path)
+    # The string table also holds message lines, so only names used by input events get a slot
+    slots = np.full(len(names) + 1, -1, dtype=np.int32)
+    assigned = np.zeros(len(names) + 1, dtype=bool)
+    for begin in range(0, len(records), CHUNK_RECORDS):
+        chunk = np.asarray(records[begin:begin + CHUNK_RECORDS])
+        is_message = chunk['type'] == EVENT_MESSAGE
+        start_ns = end_ns = None
+        for t_ns, code in zip(chunk['t_ns'][is_message].tolist(), chunk['code'][is_message].tolist()):
+            text = names[code] if code < len(names) else ''
+            if start_ns is None:
+                start_ns = session_start_ns(text)
+            if 'Logging session ended' in text:
+                end_ns = t_ns
+        chunk = chunk[~is_message]
+        has_name = np.isin(chunk['type'], (EVENT_KEY_PRESS, EVENT_KEY_RELEASE, EVENT_BUTTON_PRESS,
+                                           EVENT_BUTTON_RELEASE))
+        local = np.minimum(chunk['code'], len(names)).astype(np.int64)
+        for code in np.unique(local[has_name & ~assigned[local]]).tolist():
+            slots[code] = inputs.slot(names[code]) if code < len(names) else -1
+            assigned[code] = True
+        code = np.where(has_name, slots[local], -1)
+        yield EventChunk(chunk['t_ns'], chunk['type'], code, chunk['dx'], chunk['dy'], start_ns, end_ns)
+
+
+def iter_event_chunks(log_path, inputs):
+    """EventChunks of a text or binary log, or of every segment of a session manifest, in file order."""
+    if is_manifest(log_path):
+        return itertools.chain.from_iterable(iter_event_chunks(segment, inputs)
+                                             for segment in segment_files(log_path))
+    if log_path.endswith('.bin'):
+        return _binary_chunks(log_path, inputs)
+    return _text_chunks(log_path, inputs)
+
+
+class FrameAligner:
+    """
+    Input state per frame, carried across event chunks.
+
+    align() applies one chunk of events and returns the state for the frames
+    captured up to a time bound no later event can precede.
+    """
+
+    def __init__(self):
+        self.held = np.zeros(INPUT_SLOTS, dtype=bool)
+        self.pending_pressed = np.zeros(INPUT_SLOTS, dtype=bool)
+        # Running totals of mouse and scroll deltas, and their value at the previous frame
+        self.position = np.zeros(4, dtype=np.int64)
+        self.frame_position = np.zeros(4, dtype=np.int64)
+
+    def _positions(self, chunk, event_type, frame_t):
+        """Running (x, y) totals of one delta event type at every frame time."""
+        mask = chunk.type == event_type
+        t = chunk.t_ns[mask]
+        totals = np.cumsum(np.stack((chunk.dx[mask], chunk.dy[mask]), axis=1), axis=0, dtype=np.int64)
+        offset = 0 if event_type == EVENT_MOUSE_MOVE else 2
+        start = self.position[offset:offset + 2].copy()
+        if not len(t):
+            return np.tile(start, (len(frame_t), 1))
+        idx = np.searchsorted(t, frame_t, side='right')
+        self.position[offset:offset + 2] = start + totals[-1]
+        return np.where(idx[:, None] > 0, start + totals[np.maximum(idx - 1, 0)], start)
+
+    def align(self, chunk, frame_t):
+        """
+        Apply `chunk` and return (held, pressed, deltas) for the frames at
+        `frame_t`, which must all be earlier than any event of later chunks.
+        held/pressed are bool arrays (frames x INPUT_SLOTS); deltas holds
+        mouse dx, dy, scroll dx, dy since the previous frame.
+        """
+        positions = np.concatenate((self._positions(chunk, EVENT_MOUSE_MOVE, frame_t),
+                                    self._positions(chunk, EVENT_SCROLL, frame_t)), axis=1)
+        deltas = np.diff(positions, axis=0, prepend=self.frame_position[None, :])
+        if len(frame_t):
+            self.frame_position = positions[-1]
+
+        # Key and button events are rare next to mouse movements, so their state is stepped in Python
+        is_input = np.isin(chunk.type, (EVENT_KEY_PRESS, EVENT_KEY_RELEASE, EVENT_BUTTON_PRESS,
+                                        EVENT_BUTTON_RELEASE)) & (chunk.code >= 0)
+        input_t = chunk.t_ns[is_input]
+        is_press = np.isin(chunk.type[is_input], (EVENT_KEY_PRESS, EVENT_BUTTON_PRESS))
+        codes = chunk.code[is_input]
+        states = np.empty((len(input_t) + 1, INPUT_SLOTS), dtype=bool)
+        states[0] = self.held
+        for i, (code, pressed) in enumerate(zip(codes.tolist(), is_press.tolist())):
+            self.held[code] = pressed
+            states[i + 1] = self.held
+        held = states[np.searchsorted(input_t, frame_t, side='right')]
+
+        # A press counts for the first frame captured at or after it
+        pressed = np.zeros((len(frame_t), INPUT_SLOTS), dtype=bool)
+        frame_of_press = np.searchsorted(frame_t, input_t[is_press], side='left')
+        press_codes = codes[is_press]
+        if len(frame_t):
+            pressed[0] = self.pending_pressed
+            self.pending_pressed[:] = False
+        inside = frame_of_press < len(frame_t)
+        pressed[frame_of_press[inside], press_codes[inside]] = True
+        self.pending_pressed[press_codes[~inside]] = True
+        return held, pressed, deltas
+
+
+class ShardWriter:
+    """Buffers aligned frames and writes them as compressed .npz shards."""
+
+    def __init__(self, out_dir, frames, shard_frames=SHARD_FRAMES, images=True, size=None):
+        self.out_dir = out_dir
+        self.frames = frames
+        self.shard_frames = shard_frames
+        self.images = images
+        self.size = size
+        self.shards = []
+        self.count = 0
+        self.image_shape = None
+        self._rows = []
+        os.makedirs(out_dir, exist_ok=True)
+
+    def add(self, first, held, pressed, deltas):
+        """Add the aligned state of frames first, first + 1, ..."""
+        for i in range(len(held)):
+            self._rows.append((first + i, held[i], pressed[i], deltas[i]))
+            if len(self._rows) >= self.shard_frames:
+                self._write()
+
+    def _load(self, i):
+        image = self.frames.image(i)
+        if self.size is not None and image.size != self.size:
+            image = image.resize(self.size, Image.BILINEAR)
+        pixels = np.asarray(image)
+        if self.image_shape is None:
+            self.image_shape = pixels.shape
+        elif pixels.shape != self.image_shape:
+            # Keep shards stackable if the capture size changed mid-session
+            height, width = self.image_shape[:2]
+            pixels = np.asarray(image.resize((width, height), Image.BILINEAR).convert(
+                'L' if len(self.image_shape) == 2 else 'RGB'))
+        return pixels
+
+    def _write(self):
+        if not self._rows:
+            return
+        indices = [row[0] for row in self._rows]
+        deltas = np.array([row[3] for row in self._rows], dtype=np.int32)
+        arrays = {
+            't_ns': self.frames.timestamps[indices],
+            'source': np.asarray([self.frames.sources[i] for i in indices]),
+            'held': np.packbits(np.array([row[1] for row in self._rows]), axis=1),
+            'pressed': np.packbits(np.array([row[2] for row in self._rows]), axis=1),
+            'mouse': deltas[:, :2],
+            'scroll': deltas[:, 2:],
+        }
+        if self.images:
+            arrays['image'] = np.stack([self._load(i) for i in indices])
+        name = f"shard_{len(self.shards):05d}.npz"
+        tmp_path = os.path.join(self.out_dir, name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(tmp_path, os.path.join(self.out_dir, name))
+        self.shards.append(name)
+        self.count += len(self._rows)
+        self._rows = []
+
+    def close(self):
+        self._write()
+
+
+def build_session(log_path, screenshot_dir, out_dir, shard_frames=SHARD_FRAMES, images=True, size=None):
+    """
+    Convert one session into `<out_dir>/<session>/`. Returns a summary dict.
+
+    Args:
+        log_path: Text or binary session log
+        screenshot_dir: Folder with the screenshots or the session's frame store
+        out_dir: Dataset root
+        shard_frames: Frames per shard
+        images: Include the frame pixels
+        size: (width, height) to resize frames to, None to keep their size
+    """
+    inputs = InputNames()
+    aligner = FrameAligner()
+    session_dir = os.path.join(out_dir, session_name(log_path))
+    frames = writer = carried = None
+    next_frame = 0
+    start_ns = end_ns = last_t_ns = None
+    try:
+        for chunk in iter_event_chunks(log_path, inputs):
+            if frames is None:
+                start_ns = chunk.start_ns if chunk.start_ns is not None else (
+                    int(chunk.t_ns[0]) if len(chunk.t_ns) else None)
+                if start_ns is None:
+                    continue
+                frames = open_frames(log_path, screenshot_dir, start_ns=start_ns)
+                writer = ShardWriter(session_dir, frames, shard_frames, images, size)
+                next_frame = int(np.searchsorted(frames.timestamps, start_ns, side='left'))
+            if chunk.end_ns is not None:
+                end_ns = chunk.end_ns
+            if not len(chunk.t_ns):
+                continue
+            if carried is not None:
+                chunk = carried.join(chunk)
+            last_t_ns = max(last_t_ns or 0, int(chunk.t_ns[-1]))
+            # Later chunks can still have events up to MAX_EVENT_DELAY_NS before this one's last:
+            # frames before that bound are final, the events from there on wait for the next chunk
+            bound = last_t_ns - MAX_EVENT_DELAY_NS
+            chunk, carried = chunk.split(bound)
+            stop = int(np.searchsorted(frames.timestamps, bound, side='left'))
+            if end_ns is not None:
+                stop = min(stop, int(np.searchsorted(frames.timestamps, end_ns, side='right')))
+            stop = max(stop, next_frame)
+            writer.add(next_frame, *aligner.align(chunk, frames.timestamps[next_frame:stop]))
+            next_frame = stop
+
+        if frames is None:
+            return {'session': session_name(log_path), 'frames': 0, 'shards': 0}
+        # Frames after the last final one, up to the end of the session, with the carried-over events
+        end = end_ns if end_ns is not None else last_t_ns
+        stop = max(next_frame, int(np.searchsorted(frames.timestamps, end, side='right')) if end else next_frame)
+        if carried is None:
+            carried = EventChunk(*(np.zeros(0, dtype=dtype) for dtype in (np.int64, np.uint8, np.int32, np.int32,
+                                                                           np.int32)))
+        writer.add(next_frame, *aligner.align(carried, frames.timestamps[next_frame:stop]))
+        writer.close()
+    finally:
+        if frames is not None:
+            frames.close()
+
+    manifest = {
+        'log': os.path.basename(log_path),
+        'frame_source': 'store' if isinstance(frames, StoreFrames) else 'screenshots',
+        'start_ns': start_ns,
+        'end_ns': end,
+        'frames': writer.count,
+        'shards': writer.shards,
+        'inputs': inputs.names,
+        'image_shape': list(writer.image_shape) if writer.image_shape else None,
+    }
+    with open(os.path.join(session_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    return {'session': session_name(log_path), 'frames': writer.count, 'shards': len(writer.shards)}
+
+
+def list_session_logs(logs_dir, cleaned=False):
+    """
+    One log per session: text or binary, the cleaned text log instead if `cleaned` and it exists,
+    and the manifest of segmented sessions (of their cleaned segments if `cleaned`).
+    """
+    logs = []
+    for manifest_file in list_sessions(logs_dir):
+        if cleaned and os.path.exists(cleaned_manifest_path(manifest_file)):
+            manifest_file = cleaned_manifest_path(manifest_file)
+        logs.append(manifest_file)
+    for name in sorted(os.listdir(logs_dir)):
+        if not (name.endswith('_log.txt') or name.endswith('_log.bin')):
+            continue
+        log_path = os.path.join(logs_dir, name)
+        if cleaned and name.endswith('.txt') and os.path.exists(cleaned_path(log_path)):
+            log_path = cleaned_path(log_path)
+        logs.append(log_path)
+    return logs
+
+
+def build_datasets(logs_dir, screenshot_dir, out_dir, workers=None, cleaned=False, **options):
+    """Convert every session in logs_dir on a process pool. Returns a summary dict."""
+    summary = {'sessions': 0, 'failed': 0, 'frames': 0, 'shards': 0, 'elapsed': 0.0}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(build_session, log_path, screenshot_dir, out_dir, **options): log_path
+                   for log_path in list_session_logs(logs_dir, cleaned)}
+        for future in as_completed(futures):
+            log_path = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                summary['failed'] += 1
+                print(f"Error converting {os.path.basename(log_path)}: {e}")
+                continue
+            print(f"{result['session']}: {result['frames']} frames in {result['shards']} shards")
+            summary['sessions'] += 1
+            summary['frames'] += result['frames']
+            summary['shards'] += result['shards']
+    summary['elapsed'] = time.perf_counter() - start
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build frame/action datasets from recorded sessions.")
+    parser.add_argument('logs_dir', nargs='?', default='logs', help="Directory with the session logs")
+    parser.add_argument('screenshot_dir', nargs='?', default='screenshots',
+                        help="Directory with the screenshots and frame stores")
+    parser.add_argument('out_dir', nargs='?', default='dataset', help="Dataset output directory")
+    parser.add_argument('--workers', type=int, default=None, help="Sessions converted in parallel")
+    parser.add_argument('--shard-frames', type=int, default=SHARD_FRAMES, help="Frames per shard")
+    parser.add_argument('--size', metavar='WxH', default=None, help="Resize frames to this size")
+    parser.add_argument('--no-images', action='store_true', help="Only write the aligned inputs")
+    parser.add_argument('--cleaned', action='store_true',
+                        help="Use the cleaned logs (clean_mouse_data.py) where they exist")
+    args = parser.parse_args()
+
+    size = tuple(int(value) for value in args.size.lower().split('x')) if args.size else None
+    summary = build_datasets(args.logs_dir, args.screenshot_dir, args.out_dir, workers=args.workers,
+                             cleaned=args.cleaned, shard_frames=args.shard_frames, images=not args.no_images,
+                             size=size)
+    print(f"Converted {summary['sessions']} sessions ({summary['failed']} failed): {summary['frames']} frames "
+          f"in {summary['shards']} shards, {summary['elapsed']:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
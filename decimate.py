@@ -0,0 +1,178 @@
+"""
+Level-of-detail decimation for plotting long mouse movement recordings.
+
+A line plot can't show more detail than it has pixels, so wide time windows
+are reduced to the first, last, minimum and maximum sample of each bin
+before plotting. Extremes survive, so spikes and the overall shape of the
+path look the same as with every raw point.
+
+For zooming in and out of the same session, LevelOfDetail keeps a pyramid
+of such reductions over the whole log (each level 8x coarser than the
+previous one). The pyramid is built one index block at a time, so the
+full-resolution movements are never held in memory, and the statistics of
+any window are still computed exactly at full resolution from the partial
+sums of the block index (log_index.window_stats).
+"""
+import os
+
+import numpy as np
+
+from log_cache import cache_key, save_arrays, sidecar_path
+from log_index import iter_blocks, load_index, slice_by_time, window_stats
+
+# About the number of horizontal pixels of one subplot in the saved figure
+DEFAULT_MAX_POINTS = 4000
+# Samples per bucket in the finest pyramid level, and growth factor between levels
+BASE_BUCKET = 64
+LEVEL_FACTOR = 8
+# Bumped when the sidecar contents change
+LOD_VERSION = 2
+
+
+def _bucket_indices(starts, n, columns):
+    """Indices of the first, last, minimum and maximum (of each column) sample in each bucket."""
+    counts = np.diff(np.append(starts, n))
+    bucket_ids = np.repeat(np.arange(len(starts)), counts)
+    picked = [starts, starts + counts - 1]
+    for values in columns:
+        for reduce in (np.minimum, np.maximum):
+            extremes = reduce.reduceat(values, starts)
+            candidates = np.flatnonzero(values == extremes[bucket_ids])
+            # First candidate of each bucket
+            _, first = np.unique(bucket_ids[candidates], return_index=True)
+            picked.append(candidates[first])
+    return np.unique(np.concatenate(picked))
+
+
+def minmax_indices(t, columns, n_bins):
+    """
+    Indices of the samples to keep when reducing sorted t (and columns) to n_bins time bins.
+
+    Every non-empty bin keeps its first and last sample and the samples with the
+    minimum and maximum of each column, in time order.
+    """
+    n = len(t)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    edges = np.linspace(t[0], t[-1], n_bins + 1)[:-1]
+    starts = np.unique(np.searchsorted(t, edges, side='left'))
+    return _bucket_indices(starts[starts < n], n, columns)
+
+
+def decimate(t, *columns, max_points=DEFAULT_MAX_POINTS):
+    """
+    Reduce t and matching columns to at most about max_points samples per column.
+
+    Returns (t, *columns) unchanged when they are already small enough.
+    """
+    if len(t) <= max_points:
+        return (t,) + columns
+    # Each bin keeps at most 2 + 2 * len(columns) samples
+    n_bins = max(1, max_points // (2 + 2 * len(columns)))
+    keep = minmax_indices(t, columns, n_bins)
+    return (t[keep],) + tuple(column[keep] for column in columns)
+
+
+class LevelOfDetail:
+    """
+    Multi-resolution view of the mouse path of one log.
+
+    Attributes:
+        log_path: The log
+        index: Its LogIndex, for full-resolution windows and statistics
+        levels: List of (t_ns, x, y) reductions, finest first
+    """
+
+    def __init__(self, log_path, index, levels):
+        self.log_path = log_path
+        self.index = index
+        self.levels = levels
+
+    def window_stats(self, start_ns, end_ns):
+        """Number of movements and path length within start_ns <= t <= end_ns, at full resolution."""
+        return window_stats(self.log_path, start_ns, end_ns, self.index)
+
+    def window_points(self, start_ns, end_ns, max_points=DEFAULT_MAX_POINTS):
+        """
+        Decimated (t_ns, x, y) for start_ns <= t <= end_ns from the finest level
+        that is cheap to reduce, or None if the raw window is small enough to plot as is.
+        """
+        # The blocks covering the window bound its size; only close calls parse the edge blocks
+        index = self.index
+        first, _, _ = index.block_range(start_ns, end_ns)
+        last = int(np.searchsorted(index.t_ns, end_ns, side='right'))
+        upper = (int(index.counts[last]) if last < len(index.counts) else index.moves) - int(index.counts[first])
+        if upper <= max_points or self.window_stats(start_ns, end_ns)[0] <= max_points:
+            return None
+        for level_t, level_x, level_y in self.levels:
+            t, x, y = slice_by_time(level_t, start_ns, end_ns, level_x, level_y)
+            if len(t) <= max_points * LEVEL_FACTOR:
+                break
+        return decimate(t, x, y, max_points=max_points)
+
+
+def _bucket_starts(ids):
+    """Positions where the bucket number changes in a sorted array of bucket numbers."""
+    return np.flatnonzero(np.concatenate(([True], ids[1:] != ids[:-1])))
+
+
+def build_lod(log_path, index, max_points=DEFAULT_MAX_POINTS):
+    """
+    Build the pyramid of a log, adding levels until one fits in max_points.
+
+    The log is read one index block at a time. Buckets are aligned to movement
+    numbers (not to blocks), so every coarser level can be reduced from the
+    finest one and still keeps the first, last and extreme samples of its buckets.
+    """
+    levels = []
+    if index.moves <= max_points:
+        return LevelOfDetail(log_path, index, levels)
+    pieces = []
+    for block, moves in iter_blocks(log_path, index):
+        if len(moves['t_ns']) == 0:
+            continue
+        numbers = index.counts[block] + np.arange(len(moves['t_ns']))
+        x = index.cum_x[block] + np.cumsum(moves['dx'], dtype=np.int64)
+        y = index.cum_y[block] + np.cumsum(moves['dy'], dtype=np.int64)
+        keep = _bucket_indices(_bucket_starts(numbers // BASE_BUCKET), len(numbers), (x, y))
+        pieces.append((moves['t_ns'][keep], x[keep], y[keep], numbers[keep]))
+    t_ns, x, y, numbers = (np.concatenate(columns) for columns in zip(*pieces))
+    levels.append((t_ns, x, y))
+    bucket = BASE_BUCKET
+    while len(t_ns) > max_points:
+        bucket *= LEVEL_FACTOR
+        keep = _bucket_indices(_bucket_starts(numbers // bucket), len(numbers), (x, y))
+        t_ns, x, y, numbers = t_ns[keep], x[keep], y[keep], numbers[keep]
+        levels.append((t_ns, x, y))
+    return LevelOfDetail(log_path, index, levels)
+
+
+def load_lod(log_path, cache_dir=None, index=None):
+    """Return the LevelOfDetail of a log from its sidecar, building and saving it if needed."""
+    if index is None:
+        index = load_index(log_path, cache_dir)
+    key = cache_key(log_path)
+    sidecar = sidecar_path(log_path, cache_dir, suffix='.lod.npz')
+    if os.path.exists(sidecar):
+        try:
+            with np.load(sidecar) as arrays:
+                if tuple(arrays['key'].tolist()) == (key[1], key[2], BASE_BUCKET, LEVEL_FACTOR, LOD_VERSION):
+                    os.utime(sidecar)
+                    levels = [(arrays[f'level{i}.t_ns'], arrays[f'level{i}.x'], arrays[f'level{i}.y'])
+                              for i in range(int(arrays['n_levels']))]
+                    return LevelOfDetail(log_path, index, levels)
+        except (OSError, ValueError, KeyError):
+            pass
+
+    lod = build_lod(log_path, index)
+    arrays = {
+        'key': np.array([key[1], key[2], BASE_BUCKET, LEVEL_FACTOR, LOD_VERSION], dtype=np.int64),
+        'n_levels': np.array(len(lod.levels)),
+    }
+    for i, (t, x, y) in enumerate(lod.levels):
+        arrays.update({f'level{i}.t_ns': t, f'level{i}.x': x, f'level{i}.y': y})
+    try:
+        save_arrays(sidecar, arrays)
+    except OSError as e:
+        print(f"Could not write level-of-detail file {sidecar}: {e}")
+    return lod
@@ -0,0 +1,259 @@
+"""
+Screenshot encoding profiles and a startup calibration to choose between them.
+
+A profile describes what is kept of each screenshot (capture region,
+resolution scale, color or grayscale) and how it is written (PNG at a
+compression level, JPEG/WebP at a quality, or raw uncompressed PPM).
+PROFILES lists the built-in profiles from highest to lowest quality.
+
+The region, scale and color conversion are applied by the screenshot
+pipeline's dispatcher before a frame is sent to an encoder process, so they
+also shrink what has to be copied between processes; the format is applied
+by the encoders. calibrate() measures both costs and the bytes per frame of
+every profile on the current machine, and select_profile() picks the first
+(highest quality) profile that sustains the target frame rate.
+
+Run `python encoding_profiles.py --fps 60` to print the calibration table.
+"""
+import argparse
+import io
+import os
+import statistics
+import time
+from functools import partial
+
+from PIL import Image
+
+from frame_store import compress_payload
+
+FORMATS = ('PNG', 'JPEG', 'WEBP', 'RAW')
+COLOR_MODES = ('RGB', 'L')
+EXTENSIONS = {'PNG': '.png', 'JPEG': '.jpg', 'WEBP': '.webp'}
+
+# Fraction of the measured maximum frame rate a profile may be loaded to
+HEADROOM = 0.8
+CALIBRATION_FRAMES = 5
+
+
+class EncodingProfile:
+    """
+    How screenshots are reduced and encoded.
+
+    Args:
+        name: Profile name (SCREENSHOT_PROFILE in combined_logger)
+        image_format: 'PNG', 'JPEG', 'WEBP' or 'RAW' (uncompressed PPM/PGM)
+        level: PNG compression level (0-9)
+        quality: JPEG/WebP quality (1-100)
+        scale: Resolution scale applied after cropping (1.0 = full resolution)
+        region: (left, top, right, bottom) part of the screen to keep, None for all of it
+        color: 'RGB' or 'L' (grayscale)
+    """
+
+    def __init__(self, name, image_format='PNG', level=6, quality=90, scale=1.0, region=None, color='RGB'):
+        if image_format not in FORMATS:
+            raise ValueError(f"Unknown image format '{image_format}', expected one of {FORMATS}")
+        if color not in COLOR_MODES:
+            raise ValueError(f"Unknown color mode '{color}', expected one of {COLOR_MODES}")
+        if not 0 < scale <= 1:
+            raise ValueError(f"Scale must be in (0, 1], got {scale}")
+        self.name = name
+        self.image_format = image_format
+        self.level = level
+        self.quality = quality
+        self.scale = scale
+        self.region = tuple(region) if region is not None else None
+        self.color = color
+
+    def __repr__(self):
+        return f"EncodingProfile({self.describe()})"
+
+    def replace(self, **changes):
+        """Copy of the profile with some settings changed."""
+        settings = {'name': self.name, 'image_format': self.image_format, 'level': self.level,
+                    'quality': self.quality, 'scale': self.scale, 'region': self.region, 'color': self.color}
+        settings.update(changes)
+        return EncodingProfile(**settings)
+
+    def describe(self):
+        """Settings as a JSON-serializable dict (for the session metadata)."""
+        settings = {'name': self.name, 'format': self.image_format, 'scale': self.scale,
+                    'region': list(self.region) if self.region else None, 'color': self.color}
+        if self.image_format == 'PNG':
+            settings['level'] = self.level
+        elif self.image_format != 'RAW':
+            settings['quality'] = self.quality
+        return settings
+
+    @property
+    def extension(self):
+        if self.image_format == 'RAW':
+            return '.pgm' if self.color == 'L' else '.ppm'
+        return EXTENSIONS[self.image_format]
+
+    def transform(self, image):
+        """Crop, scale and convert a grabbed frame (done before it is queued for encoding)."""
+        if self.region is not None:
+            left, top, right, bottom = self.region
+            width, height = image.size
+            image = image.crop((max(0, left), max(0, top), min(width, right), min(height, bottom)))
+        if self.scale != 1:
+            factor = 1 / self.scale
+            if factor == int(factor):
+                image = image.reduce(int(factor))
+            else:
+                size = (max(1, round(image.width * self.scale)), max(1, round(image.height * self.scale)))
+                image = image.resize(size, Image.BILINEAR)
+        if image.mode != self.color:
+            image = image.convert(self.color)
+        return image
+
+    def save_options(self):
+        if self.image_format == 'PNG':
+            return {'format': 'PNG', 'compress_level': self.level}
+        if self.image_format == 'RAW':
+            return {'format': 'PPM'}
+        return {'format': self.image_format, 'quality': self.quality}
+
+    def save(self, image, fp):
+        """Encode a transformed frame to a path or file object."""
+        image.save(fp, **self.save_options())
+
+    def encode(self, image):
+        """Encoded bytes of a transformed frame."""
+        buffer = io.BytesIO()
+        self.save(image, buffer)
+        return buffer.getvalue()
+
+
+PROFILES = [
+    EncodingProfile('png', 'PNG', level=6),
+    EncodingProfile('png_fast', 'PNG', level=1),
+    EncodingProfile('raw', 'RAW'),
+    EncodingProfile('jpeg_95', 'JPEG', quality=95),
+    EncodingProfile('webp_90', 'WEBP', quality=90),
+    EncodingProfile('jpeg_85_half', 'JPEG', quality=85, scale=0.5),
+    EncodingProfile('jpeg_85_half_gray', 'JPEG', quality=85, scale=0.5, color='L'),
+    EncodingProfile('jpeg_75_quarter', 'JPEG', quality=75, scale=0.25),
+]
+DEFAULT_PROFILE = PROFILES[0]
+
+
+def get_profile(name, profiles=PROFILES):
+    for profile in profiles:
+        if profile.name == name:
+            return profile
+    raise ValueError(f"Unknown encoding profile '{name}', expected one of {[p.name for p in profiles]}")
+
+
+def _milliseconds(function, values):
+    """Median milliseconds of function(value) over values, and the results."""
+    times = []
+    results = []
+    for value in values:
+        start = time.perf_counter()
+        results.append(function(value))
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), results
+
+
+def calibrate(grab, profiles=PROFILES, frames=CALIBRATION_FRAMES, workers=None, store_level=None):
+    """
+    Measure every profile on `frames` freshly grabbed frames.
+
+    The dispatcher cost (transform and copying the pixels out) is paid once
+    per frame on a single thread, the encode cost is spread over `workers`
+    processes, so a profile sustains at most
+    min(1000 / dispatch_ms, workers * 1000 / encode_ms) frames per second.
+    With `store_level`, frames go to a frame store and the encode cost is
+    zlib compression of the pixels at that level (a keyframe, the worst case)
+    instead of the profile's image format.
+
+    Returns a JSON-serializable dict with the grab time, the frame size and
+    one entry per profile, in the order of `profiles`.
+    """
+    workers = workers or max(1, (os.cpu_count() or 2) - 1)
+    grab_ms, samples = _milliseconds(lambda _: grab(), range(frames))
+    results = []
+    for profile in profiles:
+        transform_ms, images = _milliseconds(profile.transform, samples)
+        copy_ms, payloads = _milliseconds(Image.Image.tobytes, images)
+        if store_level is not None:
+            encode = partial(compress_payload, level=store_level)
+            encode(payloads[0])  # Warm up
+            encode_ms, encoded = _milliseconds(encode, payloads)
+        else:
+            profile.encode(images[0])  # Warm up (loads the format plugin)
+            encode_ms, encoded = _milliseconds(profile.encode, images)
+        dispatch_ms = transform_ms + copy_ms
+        max_fps = min(1000 / dispatch_ms if dispatch_ms else float('inf'),
+                      workers * 1000 / encode_ms if encode_ms else float('inf'))
+        results.append({
+            'profile': profile.name,
+            'size': list(images[0].size),
+            'dispatch_ms': round(dispatch_ms, 3),
+            'encode_ms': round(encode_ms, 3),
+            'bytes_per_frame': int(statistics.mean(len(data) for data in encoded)),
+            'max_fps': round(max_fps, 1),
+        })
+    return {
+        'frames': frames,
+        'workers': workers,
+        'frame_store': store_level is not None,
+        'frame_size': list(samples[0].size),
+        'grab_ms': round(grab_ms, 3),
+        'max_grab_fps': round(1000 / grab_ms, 1) if grab_ms else None,
+        'profiles': results,
+    }
+
+
+def select_profile(calibration, frequency, headroom=HEADROOM, max_bytes_per_second=None):
+    """
+    Calibration entry of the highest-quality profile whose measured maximum
+    rate, times `headroom`, reaches `frequency` and whose output stays within
+    `max_bytes_per_second`. If none does, the fastest profile.
+    """
+    results = calibration['profiles']
+    for result in results:
+        if result['max_fps'] * headroom < frequency:
+            continue
+        if max_bytes_per_second is not None and result['bytes_per_frame'] * frequency > max_bytes_per_second:
+            continue
+        return result
+    return max(results, key=lambda result: result['max_fps'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the screenshot encoding profiles on this machine.")
+    parser.add_argument('--fps', type=float, default=60, help="Target screenshots per second")
+    parser.add_argument('--workers', type=int, default=None, help="Encoder processes (default CPU count - 1)")
+    parser.add_argument('--frames', type=int, default=CALIBRATION_FRAMES, help="Frames measured per profile")
+    parser.add_argument('--max-mb-per-s', type=float, default=None, help="Disk write budget in MB/s")
+    parser.add_argument('--synthetic', metavar='WxH', default=None,
+                        help="Use synthetic frames of this size instead of grabbing the screen")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        from screenshot_pipeline import SyntheticFrameSource
+        width, height = (int(value) for value in args.synthetic.lower().split('x'))
+        grab = SyntheticFrameSource(width, height)
+    else:
+        from PIL import ImageGrab
+        grab = ImageGrab.grab
+
+    calibration = calibrate(grab, frames=args.frames, workers=args.workers)
+    budget = args.max_mb_per_s * 1e6 if args.max_mb_per_s else None
+    selected = select_profile(calibration, args.fps, max_bytes_per_second=budget)
+    width, height = calibration['frame_size']
+    print(f"{width}x{height} frames, grab {calibration['grab_ms']:.1f} ms, {calibration['workers']} workers")
+    print(f"{'profile':20} {'size':>10} {'dispatch':>10} {'encode':>10} {'kB/frame':>10} {'max fps':>8}")
+    for result in calibration['profiles']:
+        marker = '  <- selected' if result is selected else ''
+        size = 'x'.join(str(value) for value in result['size'])
+        print(f"{result['profile']:20} {size:>10} {result['dispatch_ms']:8.1f} ms {result['encode_ms']:7.1f} ms "
+              f"{result['bytes_per_frame'] / 1e3:10.0f} {result['max_fps']:8.1f}{marker}")
+    if calibration['max_grab_fps'] is not None and calibration['max_grab_fps'] < args.fps:
+        print(f"Warning: grabbing alone is limited to {calibration['max_grab_fps']:.1f} fps")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Cheap change detection between consecutive screenshots.
+
+Menus, pauses and loading screens produce long runs of identical or nearly
+identical frames. FrameChangeDetector compares every frame with the last
+frame that was saved and reports duplicates, which the screenshot pipeline
+records as "same as frame N" instead of encoding them again.
+
+With threshold 0 only exact duplicates are skipped: the pixels are compared
+byte for byte with those of the reference (a checksum could collide over a
+long session and drop a changed frame).
+Above 0 the frame is reduced to a small grayscale thumbnail and split into
+tiles; it counts as unchanged when no tile's mean absolute difference to the
+reference exceeds `threshold` gray levels, so small local changes (a
+blinking cursor, a clock) are still caught by their tile.
+"""
+import numpy as np
+from PIL import Image
+
+
+class FrameChangeDetector:
+    """
+    Decide whether a frame is a duplicate of the last saved frame.
+
+    Args:
+        threshold: Largest mean absolute tile difference (0-255 gray levels) still
+            considered unchanged; 0 only skips exact duplicates
+        tiles: (columns, rows) of the tile grid
+        tile_size: Thumbnail pixels per tile side
+    """
+
+    def __init__(self, threshold=0.0, tiles=(16, 9), tile_size=8):
+        self.threshold = threshold
+        self.tiles = tiles
+        self.tile_size = tile_size
+        self._reference = None
+        self._shape = None
+
+        # Counters reported by stats()
+        self.frames = 0
+        self.duplicates = 0
+
+    def _signature(self, image):
+        if self.threshold <= 0:
+            return image.tobytes()
+        columns, rows = self.tiles
+        thumbnail = image.resize((columns * self.tile_size, rows * self.tile_size), Image.BOX).convert('L')
+        return np.asarray(thumbnail, dtype=np.int16)
+
+    def is_duplicate(self, image):
+        """
+        True if the frame doesn't differ from the last saved frame; otherwise
+        it becomes the new reference (it is going to be saved).
+        """
+        self.frames += 1
+        shape = (image.mode, image.size)
+        signature = self._signature(image)
+        if self._reference is not None and shape == self._shape:
+            if self.threshold <= 0:
+                duplicate = signature == self._reference
+            else:
+                columns, rows = self.tiles
+                diff = np.abs(signature - self._reference).reshape(rows, self.tile_size, columns, self.tile_size)
+                duplicate = diff.mean(axis=(1, 3)).max() <= self.threshold
+            if duplicate:
+                self.duplicates += 1
+                return True
+        self._reference = signature
+        self._shape = shape
+        return False
+
+    def stats(self):
+        return {'frames': self.frames, 'duplicates': self.duplicates}
@@ -0,0 +1,372 @@
+"""
+Segmented frame store: screenshots appended to a few large files instead of
+one PNG file per frame.
+
+A store is a directory with segment files (`segment_00000.bin`, ...) that
+frames are appended to sequentially, and an index (`index.bin`) with one
+fixed-size record per frame: timestamp, segment, offset and length of its
+data, image size and whether it is a keyframe or a delta. Keyframes are the
+zlib-compressed raw pixels; the frames in between are stored as the
+zlib-compressed byte-wise difference (mod 256) to their keyframe, which is
+mostly zeros for a static screen. Frames found unchanged by the capture's
+change detector (frame_dedup.py) only get an index record saying which
+frame they are the same as. Any frame is decoded from at most two reads
+(its keyframe and its delta), so random access is O(1).
+
+Records may be appended out of order (frames are compressed in worker
+processes); readers sort the index by timestamp. The record of a delta or
+duplicate is only written once the frame it refers to is: if that frame
+could not be stored, they are dropped (and counted as lost) instead of
+leaving records no reader can decode, and the next frame is a keyframe. Frame stores are exported
+back to individual PNGs with `python frame_store.py export STORE OUT_DIR`.
+"""
+import argparse
+import os
+import threading
+import zlib
+
+import numpy as np
+from PIL import Image
+
+INDEX_NAME = 'index.bin'
+SEGMENT_BYTES = 1024 * 1024 * 1024
+KEYFRAME_INTERVAL = 60
+COMPRESSION_LEVEL = 1
+
+KEYFRAME = 0
+DELTA = 1
+DUPLICATE = 2
+MODES = ('RGB', 'RGBA', 'L')
+
+INDEX_DTYPE = np.dtype([
+    ('t_ns', '<i8'),     # Capture time (Unix nanoseconds)
+    ('seq', '<i8'),      # Frame sequence number
+    ('key_seq', '<i8'),  # Keyframe a delta is relative to, frame a duplicate is the same as (own seq for keyframes)
+    ('offset', '<i8'),   # Byte offset of the data in its segment
+    ('length', '<u4'),   # Byte length of the compressed data
+    ('segment', '<u2'),
+    ('width', '<u2'),
+    ('height', '<u2'),
+    ('kind', 'u1'),      # KEYFRAME, DELTA or DUPLICATE
+    ('mode', 'u1'),      # Index into MODES
+])
+
+
+def segment_name(segment):
+    return f"segment_{segment:05d}.bin"
+
+
+def compress_payload(payload, level=COMPRESSION_LEVEL):
+    """Worker process entry point: compress the raw pixels or delta of one frame."""
+    return zlib.compress(payload, level)
+
+
+class FrameStoreWriter:
+    """
+    Append frames to a frame store.
+
+    Adding a frame is split in two steps so the expensive compression can run
+    elsewhere: prepare() (in capture order) decides keyframe or delta and
+    computes the payload, and add_compressed() (any order, thread-safe)
+    appends the compressed payload and its index record, or add_failed()
+    reports that the payload could not be compressed. append() does both.
+
+    Args:
+        folder: Store directory (created if missing; an existing store is appended to)
+        keyframe_interval: Frames per keyframe (1 stores every frame as a keyframe)
+        compression_level: zlib level of the payloads
+        segment_bytes: Segment size at which a new segment file is started
+    """
+
+    def __init__(self, folder, keyframe_interval=KEYFRAME_INTERVAL, compression_level=COMPRESSION_LEVEL,
+                 segment_bytes=SEGMENT_BYTES):
+        self.folder = folder
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.compression_level = compression_level
+        self.segment_bytes = segment_bytes
+        os.makedirs(folder, exist_ok=True)
+
+        index_path = os.path.join(folder, INDEX_NAME)
+        existing = _read_index(index_path)
+        self._seq = int(existing['seq'].max()) + 1 if len(existing) else 0
+        self.segment = int(existing['segment'].max()) if len(existing) else 0
+        self._lock = threading.Lock()
+        self._index = open(index_path, 'ab')
+        # Drop a record left half-written by an interrupted session so new records stay aligned
+        self._index.truncate(existing.nbytes)
+        self._segment_file = self._open_segment()
+
+        self._key = None
+        self._key_seq = -1
+        self._key_shape = None
+        self._last_seq = -1
+        # Prepared frames not stored yet, with the (seq, record) of the deltas and duplicates waiting for them
+        self._pending = {}
+        # Frames that could not be stored (and the ones depending on them)
+        self._failed = set()
+        self._new_keyframe = False
+
+        # Counters reported by stats()
+        self.frames = 0
+        self.keyframes = 0
+        self.duplicates = 0
+        self.lost = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+
+    def _open_segment(self):
+        # Large buffer so frames reach the disk in big sequential writes
+        return open(os.path.join(self.folder, segment_name(self.segment)), 'ab', buffering=8 * 1024 * 1024)
+
+    def prepare(self, t_ns, image):
+        """
+        Decide how to store a frame. Must be called in capture order.
+
+        Returns the job (t_ns, seq, key_seq, kind, mode, size, payload) whose
+        payload is to be compressed and passed to add_compressed().
+        """
+        data = np.frombuffer(image.tobytes(), dtype=np.uint8)
+        shape = (image.mode, image.size)
+        seq = self._seq
+        self._seq += 1
+        self._last_seq = seq
+        with self._lock:
+            self._pending[seq] = []
+            # The last keyframe could not be stored: its deltas would be lost too
+            new_keyframe, self._new_keyframe = self._new_keyframe, False
+        if (new_keyframe or self._key is None or shape != self._key_shape
+                or seq - self._key_seq >= self.keyframe_interval):
+            self._key, self._key_seq, self._key_shape = data, seq, shape
+            return t_ns, seq, seq, KEYFRAME, image.mode, image.size, data.tobytes()
+        return t_ns, seq, self._key_seq, DELTA, image.mode, image.size, (data - self._key).tobytes()
+
+    def add_compressed(self, job, compressed):
+        """Append the compressed payload of a prepared job. Returns the bytes stored."""
+        t_ns, seq, key_seq, kind, mode, size, payload = job
+        with self._lock:
+            if key_seq in self._failed:
+                # Its keyframe could not be stored
+                self._drop(seq)
+                return 0
+            offset = self._segment_file.tell()
+            if offset and offset + len(compressed) > self.segment_bytes:
+                self._segment_file.close()
+                self.segment += 1
+                self._segment_file = self._open_segment()
+                offset = 0
+            self._segment_file.write(compressed)
+            record = np.array([(t_ns, seq, key_seq, offset, len(compressed), self.segment, size[0], size[1],
+                                kind, MODES.index(mode))], dtype=INDEX_DTYPE)
+            self.raw_bytes += len(payload)
+            self.stored_bytes += len(compressed)
+            if kind == DELTA and key_seq in self._pending:
+                # Written once its keyframe is
+                self._pending[key_seq].append((seq, record))
+            else:
+                self._write_record(seq, record)
+        return len(compressed)
+
+    def add_failed(self, job):
+        """Report that a prepared job could not be compressed (thread-safe)."""
+        with self._lock:
+            self._drop(job[1])
+            if job[3] == KEYFRAME:
+                self._new_keyframe = True
+
+    def add_duplicate(self, t_ns):
+        """
+        Record that the frame captured at t_ns is the same as the last prepared
+        frame. Must be called in capture order, like prepare(). Returns False
+        (and records nothing) if that frame could not be stored: the frame has
+        to be stored like any other then.
+        """
+        with self._lock:
+            if self._last_seq < 0 or self._last_seq in self._failed:
+                return False
+            seq = self._seq
+            self._seq += 1
+            record = np.array([(t_ns, seq, self._last_seq, 0, 0, 0, 0, 0, DUPLICATE, 0)], dtype=INDEX_DTYPE)
+            if self._last_seq in self._pending:
+                self._pending[self._last_seq].append((seq, record))
+            else:
+                self._write_record(seq, record)
+        return True
+
+    def _write_record(self, seq, record):
+        """Write an index record, then the records that were waiting for it (under the lock)."""
+        self._index.write(record.tobytes())
+        kind = int(record['kind'][0])
+        if kind == DUPLICATE:
+            self.duplicates += 1
+        else:
+            self.frames += 1
+            self.keyframes += kind == KEYFRAME
+        for waiting in self._pending.pop(seq, ()):
+            self._write_record(*waiting)
+
+    def _drop(self, seq):
+        """Give up on a frame and the records waiting for it (under the lock)."""
+        self._failed.add(seq)
+        self.lost += 1
+        for waiting, _ in self._pending.pop(seq, ()):
+            self._drop(waiting)
+
+    def append(self, t_ns, image):
+        """Prepare, compress and append one frame in the calling thread."""
+        job = self.prepare(t_ns, image)
+        try:
+            compressed = compress_payload(job[-1], self.compression_level)
+        except Exception:
+            self.add_failed(job)
+            raise
+        return self.add_compressed(job, compressed)
+
+    def flush(self):
+        with self._lock:
+            self._segment_file.flush()
+            self._index.flush()
+
+    def close(self):
+        with self._lock:
+            self._segment_file.close()
+            self._index.close()
+
+    def stats(self):
+        """Return frame counts and the compression ratio."""
+        return {
+            'frames': self.frames,
+            'keyframes': self.keyframes,
+            'duplicates': self.duplicates,
+            'lost': self.lost,
+            'raw_bytes': self.raw_bytes,
+            'stored_bytes': self.stored_bytes,
+            'ratio': self.raw_bytes / self.stored_bytes if self.stored_bytes else 0.0,
+        }
+
+
+def _read_index(path):
+    """Index records in file order (a partially written last record is ignored)."""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return np.zeros(0, dtype=INDEX_DTYPE)
+    return np.frombuffer(data[:len(data) - len(data) % INDEX_DTYPE.itemsize], dtype=INDEX_DTYPE)
+
+
+class FrameStore:
+    """
+    Read frames from a frame store.
+
+    Frames are ordered by timestamp: `timestamps` holds the capture time of
+    every frame, frame(i) decodes the i-th one and frame_at(t_ns) the last one
+    captured at or before t_ns.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        records = _read_index(os.path.join(folder, INDEX_NAME))
+        # Frames whose data (or keyframe) never made it to disk (interrupted session) are skipped
+        sizes = np.zeros(int(records['segment'].max()) + 1 if len(records) else 0, dtype=np.int64)
+        for segment in np.unique(records['segment']).tolist():
+            path = os.path.join(folder, segment_name(segment))
+            sizes[segment] = os.path.getsize(path) if os.path.exists(path) else 0
+        records = records[(records['kind'] == DUPLICATE) |
+                          (records['offset'] + records['length'] <= sizes[records['segment']])]
+        stored = records[records['kind'] != DUPLICATE]
+        stored = stored[np.isin(stored['key_seq'], stored['seq'][stored['kind'] == KEYFRAME])]
+        duplicates = records[records['kind'] == DUPLICATE]
+        records = np.concatenate((stored, duplicates[np.isin(duplicates['key_seq'], stored['seq'])]))
+
+        self.records = records[np.lexsort((records['seq'], records['t_ns']))]
+        self.timestamps = self.records['t_ns']
+        self._row_of_seq = {seq: row for row, seq in enumerate(self.records['seq'].tolist())}
+        self._files = {}
+
+    def __len__(self):
+        return len(self.records)
+
+    def _read(self, record):
+        segment = int(record['segment'])
+        f = self._files.get(segment)
+        if f is None:
+            f = self._files[segment] = open(os.path.join(self.folder, segment_name(segment)), 'rb')
+        f.seek(int(record['offset']))
+        return zlib.decompress(f.read(int(record['length'])))
+
+    def frame(self, i):
+        """Decode the i-th frame (in timestamp order) as a PIL image."""
+        record = self.records[i]
+        if record['kind'] == DUPLICATE:
+            return self.frame(self._row_of_seq[int(record['key_seq'])])
+        data = self._read(record)
+        if record['kind'] == DELTA:
+            key = self.records[self._row_of_seq[int(record['key_seq'])]]
+            data = (np.frombuffer(self._read(key), dtype=np.uint8) +
+                    np.frombuffer(data, dtype=np.uint8)).tobytes()
+        return Image.frombytes(MODES[record['mode']], (int(record['width']), int(record['height'])), data)
+
+    def index_at(self, t_ns):
+        """Index of the last frame captured at or before t_ns (-1 if there is none)."""
+        return int(np.searchsorted(self.timestamps, t_ns, side='right')) - 1
+
+    def frame_at(self, t_ns):
+        """(timestamp, image) of the last frame captured at or before t_ns, or None."""
+        i = self.index_at(t_ns)
+        if i < 0:
+            return None
+        return int(self.timestamps[i]), self.frame(i)
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+
+
+def export_pngs(folder, out_dir, start_ns=None, end_ns=None):
+    """Write the frames of a store (optionally within a time range) as individual PNGs. Returns the count."""
+    # Imported here so reading a store doesn't pull in the capture pipeline
+    from screenshot_pipeline import screenshot_filename
+
+    store = FrameStore(folder)
+    os.makedirs(out_dir, exist_ok=True)
+    first = 0 if start_ns is None else int(np.searchsorted(store.timestamps, start_ns, side='left'))
+    last = len(store) if end_ns is None else int(np.searchsorted(store.timestamps, end_ns, side='right'))
+    try:
+        for i in range(first, last):
+            store.frame(i).save(os.path.join(out_dir, screenshot_filename(int(store.timestamps[i]))), 'PNG')
+    finally:
+        store.close()
+    return max(last - first, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or export a segmented frame store.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    info = subparsers.add_parser('info', help="Print frame counts, time span and size")
+    info.add_argument('store')
+    export = subparsers.add_parser('export', help="Write the frames as individual PNG files")
+    export.add_argument('store')
+    export.add_argument('out_dir')
+    export.add_argument('--start', type=float, default=None, help="Unix time of the first frame to export")
+    export.add_argument('--end', type=float, default=None, help="Unix time of the last frame to export")
+    args = parser.parse_args()
+
+    if args.command == 'info':
+        store = FrameStore(args.store)
+        records = store.records
+        stored = int(records['length'].sum())
+        print(f"{len(store)} frames ({int((records['kind'] == KEYFRAME).sum())} keyframes, "
+              f"{int((records['kind'] == DUPLICATE).sum())} duplicates), "
+              f"{stored / 1e6:.1f} MB in {len(np.unique(records['segment']))} segments")
+        if len(store):
+            print(f"From {store.timestamps[0] / 1e9:.3f} to {store.timestamps[-1] / 1e9:.3f}")
+    else:
+        start_ns = int(args.start * 1e9) if args.start is not None else None
+        end_ns = int(args.end * 1e9) if args.end is not None else None
+        count = export_pngs(args.store, args.out_dir, start_ns, end_ns)
+        print(f"Exported {count} frames to {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
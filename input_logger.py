@@ -0,0 +1,182 @@
+"""
+Platform-independent input event logging.
+
+InputLogger receives the callbacks of a capture backend (keyboard, mouse
+buttons and scroll, raw mouse deltas), applies the logger's rules (key
+state tracking with periodic state checkpoints, raw mouse aggregation, ESC
+x5 to stop) and writes the
+events to a LogWriter. combined_logger drives it from pynput and Windows
+raw input; the synthetic backend in backends.py drives it for benchmarks.
+"""
+import threading
+import time
+
+from binary_log import (Event, EVENT_KEY_PRESS, EVENT_KEY_RELEASE, EVENT_MOUSE_MOVE,
+                        EVENT_BUTTON_PRESS, EVENT_BUTTON_RELEASE, EVENT_SCROLL, EVENT_KEY_STATE)
+from key_state import CHECKPOINT_INTERVAL_NS, KeyState, key_vk
+from mouse_aggregator import DeltaAggregator
+
+ESC_KEY = 'Key.esc'
+ESC_PRESSES_TO_STOP = 5
+
+
+def _key_name(key):
+    """Character of a key, or the key itself for special keys (pynput Key members have no char)."""
+    try:
+        return key.char
+    except AttributeError:
+        return key
+
+
+class InputLogger:
+    """
+    Log the input events delivered by a capture backend.
+
+    The callbacks take the same arguments as the pynput listener callbacks
+    (keys are anything with an optional `char` attribute whose str() is
+    unique per key, like pynput keys). Raw mouse deltas go through a
+    DeltaAggregator; aggregation is thread-safe, so raw input and poll_mouse()
+    may be called from different threads.
+
+    Held keys and buttons are tracked as a KeyState bitset of virtual-key
+    codes, and the whole state is logged as a KEY STATE checkpoint with the
+    first event after every `checkpoint_ns`, so "what was held at time t"
+    can be answered from the nearest checkpoint (see key_state.py).
+
+    Args:
+        writer: LogWriter (or BinaryLogWriter) the events are written to
+        mouse_bin_ns: Raw mouse aggregation bin width in nanoseconds (0 = log every event)
+        on_stop: Called once when ESC is pressed ESC_PRESSES_TO_STOP times in a row
+        clock: Clock returning integer nanoseconds for event timestamps (SessionClock.now_ns
+            in combined_logger)
+        checkpoint_ns: Minimum time between key state checkpoints (0 = no checkpoints)
+    """
+
+    def __init__(self, writer, mouse_bin_ns=0, on_stop=None, clock=time.time_ns,
+                 checkpoint_ns=CHECKPOINT_INTERVAL_NS):
+        self.writer = writer
+        self.on_stop = on_stop
+        self.clock = clock
+        self.checkpoint_ns = checkpoint_ns
+        self.mouse_aggregator = DeltaAggregator(
+            lambda t_ns, dx, dy: self.log_event(EVENT_MOUSE_MOVE, dx=dx, dy=dy, t_ns=t_ns),
+            bin_ns=mouse_bin_ns, clock=clock)
+
+        self.stopped = False
+        self.esc_pressed = 0
+        # Held keys and buttons, to only log state changes; `known_keys` has a bit
+        # for every key seen at all. Keys without a virtual-key code are tracked
+        # by str(key) in the two sets instead (and are not in the checkpoints)
+        self.key_state = KeyState()
+        self.known_keys = 0
+        self.held_unmapped = set()
+        self.known_unmapped = set()
+        self.checkpoints = 0
+        self._next_checkpoint_ns = 0 if checkpoint_ns else None
+        # Reentrant: a key event under the lock may trigger a checkpoint
+        self._state_lock = threading.RLock()
+        self._mouse_lock = threading.Lock()
+
+    def write_log(self, message):
+        """Queue a plain log line."""
+        self.writer.write(message)
+
+    def log_event(self, event_type, name=None, dx=0, dy=0, t_ns=None):
+        """
+        Queue one input event. It is formatted (or packed, for the binary
+        writer) on the writer thread, not on the calling capture thread.
+        """
+        if t_ns is None:
+            t_ns = self.clock()
+        self.writer.write(Event(t_ns, event_type, name, dx, dy))
+        if self._next_checkpoint_ns is not None and t_ns >= self._next_checkpoint_ns:
+            self.write_checkpoint(t_ns)
+
+    def write_checkpoint(self, t_ns=None):
+        """Log the whole key/button state."""
+        with self._state_lock:
+            if t_ns is None:
+                t_ns = self.clock()
+            self.writer.write(Event(t_ns, EVENT_KEY_STATE, self.key_state.to_hex(), 0, 0))
+            self.checkpoints += 1
+            if self.checkpoint_ns:
+                self._next_checkpoint_ns = t_ns + self.checkpoint_ns
+
+    def request_checkpoint(self):
+        """Log a checkpoint with the next event (a new log segment then starts with the full state)."""
+        if self._next_checkpoint_ns is not None:
+            self._next_checkpoint_ns = 0
+
+    def _set_held(self, key, name, held):
+        """Update the state of a key or button. Returns whether it changed."""
+        vk = key_vk(key, name)
+        if vk is None:
+            key_str = str(key)
+            if held:
+                changed = key_str not in self.held_unmapped
+                self.held_unmapped.add(key_str)
+            else:
+                changed = key_str in self.held_unmapped or key_str not in self.known_unmapped
+                self.held_unmapped.discard(key_str)
+            self.known_unmapped.add(key_str)
+            return changed
+        if held:
+            changed = self.key_state.press(vk)
+        else:
+            # A key first seen released (held since before logging started) is logged too
+            changed = self.key_state.release(vk) or not self.known_keys >> vk & 1
+        self.known_keys |= 1 << vk
+        return changed
+
+    def on_press(self, key):
+        # Only log if the key wasn't already pressed
+        name = _key_name(key)
+        with self._state_lock:
+            if self._set_held(key, str(name), True):
+                self.log_event(EVENT_KEY_PRESS, name)
+
+    def on_release(self, key):
+        """Returns False (stopping a pynput listener) once ESC has been pressed enough times."""
+        # Only log if the key was previously pressed
+        name = _key_name(key)
+        key_str = str(key)
+        with self._state_lock:
+            if self._set_held(key, str(name), False):
+                self.log_event(EVENT_KEY_RELEASE, name)
+
+        # Keep the 'Esc' key logging but terminate on five 'Esc' presses
+        if key_str == ESC_KEY:
+            self.esc_pressed += 1
+            if self.esc_pressed == ESC_PRESSES_TO_STOP:
+                self.stopped = True
+                if self.on_stop:
+                    self.on_stop()
+                return False
+        else:
+            self.esc_pressed = 0
+
+    def on_click(self, x, y, button, pressed):
+        if self.stopped:
+            return False
+        with self._state_lock:
+            self._set_held(button, str(button), pressed)
+            self.log_event(EVENT_BUTTON_PRESS if pressed else EVENT_BUTTON_RELEASE, button)
+
+    def on_scroll(self, x, y, dx, dy):
+        self.log_event(EVENT_SCROLL, dx=dx, dy=dy)
+
+    def on_raw_mouse(self, dx, dy):
+        """Relative hardware mouse movement; zero movements are ignored."""
+        if dx or dy:
+            with self._mouse_lock:
+                self.mouse_aggregator.add(dx, dy)
+
+    def poll_mouse(self):
+        """Emit the pending raw mouse bin if its time span has passed."""
+        with self._mouse_lock:
+            self.mouse_aggregator.poll()
+
+    def flush_mouse(self):
+        """Emit the pending raw mouse bin."""
+        with self._mouse_lock:
+            self.mouse_aggregator.flush()
@@ -0,0 +1,402 @@
+"""
+Keyboard and mouse button state as a bitset of Windows virtual-key codes.
+
+KeyState keeps the held keys and buttons as one 256-bit integer (bit `vk`
+set while virtual key `vk` is down), which InputLogger uses to log only
+state changes and to write periodic checkpoint records:
+
+    1711031445.123456789 - KEY STATE: 10000000000000000008000000000000000000002
+
+with the whole bitset in hexadecimal (here left button, W and left Shift). Logged key and button names map back
+to virtual-key codes with vk_for_name(); names without a fixed code (keys
+of non-US layouts) are still covered by the checkpoints, which carry the
+code reported by the keyboard hook.
+
+KeyStateIndex answers "what was held at time t" without replaying the
+session from the start: it stores the state at regular points of the log
+(every logged checkpoint, and one per CHECKPOINT_INTERVAL_NS for logs
+written without them) with their byte offset (record number for binary
+logs), so a query starts from the nearest earlier entry and only reads the
+events up to the next one. Indexes are sidecars in the log cache directory.
+
+Usage:
+    python key_state.py "logs/2024-03-21 14-30-45_log.txt" 1711031445.5 1711031460
+"""
+import argparse
+import os
+
+import numpy as np
+
+from binary_log import (EVENT_BUTTON_PRESS, EVENT_BUTTON_RELEASE, EVENT_KEY_PRESS, EVENT_KEY_RELEASE,
+                        EVENT_KEY_STATE, read_binary_log)
+from log_cache import cache_key, save_arrays, sidecar_path
+from log_frames import open_log
+from log_parser import KEY_STATE_WORDS, iter_chunks, key_state_words, parse_bytes, timestamp_to_ns
+
+CHECKPOINT_INTERVAL_NS = 1_000_000_000
+CHUNK_RECORDS = 1_000_000
+
+# Windows virtual-key codes of pynput special keys and mouse buttons, by logged name
+VK_CODES = {
+    'Button.left': 0x01, 'Button.right': 0x02, 'Button.middle': 0x04, 'Button.x1': 0x05, 'Button.x2': 0x06,
+    'Key.backspace': 0x08, 'Key.tab': 0x09, 'Key.enter': 0x0D, 'Key.shift': 0x10, 'Key.ctrl': 0x11,
+    'Key.alt': 0x12, 'Key.pause': 0x13, 'Key.caps_lock': 0x14, 'Key.esc': 0x1B, 'Key.space': 0x20,
+    'Key.page_up': 0x21, 'Key.page_down': 0x22, 'Key.end': 0x23, 'Key.home': 0x24, 'Key.left': 0x25,
+    'Key.up': 0x26, 'Key.right': 0x27, 'Key.down': 0x28, 'Key.print_screen': 0x2C, 'Key.insert': 0x2D,
+    'Key.delete': 0x2E, 'Key.cmd': 0x5B, 'Key.cmd_l': 0x5B, 'Key.cmd_r': 0x5C, 'Key.menu': 0x5D,
+    'Key.num_lock': 0x90, 'Key.scroll_lock': 0x91, 'Key.shift_l': 0xA0, 'Key.shift_r': 0xA1,
+    'Key.ctrl_l': 0xA2, 'Key.ctrl_r': 0xA3, 'Key.alt_l': 0xA4, 'Key.alt_r': 0xA5, 'Key.alt_gr': 0xA5,
+    'Key.media_volume_mute': 0xAD, 'Key.media_volume_down': 0xAE, 'Key.media_volume_up': 0xAF,
+    'Key.media_next': 0xB0, 'Key.media_previous': 0xB1, 'Key.media_play_pause': 0xB3,
+}
+VK_CODES.update({f'Key.f{n}': 0x6F + n for n in range(1, 25)})
+# Characters of the US layout keys that are not letters or digits (shifted and unshifted)
+_OEM_KEYS = {';:': 0xBA, '=+': 0xBB, ',<': 0xBC, '-_': 0xBD, '.>': 0xBE, '/?': 0xBF, '`~': 0xC0,
+             '[{': 0xDB, '\\|': 0xDC, ']}': 0xDD, '\'"': 0xDE}
+_CHAR_CODES = {char: vk for chars, vk in _OEM_KEYS.items() for char in chars}
+_CHAR_CODES.update({char: ord(digit) for char, digit in zip(')!@#$%^&*(', '0123456789')})
+_CHAR_CODES[' '] = 0x20
+# Preferred name of every code, for display
+VK_NAMES = {}
+for _name, _vk in VK_CODES.items():
+    VK_NAMES.setdefault(_vk, _name)
+
+
+def vk_for_name(name):
+    """Virtual-key code of a logged key or button name, or None if it has no fixed code."""
+    vk = VK_CODES.get(name)
+    if vk is not None or not name:
+        return vk
+    if len(name) != 1:
+        return None
+    if name.isascii() and name.isalnum():
+        return ord(name.upper())
+    if '\x01' <= name <= '\x1a':
+        # Control characters reported for Ctrl+letter
+        return 0x40 + ord(name)
+    return _CHAR_CODES.get(name)
+
+
+def name_for_vk(vk):
+    """Readable name of a virtual-key code."""
+    name = VK_NAMES.get(vk)
+    if name is not None:
+        return name
+    if 0x30 <= vk <= 0x39 or 0x41 <= vk <= 0x5A:
+        return chr(vk).lower()
+    return f'vk_{vk:#04x}'
+
+
+def key_vk(key, name):
+    """
+    Virtual-key code of a pynput key or button: the code of its logged name,
+    else the one reported by the hook (keys of other layouts), else None.
+    """
+    vk = vk_for_name(name)
+    if vk is None:
+        vk = getattr(key, 'vk', None)
+        if vk is None:
+            vk = getattr(getattr(key, 'value', None), 'vk', None)
+    return vk if vk is not None and 0 <= vk < 256 else None
+
+
+def words_to_bits(words):
+    """Bitset integer of KEY_STATE_WORDS uint64 words."""
+    bits = 0
+    for i, word in enumerate(int(word) for word in words):
+        bits |= word << (64 * i)
+    return bits
+
+
+def held_codes(bits):
+    """Sorted virtual-key codes set in a bitset."""
+    codes = []
+    while bits:
+        low = bits & -bits
+        codes.append(low.bit_length() - 1)
+        bits ^= low
+    return codes
+
+
+class KeyState:
+    """Held keys and buttons as a bitset of virtual-key codes."""
+
+    def __init__(self, bits=0):
+        self.bits = bits
+
+    def press(self, vk):
+        """Mark a key as held. Returns False if it already was."""
+        mask = 1 << vk
+        if self.bits & mask:
+            return False
+        self.bits |= mask
+        return True
+
+    def release(self, vk):
+        """Mark a key as released. Returns False if it already was."""
+        mask = 1 << vk
+        if not self.bits & mask:
+            return False
+        self.bits &= ~mask
+        return True
+
+    def is_held(self, vk):
+        return bool(self.bits >> vk & 1)
+
+    def held(self):
+        return held_codes(self.bits)
+
+    def to_hex(self):
+        """Checkpoint text of the state."""
+        return f"{self.bits:x}"
+
+
+def parse_state(text):
+    """State bitset of a checkpoint's text, or None if it is not valid hex."""
+    try:
+        return int(text, 16)
+    except ValueError:
+        return None
+
+
+class KeyStateIndex:
+    """
+    Key/button state at regular points of one log.
+
+    Attributes:
+        log_path: The indexed log
+        t_ns: Time of each entry
+        offsets: Byte offset (record number for binary logs) from which the events
+            after each entry are read
+        states: State at each entry as KEY_STATE_WORDS uint64 words
+        end: Size of the log in bytes (records for binary logs)
+    """
+
+    def __init__(self, log_path, t_ns, offsets, states, end):
+        self.log_path = log_path
+        self.t_ns = t_ns
+        self.offsets = offsets
+        self.states = states
+        self.end = end
+        self.binary = log_path.endswith('.bin')
+        self._binary_log = None
+
+    def __len__(self):
+        return len(self.t_ns)
+
+    def held_at(self, t_ns):
+        """Virtual-key codes held at t_ns (events at exactly t_ns included)."""
+        return held_codes(self.state_at(t_ns))
+
+    def names_at(self, t_ns):
+        """Names of the keys and buttons held at t_ns."""
+        return [name_for_vk(vk) for vk in self.held_at(t_ns)]
+
+    def state_at(self, t_ns):
+        """State bitset at t_ns, from the nearest earlier entry and the events up to the next one."""
+        entry = int(np.searchsorted(self.t_ns, t_ns, side='right')) - 1
+        if entry < 0:
+            state, begin = 0, 0
+        else:
+            state, begin = words_to_bits(self.states[entry]), int(self.offsets[entry])
+        end = int(self.offsets[entry + 1]) if entry + 1 < len(self.offsets) else self.end
+        if self.binary:
+            if self._binary_log is None:
+                self._binary_log = read_binary_log(self.log_path)
+            records, names = self._binary_log
+            events = _binary_state_events(np.asarray(records[begin:end]), names)
+        else:
+            with open_log(self.log_path) as f:
+                f.seek(begin)
+                events = _text_state_events(parse_bytes(f.read(end - begin)))
+        for _, event_t, kind, value in events:
+            if event_t > t_ns:
+                break
+            state = _apply(state, kind, value)
+        return state
+
+
+# Kinds of state events (position, t_ns, kind, value); value is a vk code or a whole bitset
+_PRESS = 0
+_RELEASE = 1
+_CHECKPOINT = 2
+
+
+def _apply(state, kind, value):
+    if kind == _PRESS:
+        return state | (1 << value)
+    if kind == _RELEASE:
+        return state & ~(1 << value)
+    return value
+
+
+def _text_state_events(data):
+    """State events of parsed text, positioned by line number, in line order."""
+    codes = [vk_for_name(name) for name in data.names]
+    events = []
+    for table in (data.keys, data.buttons):
+        for line, t_ns, pressed, code in zip(table['line'].tolist(), table['t_ns'].tolist(),
+                                             table['pressed'].tolist(), table['code'].tolist()):
+            if codes[code] is not None:
+                events.append((line, t_ns, _PRESS if pressed else _RELEASE, codes[code]))
+    checkpoints = data.key_states
+    for line, t_ns, words in zip(checkpoints['line'].tolist(), checkpoints['t_ns'].tolist(),
+                                 checkpoints['state'].tolist()):
+        events.append((line, t_ns, _CHECKPOINT, words_to_bits(words)))
+    events.sort()
+    return events
+
+
+_STATE_KINDS = {EVENT_KEY_PRESS: _PRESS, EVENT_BUTTON_PRESS: _PRESS, EVENT_KEY_RELEASE: _RELEASE,
+                EVENT_BUTTON_RELEASE: _RELEASE, EVENT_KEY_STATE: _CHECKPOINT}
+
+
+def _binary_state_events(records, names):
+    """State events of binary records, positioned by record number in `records`."""
+    positions = np.flatnonzero(np.isin(records['type'], list(_STATE_KINDS)))
+    selected = records[positions]
+    events = []
+    for position, t_ns, code, event_type in zip(positions.tolist(), selected['t_ns'].tolist(),
+                                                selected['code'].tolist(), selected['type'].tolist()):
+        name = names[code] if code < len(names) else ''
+        kind = _STATE_KINDS[event_type]
+        value = parse_state(name) if kind == _CHECKPOINT else vk_for_name(name)
+        if value is not None:
+            events.append((position, t_ns, kind, value))
+    return events
+
+
+class _IndexBuilder:
+    """
+    Replays the state events of a log chunk by chunk and adds an index entry
+    after every logged checkpoint and at the first event of every interval.
+
+    Aggregated movements can be written up to two bins after their timestamp,
+    so record times are not sorted. Entries take the latest time seen up to
+    their record instead: the index stays sorted for np.searchsorted, and no
+    entry includes an event later than its own time.
+    """
+
+    def __init__(self, interval_ns):
+        self.interval_ns = interval_ns
+        self.state = 0
+        self.last_interval = None
+        self.latest_t_ns = None
+        self.t_ns, self.offsets, self.states = [], [], []
+
+    def add(self, t_ns, offset):
+        self.t_ns.append(int(t_ns))
+        self.offsets.append(int(offset))
+        self.states.append(key_state_words(self.state))
+
+    def feed(self, times, ends, events):
+        """
+        times, ends: time and end offset of every timestamped line (record) of a chunk
+        events: its state events, positioned by index into `times`
+        """
+        if not len(times):
+            return
+        times = np.maximum.accumulate(times)
+        if self.latest_t_ns is not None:
+            times = np.maximum(times, self.latest_t_ns)
+        self.latest_t_ns = times[-1]
+        intervals = times // self.interval_ns
+        previous = intervals[0] - 1 if self.last_interval is None else self.last_interval
+        boundaries = np.flatnonzero(np.diff(intervals, prepend=previous)).tolist()
+        self.last_interval = intervals[-1]
+        events = iter(events)
+        pending = next(events, None)
+        for boundary in boundaries + [len(times)]:
+            while pending is not None and pending[0] <= boundary:
+                position, _, kind, value = pending
+                self.state = _apply(self.state, kind, value)
+                if kind == _CHECKPOINT and position != boundary:
+                    self.add(times[position], ends[position])
+                pending = next(events, None)
+            if boundary < len(times):
+                self.add(times[boundary], ends[boundary])
+
+    def build(self, log_path, end):
+        return KeyStateIndex(log_path, np.array(self.t_ns, dtype=np.int64), np.array(self.offsets, dtype=np.int64),
+                             np.array(self.states, dtype=np.uint64).reshape(-1, KEY_STATE_WORDS), end)
+
+
+def build_key_index(log_path, interval_ns=CHECKPOINT_INTERVAL_NS):
+    """Build the KeyStateIndex of a text or binary log with one pass over it."""
+    builder = _IndexBuilder(interval_ns)
+    if log_path.endswith('.bin'):
+        records, names = read_binary_log(log_path)
+        for begin in range(0, len(records), CHUNK_RECORDS):
+            chunk = np.asarray(records[begin:begin + CHUNK_RECORDS])
+            ends = np.arange(begin + 1, begin + len(chunk) + 1)
+            builder.feed(chunk['t_ns'], ends, _binary_state_events(chunk, names))
+        return builder.build(log_path, len(records))
+
+    offset = 0
+    with open_log(log_path) as f:
+        for chunk in iter_chunks(f):
+            data = parse_bytes(chunk)
+            line_ends = np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == 10) + 1
+            if len(line_ends) < data.n_lines:
+                line_ends = np.append(line_ends, len(chunk))
+            tables = (data.moves, data.keys, data.buttons, data.scrolls, data.key_states)
+            lines = np.concatenate([table['line'] for table in tables])
+            order = np.argsort(lines, kind='stable')
+            lines = lines[order]
+            times = np.concatenate([table['t_ns'] for table in tables])[order]
+            events = _text_state_events(data)
+            positions = np.searchsorted(lines, [event[0] for event in events]).tolist()
+            builder.feed(times, offset + line_ends[lines],
+                         [(position,) + event[1:] for position, event in zip(positions, events)])
+            offset += len(chunk)
+    return builder.build(log_path, offset)
+
+
+def load_key_index(log_path, cache_dir=None, interval_ns=CHECKPOINT_INTERVAL_NS):
+    """Return the KeyStateIndex of a log from its sidecar, building and saving it if needed."""
+    key = cache_key(log_path)
+    sidecar = sidecar_path(log_path, cache_dir, suffix='.keys.npz')
+    if os.path.exists(sidecar):
+        try:
+            with np.load(sidecar) as arrays:
+                if tuple(arrays['key'].tolist()) == (key[1], key[2], interval_ns):
+                    os.utime(sidecar)
+                    return KeyStateIndex(log_path, arrays['t_ns'], arrays['offsets'], arrays['states'],
+                                         int(arrays['end']))
+        except (OSError, ValueError, KeyError):
+            pass
+
+    index = build_key_index(log_path, interval_ns)
+    try:
+        save_arrays(sidecar, {
+            'key': np.array([key[1], key[2], interval_ns], dtype=np.int64),
+            't_ns': index.t_ns,
+            'offsets': index.offsets,
+            'states': index.states,
+            'end': np.array(index.end),
+        })
+    except OSError as e:
+        print(f"Could not write key state index {sidecar}: {e}")
+    return index
+
+
+def held_at(log_path, t_ns, cache_dir=None):
+    """Virtual-key codes held at t_ns in a log (loading or building its index)."""
+    return load_key_index(log_path, cache_dir).held_at(t_ns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print the keys and buttons held at given times of a session log.")
+    parser.add_argument('log', help="Text (_log.txt) or binary (_log.bin) session log")
+    parser.add_argument('times', nargs='+', help="Unix timestamps (seconds with decimals, as in the log)")
+    args = parser.parse_args()
+
+    index = load_key_index(args.log)
+    for text in args.times:
+        seconds, _, fraction = text.partition('.')
+        names = index.names_at(timestamp_to_ns(seconds, fraction))
+        print(f"{text}: {', '.join(names) if names else '(nothing held)'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Center-return cleaning while a session is being logged.
+
+clean_mouse_data.py removes game-induced counter-movements in a separate pass
+that re-reads and rewrites every log. The writers here run the same
+CenterReturnFilter on the log writer thread instead: every line written to
+the log is also pushed through the filter, and the decided lines are
+appended to the cleaned log (`<log>_cleaned.txt`, next to the raw one) as
+the session goes.
+
+The filter only holds its current window: window_size movements, or less
+once the window start is more than time_threshold old. Movements reach the
+writer at most `max_delay` seconds after their timestamp, so a window
+starting earlier than time_threshold + max_delay + flush_interval ago
+cannot match any movement still to come and is decided right away. A line
+therefore appears in the cleaned log at most time_threshold + max_delay +
+2 * flush_interval after its timestamp, even when the mouse stops.
+
+The cleaned log is identical to what clean_mouse_data.py writes for the same
+log and parameters (segmented sessions are cleaned segment by segment, like
+the offline pass). When the log is closed, its cleaned files are recorded in
+the cleaning manifest of the logs directory, so clean_logs skips them. A
+movement that arrives later than `max_delay` could have been decided too
+early; the log is then left for clean_logs to clean again.
+"""
+import os
+import time
+
+from binary_log import Event, EVENT_MOUSE_MOVE
+from clean_mouse_data import (CenterReturnFilter, cleaned_path, parse_log_line, record_cleaned_files,
+                              write_cleaned_session)
+from log_frames import CODEC_NONE, FrameWriter
+from log_segments import SegmentedLogWriter
+from log_writer import LogWriter
+
+
+class LiveCleaning:
+    """
+    LogWriter mixin writing the cleaned log next to every (text) log file it writes.
+
+    Args:
+        window_size, time_threshold, position_threshold: Cleaner parameters, as in clean_mouse_data
+        clock: Clock of the event timestamps, returning nanoseconds (SessionClock.now_ns in combined_logger)
+        max_delay: Maximum time (in seconds) between a movement's timestamp and its write()
+        **kwargs: Passed on to the writer
+    """
+
+    def __init__(self, *args, window_size=20, time_threshold=0.05, position_threshold=2, clock=time.time_ns,
+                 max_delay=0.1, **kwargs):
+        self.cleaning_params = {'window_size': window_size, 'time_threshold': time_threshold,
+                                'position_threshold': position_threshold}
+        self.clock = clock
+        self.max_delay_ns = int(max_delay * 1e9)
+        self.cleaned_files = []
+        self.late_moves = 0
+        self.max_clean_pending = 0
+        self._filter = None
+        self._cleaned = None
+        self._lines = None
+        # Movements earlier than this may have been decided already
+        self._decided_ns = 0
+        super().__init__(*args, **kwargs)
+
+    def stats(self):
+        stats = super().stats()
+        stats['cleaned_moves'] = sum(result['moves'] for result in self.cleaned_files)
+        stats['cleaned_removed'] = sum(result['removed'] for result in self.cleaned_files)
+        stats['late_moves'] = self.late_moves
+        stats['max_clean_pending'] = self.max_clean_pending
+        return stats
+
+    def close(self):
+        if self._closed:
+            return
+        super().close()
+        logs_dir = os.path.dirname(os.path.abspath(self.path))
+        exact = [result for result in self.cleaned_files if not result['late_moves']]
+        try:
+            manifest = record_cleaned_files(logs_dir, exact, self.cleaning_params)
+            if getattr(self, 'manifest_path', None):
+                write_cleaned_session(self.manifest_path, manifest)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error recording cleaned logs: {e}")
+
+    def _open(self):
+        f = super()._open()
+        output_file = cleaned_path(self.path)
+        # Cleaned copies of compressed logs are compressed the same way, as by clean_mouse_data
+        if self.compression != CODEC_NONE:
+            self._cleaned = FrameWriter(output_file, self.compression, self.compression_level, self.block_size,
+                                        mode='wb')
+        else:
+            self._cleaned = open(output_file, 'w')
+        self._filter = CenterReturnFilter(**self.cleaning_params)
+        self.cleaned_files.append({'input_file': self.path, 'output_file': output_file, 'late_moves': 0})
+        return f
+
+    def _encode(self, batch):
+        # The lines are kept for the cleaner so that they are only formatted once
+        self._lines = [str(item) for item in batch]
+        return '\n'.join(self._lines) + '\n'
+
+    def _write_batch(self, batch):
+        self._lines = None
+        # The batch is written first: a rotation there opens the cleaned file it belongs to
+        super()._write_batch(batch)
+        lines = self._lines if self._lines is not None else [str(item) for item in batch]
+        center_filter = self._filter
+        decided = []
+        for item, line in zip(batch, lines):
+            if isinstance(item, Event) and item.event_type == EVENT_MOUSE_MOVE:
+                if item.t_ns < self._decided_ns:
+                    self.late_moves += 1
+                    self.cleaned_files[-1]['late_moves'] += 1
+                # Same value as the offline cleaner's float() of the 9-decimal timestamp
+                decided += center_filter.push_movement(item.t_ns / 10 ** 9, item.dx, item.dy, line)
+                continue
+            for part in line.split('\n'):
+                parsed = parse_log_line(part)
+                if parsed:
+                    decided += center_filter.push_movement(*parsed, part)
+                else:
+                    decided += center_filter.push_line(part)
+        self.max_clean_pending = max(self.max_clean_pending, center_filter.pending)
+        self._write_cleaned(decided)
+
+    def _poll(self, now):
+        if self._filter.pending:
+            # Lines also wait up to flush_interval on the writer thread before they are written
+            cutoff = self.clock() - self.max_delay_ns - int(self.flush_interval * 1e9)
+            self._decided_ns = max(self._decided_ns, cutoff)
+            # 1 us below the cut-off keeps the float comparison on the safe side
+            self._write_cleaned(self._filter.expire((self._decided_ns - 1000) / 10 ** 9))
+        super()._poll(now)
+
+    def _finish(self):
+        self._write_cleaned(self._filter.finish())
+        result = self.cleaned_files[-1]
+        center_filter = self._filter
+        result.update(moves=center_filter.moves_seen, removed=center_filter.moves_removed,
+                      dx=center_filter.cumulative_x - center_filter.removed_x,
+                      dy=center_filter.cumulative_y - center_filter.removed_y)
+        try:
+            self._cleaned.close()
+        except Exception as e:
+            print(f"Error writing cleaned log: {e}")
+        super()._finish()
+
+    def _write_cleaned(self, lines):
+        if not lines:
+            return
+        try:
+            self._cleaned.write(''.join(line + '\n' for line in lines))
+            self._cleaned.flush()
+        except Exception as e:
+            print(f"Error writing cleaned log: {e}")
+
+
+class CleaningLogWriter(LiveCleaning, LogWriter):
+    pass
+
+
+class CleaningSegmentedLogWriter(LiveCleaning, SegmentedLogWriter):
+    pass
@@ -0,0 +1,147 @@
+"""
+Cache of parsed logs.
+
+Parsed logs are kept in an in-process memo and in `.npz` sidecars in a
+`.cache` directory next to the log. Both are keyed by the log's absolute
+path, size and mtime, so a log that changes is parsed again automatically.
+The cache directory is kept under a size limit by deleting the least
+recently used sidecars.
+"""
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from log_parser import LogData, parse_log
+
+# Bump when the cached layout or the parser output changes
+CACHE_VERSION = 2
+CACHE_DIR_NAME = ".cache"
+MAX_CACHE_BYTES = 1024 * 1024 * 1024
+MEMO_ENTRIES = 8
+
+_TABLES = ('moves', 'keys', 'buttons', 'scrolls', 'key_states', 'messages')
+_memo = OrderedDict()
+
+
+def cache_dir_for(log_path):
+    return os.path.join(os.path.dirname(os.path.abspath(log_path)), CACHE_DIR_NAME)
+
+
+def cache_key(log_path):
+    """(absolute path, size, mtime_ns) identifying the current contents of a log."""
+    stat = os.stat(log_path)
+    return os.path.abspath(log_path), stat.st_size, stat.st_mtime_ns
+
+
+def sidecar_path(log_path, cache_dir=None, suffix='.npz'):
+    """Sidecar file for a log (the name only depends on the log's absolute path)."""
+    digest = hashlib.sha1(os.path.abspath(log_path).encode('utf-8')).hexdigest()[:20]
+    base = os.path.basename(log_path)
+    return os.path.join(cache_dir or cache_dir_for(log_path), f"{base}.{digest}{suffix}")
+
+
+def _to_arrays(data, key):
+    arrays = {f"{table}.{column}": values
+              for table in _TABLES for column, values in getattr(data, table).items()}
+    meta = {'version': CACHE_VERSION, 'path': key[0], 'size': key[1], 'mtime_ns': key[2],
+            'n_lines': data.n_lines, 'names': data.names, 'message_text': data.message_text}
+    arrays['meta'] = np.array(json.dumps(meta))
+    return arrays
+
+
+def _from_arrays(arrays, key):
+    meta = json.loads(str(arrays['meta']))
+    if (meta.get('version'), meta.get('path'), meta.get('size'), meta.get('mtime_ns')) != (CACHE_VERSION,) + key:
+        return None
+    data = LogData()
+    for table in _TABLES:
+        columns = getattr(data, table)
+        for column in columns:
+            columns[column] = arrays[f"{table}.{column}"]
+    data.n_lines = meta['n_lines']
+    data.names = meta['names']
+    data.message_text = meta['message_text']
+    return data
+
+
+def save_arrays(path, arrays):
+    """Write an .npz file atomically (temporary file + rename)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def enforce_size_limit(cache_dir, max_bytes=MAX_CACHE_BYTES):
+    """Delete least recently used cache files until the directory fits in max_bytes."""
+    try:
+        entries = [entry for entry in os.scandir(cache_dir) if entry.is_file()]
+    except FileNotFoundError:
+        return
+    files = sorted(((entry.stat().st_mtime_ns, entry.stat().st_size, entry.path) for entry in entries))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in files:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+def _memo_put(key, data):
+    _memo[key] = data
+    _memo.move_to_end(key)
+    while len(_memo) > MEMO_ENTRIES:
+        _memo.popitem(last=False)
+
+
+def load_log(log_path, cache_dir=None, max_bytes=MAX_CACHE_BYTES):
+    """
+    Return the parsed LogData for a log, from the memo, the sidecar or by parsing it.
+
+    Args:
+        log_path: Text log to load
+        cache_dir: Directory for sidecars (default: `.cache` next to the log)
+        max_bytes: Size limit of the cache directory
+    """
+    key = cache_key(log_path)
+    data = _memo.get(key)
+    if data is not None:
+        _memo.move_to_end(key)
+        return data
+
+    sidecar = sidecar_path(log_path, cache_dir)
+    if os.path.exists(sidecar):
+        try:
+            with np.load(sidecar) as arrays:
+                data = _from_arrays(arrays, key)
+            if data is not None:
+                os.utime(sidecar)  # Mark as recently used for the LRU limit
+        except (OSError, ValueError, KeyError):
+            data = None
+
+    if data is None:
+        data = parse_log(log_path)
+        try:
+            save_arrays(sidecar, _to_arrays(data, key))
+            enforce_size_limit(os.path.dirname(sidecar), max_bytes)
+        except OSError as e:
+            print(f"Could not write cache file {sidecar}: {e}")
+
+    _memo_put(key, data)
+    return data
+
+
+def clear_memo():
+    _memo.clear()
@@ -0,0 +1,451 @@
+"""
+Framed and compressed text logs, and crash recovery.
+
+With framing (LOG_FRAMING in combined_logger) or compression
+(LOG_COMPRESSION), a text log is written as a sequence of frames:
+
+    file header:  magic, version, default codec and level (16 bytes)
+    frame:        stored length (uint32), CRC-32 of the stored bytes (uint32),
+                  text length (uint32), codec (uint8), 3 padding bytes, stored bytes
+
+Uncompressed, every batch the log writer writes becomes one frame. With a
+codec (zlib, gzip or lzma from the standard library), the text is gathered
+into blocks of about `block_size` bytes and each block is compressed on its
+own, so any block can be decompressed without the ones before it. Either
+way the concatenated frames are the plain text log.
+
+A write torn by a crash or power loss leaves a last frame that is shorter
+than its length or fails its checksum; everything before it is intact and
+can be trusted, which a plain text file cannot tell.
+
+open_log() opens plain, framed and compressed logs alike and returns a
+seekable file object over the text, so the parser, indexes and cleaner read
+them transparently. Opening reads only the frame headers; seeking to a text
+offset decompresses just the block that holds it, so windowed reads of a
+compressed log (log_index.read_window, key_state) stay cheap. Frames are
+verified when they are read.
+
+recover() checks a log and truncates a torn tail: the partial frame of a
+framed log, the unterminated last line (and any zero bytes left by the
+filesystem) of a plain text log, or the partial record of an unfinished
+binary log.
+
+Usage:
+    python log_frames.py "logs/2024-03-21 14-30-45_log.txt"              # check and truncate
+    python log_frames.py "logs/2024-03-21 14-30-45_log.txt" --dry-run    # only report
+    python log_frames.py "logs/2024-03-21 14-30-45_log.txt" --extract out.txt
+"""
+import argparse
+import bisect
+import gzip
+import io
+import lzma
+import os
+import struct
+import time
+import zlib
+
+MAGIC = b'GDCFRAME'
+VERSION = 2
+FILE_HEADER = struct.Struct('<8sHBBI')  # magic, version, default codec, level, reserved
+FRAME_HEADER = struct.Struct('<IIIB3x')  # stored length, crc32 of the stored bytes, text length, codec
+# Version 1 frames (uncompressed only): payload length, crc32
+FRAME_HEADER_V1 = struct.Struct('<II')
+# Binary logs (binary_log.py) start with this magic
+_BINARY_MAGIC = b'GDCLOG'
+
+CODEC_NONE = 'none'
+CODECS = (CODEC_NONE, 'zlib', 'gzip', 'lzma')
+DEFAULT_LEVEL = 6
+# Text bytes per compressed block
+DEFAULT_BLOCK_SIZE = 256 * 1024
+
+_COMPRESS = {
+    'none': lambda data, level: data,
+    'zlib': lambda data, level: zlib.compress(data, level),
+    'gzip': lambda data, level: gzip.compress(data, compresslevel=level, mtime=0),
+    'lzma': lambda data, level: lzma.compress(data, preset=level),
+}
+_DECOMPRESS = {
+    'none': bytes,
+    'zlib': zlib.decompress,
+    'gzip': gzip.decompress,
+    'lzma': lzma.decompress,
+}
+
+
+def file_header(codec=CODEC_NONE, level=DEFAULT_LEVEL):
+    return FILE_HEADER.pack(MAGIC, VERSION, CODECS.index(codec), level, 0)
+
+
+def encode_frame(text, codec=CODEC_NONE, level=DEFAULT_LEVEL):
+    """One frame holding `text` (bytes), compressed with `codec`."""
+    stored = _COMPRESS[codec](text, level)
+    return FRAME_HEADER.pack(len(stored), zlib.crc32(stored), len(text), CODECS.index(codec)) + stored
+
+
+def read_header(path):
+    """(version, default codec, level) of a framed log, or None for any other file."""
+    with open(path, 'rb') as f:
+        header = f.read(FILE_HEADER.size)
+    if len(header) < FILE_HEADER.size or header[:len(MAGIC)] != MAGIC:
+        return None
+    _, version, codec, level, _ = FILE_HEADER.unpack(header)
+    if codec >= len(CODECS):
+        raise ValueError(f"Unknown codec {codec} in {path}")
+    return version, CODECS[codec], level
+
+
+def is_framed(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def log_compression(path):
+    """(codec, level) a compressed log was written with, or None for plain and uncompressed logs."""
+    header = read_header(path)
+    if header is None or header[1] == CODEC_NONE:
+        return None
+    return header[1], header[2]
+
+
+class Frames:
+    """Location, size and codec of the frames of a framed log, and the end of the last valid one."""
+
+    def __init__(self):
+        self.offsets = []  # File offset of every frame's stored bytes
+        self.sizes = []  # Stored (possibly compressed) bytes
+        self.lengths = []  # Text bytes
+        self.crcs = []
+        self.codecs = []
+        self.end = FILE_HEADER.size
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def pop(self):
+        for column in (self.offsets, self.sizes, self.lengths, self.crcs, self.codecs):
+            column.pop()
+        self.end = self.offsets[-1] + self.sizes[-1] if self.offsets else FILE_HEADER.size
+
+
+def scan_frames(f, verify=True):
+    """
+    Locate the frames of an open framed log. Returns a Frames.
+
+    Scanning stops at the first frame that is truncated or malformed or,
+    with `verify`, fails its checksum. Without `verify` only the headers are
+    read, plus the checksums of the last frames: a crash can leave a frame
+    of the right length whose bytes never reached the disk.
+    """
+    f.seek(0)
+    header = f.read(FILE_HEADER.size)
+    if len(header) < FILE_HEADER.size or header[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not a framed log")
+    _, version, _, _, _ = FILE_HEADER.unpack(header)
+    if version not in (1, VERSION):
+        raise ValueError(f"Unsupported framed log version {version}")
+    frame_header = FRAME_HEADER_V1 if version == 1 else FRAME_HEADER
+    frames = Frames()
+    size = os.fstat(f.fileno()).st_size
+    while frames.end + frame_header.size <= size:
+        f.seek(frames.end)
+        fields = frame_header.unpack(f.read(frame_header.size))
+        if version == 1:
+            (stored, crc), length, codec = fields, fields[0], 0
+        else:
+            stored, crc, length, codec = fields
+        offset = frames.end + frame_header.size
+        # Writers never write empty frames: zero-filled space is not a frame
+        if stored == 0 or length == 0 or codec >= len(CODECS) or offset + stored > size:
+            break
+        if verify and zlib.crc32(f.read(stored)) != crc:
+            break
+        frames.offsets.append(offset)
+        frames.sizes.append(stored)
+        frames.lengths.append(length)
+        frames.crcs.append(crc)
+        frames.codecs.append(CODECS[codec])
+        frames.end = offset + stored
+    while not verify and len(frames):
+        f.seek(frames.offsets[-1])
+        if zlib.crc32(f.read(frames.sizes[-1])) == frames.crcs[-1]:
+            break
+        frames.pop()
+    return frames
+
+
+class FrameWriter:
+    """
+    Write-only text file producing a framed log.
+
+    Without a codec every write() becomes one frame. With one, text is
+    gathered until `block_size` bytes and then compressed as one frame;
+    end_block() writes the pending text early (the log writer does so before
+    every fsync and after `block_interval`). tell() counts bytes in the file.
+
+    Args:
+        path: Framed log to create or append to
+        codec: One of CODECS
+        level: Compression level (zlib and gzip 0-9, lzma preset 0-9)
+        block_size: Text bytes per compressed block
+        mode: 'ab' to append, 'wb' to replace the file
+    """
+
+    def __init__(self, path, codec=CODEC_NONE, level=None, block_size=DEFAULT_BLOCK_SIZE, mode='ab'):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec '{codec}', expected one of {CODECS}")
+        if mode == 'ab' and os.path.exists(path) and os.path.getsize(path) > 0:
+            header = read_header(path)
+            if header is None or header[0] != VERSION:
+                raise ValueError(f"{path} is not a version {VERSION} framed log, start a new log")
+            # A crash can leave a torn frame at the end: new frames go after the last intact one,
+            # or readers would stop at the torn one and recover() would cut the new frames off
+            with open(path, 'r+b') as f:
+                end = scan_frames(f, verify=False).end
+                if end < os.fstat(f.fileno()).st_size:
+                    f.truncate(end)
+        self.codec = codec
+        self.level = DEFAULT_LEVEL if level is None else level
+        self.block_size = block_size if codec != CODEC_NONE else 0
+        self._file = open(path, mode)
+        if self._file.tell() == 0:
+            self._file.write(file_header(codec, self.level))
+        self._pending = []
+        self._pending_size = 0
+        self.block_started = None
+        self.closed = False
+
+    @property
+    def pending(self):
+        """Text bytes written but not yet in a frame."""
+        return self._pending_size
+
+    def write(self, text):
+        data = text.encode('utf-8')
+        if not data:
+            return 0
+        if self.block_started is None:
+            self.block_started = time.monotonic()
+        self._pending.append(data)
+        self._pending_size += len(data)
+        if self._pending_size >= self.block_size:
+            self.end_block()
+        return len(text)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def end_block(self):
+        """Write the pending text as one frame."""
+        if self._pending:
+            self._file.write(encode_frame(b''.join(self._pending), self.codec, self.level))
+            self._pending = []
+            self._pending_size = 0
+            self.block_started = None
+
+    def flush(self):
+        self._file.flush()
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def tell(self):
+        return self._file.tell()
+
+    def close(self):
+        if not self.closed:
+            self.end_block()
+            self._file.close()
+            self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class FramedReader(io.RawIOBase):
+    """Seekable read-only view of the text held by the valid frames of a framed log."""
+
+    def __init__(self, path, verify=False):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._frames = scan_frames(self._file, verify)
+        except Exception:
+            self._file.close()
+            raise
+        self.valid_end = self._frames.end
+        # Position of every frame's first byte in the text
+        self._starts = [0]
+        for length in self._frames.lengths:
+            self._starts.append(self._starts[-1] + length)
+        self.size = self._starts[-1]
+        self._position = 0
+        self._frame = -1
+        self._text = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self._position = max(0, offset)
+        return self._position
+
+    def _load(self, frame):
+        frames = self._frames
+        self._file.seek(frames.offsets[frame])
+        stored = self._file.read(frames.sizes[frame])
+        if zlib.crc32(stored) != frames.crcs[frame]:
+            raise ValueError(f"{self.path}: corrupt frame at byte {frames.offsets[frame]}, "
+                             f"run log_frames.py to truncate the log there")
+        text = _DECOMPRESS[frames.codecs[frame]](stored)
+        if len(text) != frames.lengths[frame]:
+            raise ValueError(f"{self.path}: frame at byte {frames.offsets[frame]} has the wrong length")
+        self._text = memoryview(text)
+        self._frame = frame
+
+    def readinto(self, buffer):
+        if self._position >= self.size:
+            return 0
+        frame = bisect.bisect_right(self._starts, self._position) - 1
+        if frame != self._frame:
+            self._load(frame)
+        start = self._position - self._starts[frame]
+        n = min(len(buffer), len(self._text) - start)
+        buffer[:n] = self._text[start:start + n]
+        self._position += n
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+        super().close()
+
+
+def open_log(path, mode='rb'):
+    """
+    Open a plain, framed or compressed text log for reading ('rb' or 'r').
+    Framed logs are read through a FramedReader; the result supports read,
+    seek and tell in text offsets either way.
+    """
+    if not is_framed(path):
+        return open(path, mode)
+    f = io.BufferedReader(FramedReader(path), buffer_size=1024 * 1024)
+    return f if mode == 'rb' else io.TextIOWrapper(f, encoding='utf-8', errors='replace')
+
+
+def _recover_text(f, size):
+    """End of the last complete line of a plain text log (trailing zero bytes ignored)."""
+    end = size
+    while end > 0:
+        start = max(0, end - 65536)
+        f.seek(start)
+        block = f.read(end - start)
+        stripped = block.rstrip(b'\x00')
+        if stripped:
+            newline = stripped.rfind(b'\n')
+            if newline >= 0:
+                return start + newline + 1
+        end = start
+    return 0
+
+
+def recover(path, dry_run=False):
+    """
+    Check a log and truncate a torn tail (unless `dry_run`).
+
+    Returns a dict with the format, the original size, the size of the
+    intact part and the number of bytes removed (or that would be).
+    """
+    # Imported here: binary_log depends on log_writer, which writes frames (and text logs need no numpy)
+    import numpy as np
+    from binary_log import HEADER, RECORD_DTYPE, intact_records, journal_path
+
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        magic = f.read(len(MAGIC))
+        if magic == MAGIC:
+            log_format = 'framed'
+            frames = scan_frames(f)
+            valid_end = frames.end
+            details = {'frames': len(frames), 'text_size': sum(frames.lengths)}
+        elif magic.startswith(_BINARY_MAGIC):
+            log_format = 'binary'
+            f.seek(0)
+            _, _, record_size, _, _, table_offset = HEADER.unpack(f.read(HEADER.size))
+            if table_offset:
+                # Closed properly: the string table ends the file
+                valid_end = size
+            else:
+                # Records are unframed: a torn tail is the trailing records the writer cannot have produced
+                records = np.fromfile(f, dtype=RECORD_DTYPE, count=(size - HEADER.size) // RECORD_DTYPE.itemsize)
+                valid_end = HEADER.size + intact_records(records) * RECORD_DTYPE.itemsize
+            details = {'records': (valid_end - HEADER.size) // RECORD_DTYPE.itemsize, 'closed': bool(table_offset),
+                       'journal': not table_offset and os.path.exists(journal_path(path))}
+        else:
+            log_format = 'text'
+            valid_end = _recover_text(f, size)
+            details = {}
+
+    result = dict(details, path=path, format=log_format, size=size, valid_size=valid_end,
+                  truncated=size - valid_end)
+    if valid_end < size and not dry_run:
+        with open(path, 'r+b') as f:
+            f.truncate(valid_end)
+            f.flush()
+            os.fsync(f.fileno())
+    return result
+
+
+def extract(path, output):
+    """Write the text of a (plain, framed or compressed) log to `output` as a plain text log."""
+    with open_log(path) as src, open(output, 'wb') as dst:
+        while True:
+            block = src.read(1024 * 1024)
+            if not block:
+                break
+            dst.write(block)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check session logs and truncate torn tails after a crash.")
+    parser.add_argument('logs', nargs='+', help="Text, framed, compressed or binary session logs")
+    parser.add_argument('--dry-run', action='store_true', help="Only report what would be truncated")
+    parser.add_argument('--extract', metavar='OUTPUT', default=None,
+                        help="Write the intact text of a single framed or compressed log as a plain text log")
+    args = parser.parse_args()
+
+    for path in args.logs:
+        result = recover(path, dry_run=args.dry_run)
+        action = "would truncate" if args.dry_run else "truncated"
+        status = f"{action} {result['truncated']} bytes" if result['truncated'] else "intact"
+        extra = ', '.join(f"{key}={result[key]}" for key in ('frames', 'text_size', 'records', 'closed')
+                          if key in result)
+        print(f"{path}: {result['format']}, {result['valid_size']:,} of {result['size']:,} bytes valid, {status}"
+              + (f" ({extra})" if extra else ""))
+        if result['format'] == 'binary' and not result['closed']:
+            if result['journal']:
+                print("  Unfinished binary log: key names and messages are read from its name journal")
+            else:
+                print("  Unfinished binary log: its string table (key names and messages) was never written")
+    if args.extract:
+        extract(args.logs[0], args.extract)
+        print(f"Text written to {args.extract}")
+
+
+if __name__ == "__main__":
+    main()
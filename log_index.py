@@ -0,0 +1,245 @@
+"""
+Sparse timestamp index for loading time windows of large logs.
+
+The index splits a log into blocks of complete lines (about INDEX_BLOCK_SIZE
+bytes each) and stores, for every block, its byte offset, the timestamp of
+its first mouse movement, the cumulative X/Y position before it and the
+number of movements and path length before it. A window query seeks
+straight to the blocks that can contain the window, parses only those and
+still returns absolute cumulative positions; window statistics only parse
+the blocks at the two edges of the window.
+
+Indexes are stored as sidecars in the log cache directory and rebuilt
+automatically when the log changes. Timestamps are assumed to be
+non-decreasing, which holds for the raw movement stream of a log.
+"""
+import os
+
+import numpy as np
+
+from log_cache import cache_key, load_log, save_arrays, sidecar_path
+from log_frames import open_log
+from log_parser import iter_chunks, parse_bytes
+
+INDEX_BLOCK_SIZE = 256 * 1024
+# Part of the sidecar key: bump when the contents of the index change
+INDEX_VERSION = 2
+# Windows covering more than this fraction of the log are sliced from the fully parsed (cached) log
+FULL_LOAD_FRACTION = 0.5
+
+
+class LogIndex:
+    """
+    Block index of one log.
+
+    Attributes:
+        offsets: Byte offset of each block
+        t_ns: Timestamp of the first movement in each block (carried over from
+            the previous block if it has none)
+        cum_x, cum_y: Cumulative position before each block
+        counts: Number of movements before each block
+        lengths: Path length (sum of the movement steps) before each block
+        size: Log size in bytes
+        first_t_ns, last_t_ns: Earliest and latest movement timestamp (-1 if none); aggregated
+            movements can be written after later events, so these are not always the first
+            and last movement of the file
+        moves: Number of movements in the log
+    """
+
+    def __init__(self, offsets, t_ns, cum_x, cum_y, counts, lengths, size, first_t_ns, last_t_ns, moves):
+        self.offsets = offsets
+        self.t_ns = t_ns
+        self.cum_x = cum_x
+        self.cum_y = cum_y
+        self.counts = counts
+        self.lengths = lengths
+        self.size = size
+        self.first_t_ns = first_t_ns
+        self.last_t_ns = last_t_ns
+        self.moves = moves
+
+    def block_range(self, start_ns, end_ns):
+        """
+        Blocks that can contain movements with start_ns <= t <= end_ns.
+
+        Returns (first block, begin offset, end offset) of the byte range to parse.
+        """
+        first = max(int(np.searchsorted(self.t_ns, start_ns, side='left')) - 1, 0)
+        last = int(np.searchsorted(self.t_ns, end_ns, side='right'))
+        end = int(self.offsets[last]) if last < len(self.offsets) else self.size
+        return first, int(self.offsets[first]) if len(self.offsets) else 0, end
+
+    def block_end(self, block):
+        """Byte offset of the end of a block."""
+        return int(self.offsets[block + 1]) if block + 1 < len(self.offsets) else self.size
+
+
+def step_lengths(moves):
+    """Length of the step of every movement (its dx, dy), whose sums are the path lengths of the index."""
+    return np.hypot(moves['dx'].astype(np.float64), moves['dy'].astype(np.float64))
+
+
+def build_index(log_path, block_size=INDEX_BLOCK_SIZE):
+    """Build a LogIndex with one pass over the log."""
+    offsets, t_ns, cum_x, cum_y, counts, lengths = [], [], [], [], [], []
+    offset = 0
+    x = y = 0
+    length = 0.0
+    carried_t = -1
+    first_t = last_t = -1
+    moves = 0
+    with open_log(log_path) as f:
+        for chunk in iter_chunks(f, block_size):
+            block = parse_bytes(chunk, moves_only=True).moves
+            offsets.append(offset)
+            cum_x.append(x)
+            cum_y.append(y)
+            counts.append(moves)
+            lengths.append(length)
+            if len(block['t_ns']):
+                t_ns.append(int(block['t_ns'][0]))
+                carried_t = int(block['t_ns'][-1])
+                block_first, block_last = int(block['t_ns'].min()), int(block['t_ns'].max())
+                first_t = block_first if first_t < 0 else min(first_t, block_first)
+                last_t = max(last_t, block_last)
+                x += int(block['dx'].sum())
+                y += int(block['dy'].sum())
+                length += float(step_lengths(block).sum())
+                moves += len(block['t_ns'])
+            else:
+                t_ns.append(carried_t)
+            offset += len(chunk)
+    # Leading blocks without movements get the first movement time so t_ns stays sorted
+    t_ns = np.array(t_ns, dtype=np.int64)
+    if moves:
+        t_ns[t_ns < 0] = t_ns[t_ns >= 0][0]
+    return LogIndex(np.array(offsets, dtype=np.int64), t_ns, np.array(cum_x, dtype=np.int64),
+                    np.array(cum_y, dtype=np.int64), np.array(counts, dtype=np.int64),
+                    np.array(lengths, dtype=np.float64), offset, first_t, last_t, moves)
+
+
+def load_index(log_path, cache_dir=None, block_size=INDEX_BLOCK_SIZE):
+    """Return the LogIndex for a log from its sidecar, building and saving it if needed."""
+    key = cache_key(log_path)
+    sidecar = sidecar_path(log_path, cache_dir, suffix='.idx.npz')
+    if os.path.exists(sidecar):
+        try:
+            with np.load(sidecar) as arrays:
+                if tuple(arrays['key'].tolist()) == (key[1], key[2], block_size, INDEX_VERSION):
+                    os.utime(sidecar)
+                    return LogIndex(arrays['offsets'], arrays['t_ns'], arrays['cum_x'], arrays['cum_y'],
+                                    arrays['counts'], arrays['lengths'], *arrays['totals'].tolist())
+        except (OSError, ValueError, KeyError):
+            pass
+
+    index = build_index(log_path, block_size)
+    try:
+        save_arrays(sidecar, {
+            'key': np.array([key[1], key[2], block_size, INDEX_VERSION], dtype=np.int64),
+            'offsets': index.offsets, 't_ns': index.t_ns, 'cum_x': index.cum_x, 'cum_y': index.cum_y,
+            'counts': index.counts, 'lengths': index.lengths,
+            'totals': np.array([index.size, index.first_t_ns, index.last_t_ns, index.moves], dtype=np.int64),
+        })
+    except OSError as e:
+        print(f"Could not write index file {sidecar}: {e}")
+    return index
+
+
+def slice_by_time(t, start, end, *columns):
+    """Slice sorted t (and matching columns) to start <= t <= end with np.searchsorted."""
+    lo = np.searchsorted(t, start, side='left')
+    hi = np.searchsorted(t, end, side='right')
+    return (t[lo:hi],) + tuple(column[lo:hi] for column in columns)
+
+
+def read_window(log_path, start_ns, end_ns, index=None):
+    """
+    Movements with start_ns <= t <= end_ns as (t_ns, cumulative_x, cumulative_y).
+
+    Only the blocks that can contain the window are read and parsed, unless the
+    window spans most of the log, in which case the (cached) full parse is sliced.
+    """
+    if index is None:
+        index = load_index(log_path)
+    if index.moves == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+
+    first, begin, end = index.block_range(start_ns, end_ns)
+    if end - begin > FULL_LOAD_FRACTION * index.size:
+        t_ns, cum_x, cum_y = load_log(log_path).mouse_positions()
+        return slice_by_time(t_ns, start_ns, end_ns, cum_x, cum_y)
+
+    with open_log(log_path) as f:
+        f.seek(begin)
+        moves = parse_bytes(f.read(end - begin), moves_only=True).moves
+    cum_x = index.cum_x[first] + np.cumsum(moves['dx'], dtype=np.int64)
+    cum_y = index.cum_y[first] + np.cumsum(moves['dy'], dtype=np.int64)
+    return slice_by_time(moves['t_ns'], start_ns, end_ns, cum_x, cum_y)
+
+
+def read_block(f, index, block):
+    """Movements of one block of an indexed log (`f` is the log opened with open_log)."""
+    begin = int(index.offsets[block])
+    f.seek(begin)
+    return parse_bytes(f.read(index.block_end(block) - begin), moves_only=True).moves
+
+
+def iter_blocks(log_path, index):
+    """(block, movements) of every block of a log, in order, reading one block at a time."""
+    with open_log(log_path) as f:
+        for block in range(len(index.offsets)):
+            yield block, read_block(f, index, block)
+
+
+def _position(f, index, t_ns, side):
+    """
+    Number n of movements before t_ns (side='left': with t < t_ns, 'right': t <= t_ns),
+    the path length of the first n movements and the step length of movement n
+    (0 if there is none), parsing only the block where t_ns falls (and the next block
+    with movements, when it falls after the last movement of that block).
+    """
+    block = max(int(np.searchsorted(index.t_ns, t_ns, side=side)) - 1, 0)
+    moves = read_block(f, index, block)
+    local = int(np.searchsorted(moves['t_ns'], t_ns, side=side))
+    steps = step_lengths(moves)
+    n = int(index.counts[block]) + local
+    length = float(index.lengths[block]) + float(steps[:local].sum())
+    if local == len(steps):
+        # Movement n is the first one of the next block with movements
+        later = np.flatnonzero(np.diff(np.append(index.counts, index.moves))[block + 1:])
+        if len(later) == 0:
+            return n, length, 0.0
+        steps = step_lengths(read_block(f, index, block + 1 + int(later[0])))
+        local = 0
+    return n, length, float(steps[local])
+
+
+def window_steps(log_path, start_ns, end_ns, index=None):
+    """
+    (moves, steps, first_step) of the movements within start_ns <= t <= end_ns: their number,
+    the summed length of their own steps and the step length of the first of them. The path
+    between them is steps - first_step; logs cut into segments join these sums across segments.
+    """
+    if index is None:
+        index = load_index(log_path)
+    if index.moves == 0 or end_ns < start_ns:
+        return 0, 0.0, 0.0
+    with open_log(log_path) as f:
+        lo, lo_length, lo_step = _position(f, index, start_ns, 'left')
+        hi, hi_length, _ = _position(f, index, end_ns, 'right')
+    if hi <= lo:
+        return 0, 0.0, 0.0
+    return hi - lo, hi_length - lo_length, lo_step
+
+
+def window_stats(log_path, start_ns, end_ns, index=None):
+    """
+    Number of movements and path length within start_ns <= t <= end_ns, at full resolution,
+    from the partial sums of the index and a parse of the blocks at the edges of the window.
+    """
+    moves, steps, first_step = window_steps(log_path, start_ns, end_ns, index)
+    if moves < 2:
+        return moves, 0.0
+    # Path from the first to the last movement: the steps of every movement but the first
+    return moves, steps - first_step
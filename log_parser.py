@@ -0,0 +1,358 @@
+"""
+Shared high-throughput parser for combined_logger text logs.
+
+Logs are read in large binary chunks. Mouse movements, which make up almost
+every line of a session, are recognised and converted with NumPy operations
+over the whole chunk (no Python code per line); only the remaining lines
+(keys, clicks, scrolls, session markers, errors) are handled one by one.
+Chunks with anything unexpected on a movement line fall back to a compiled
+regex per line, so the result never depends on the fast path.
+
+Every event type comes back as a dictionary of equal-length NumPy columns.
+`line` is the 0-based line number, so events of different types can be
+merged back into file order, and `t_ns` is the timestamp as integer
+nanoseconds since the epoch.
+"""
+import re
+from datetime import datetime
+
+import numpy as np
+
+from log_frames import open_log
+
+CHUNK_SIZE = 16 * 1024 * 1024
+
+# Message kinds
+MESSAGE_INFO = 0
+MESSAGE_SESSION_START = 1
+MESSAGE_SESSION_END = 2
+MESSAGE_ERROR = 3
+
+# Text form of a movement line, for line-by-line callers
+MOVE_LINE_RE = re.compile(r'(\d+\.\d+) - MOUSE MOVED: (-?\d+), (-?\d+)')
+
+# Deltas are stored as int32 and timestamps as int64 nanoseconds: lines with larger
+# fields (corrupted lines) are not events and are kept as messages
+_MAX_DELTA_DIGITS = 9
+_MAX_SECONDS = np.iinfo(np.int64).max // 1_000_000_000 - 1
+
+_MOVE_RE = re.compile(rb'(\d{1,10})\.(\d+) - MOUSE MOVED: (-?\d{1,9}), (-?\d{1,9})\r?$')
+_MOVE_SIGNATURE = b' - MOUSE MOVED: '
+_SIGNATURE_WORDS = np.frombuffer(_MOVE_SIGNATURE, dtype='<u8')
+
+_EVENT_RE = re.compile(
+    r'(\d+)\.(\d+) - (PRESSED : |RELEASED: |MOUSE PRESSED : |MOUSE RELEASED: |MOUSE SCROLLED: |KEY STATE: )(.*)$',
+    re.DOTALL)
+_HEX_RE = re.compile(r'[0-9a-f]+$')
+_SCROLL_RE = re.compile(r'(-?\d{1,9}), (-?\d{1,9})$')
+_LEADING_TIMESTAMP_RE = re.compile(r'(\d+)\.(\d+)')
+_SESSION_START_RE = re.compile(r'--- Logging session started at (\d{4}-\d\d-\d\d \d\d:\d\d:\d\d(?:\.\d+)?) ---')
+
+
+# Key state checkpoints (see key_state) hold a 256-bit set as uint64 words, least significant first
+KEY_STATE_WORDS = 4
+
+
+def key_state_words(bits):
+    """Split a key state bitset integer into KEY_STATE_WORDS uint64 words."""
+    return tuple((bits >> (64 * i)) & 0xFFFF_FFFF_FFFF_FFFF for i in range(KEY_STATE_WORDS))
+
+
+def timestamp_to_ns(seconds, fraction):
+    """Convert the two parts of a 'seconds.fraction' timestamp string to integer nanoseconds."""
+    return int(seconds) * 1_000_000_000 + int(fraction[:9].ljust(9, '0'))
+
+
+def session_start_ns(text):
+    """Time of a '--- Logging session started at ... ---' line as integer nanoseconds, or None for other lines."""
+    start = _SESSION_START_RE.match(text)
+    if start is None:
+        return None
+    return int(datetime.fromisoformat(start.group(1)).timestamp() * 1e6) * 1000
+
+
+def _field_values(words, begin, end, signed=False, max_digits=16):
+    """
+    Integers in the byte ranges [begin, end) of a chunk, where words[i] holds the 8 bytes
+    before position i of the chunk, converting eight digits per word at once. Returns None
+    if a field is empty, longer than `max_digits` (at most 16) digits or has anything but
+    digits (after an optional '-' when `signed`).
+    """
+    negative = np.zeros(len(begin), dtype=bool)
+    if signed:
+        # The '-' is the top byte of the word that ends with it
+        negative = (words[begin + 1] >> np.uint64(56)) == 45
+        begin = begin + negative
+    lengths = end - begin
+    if len(lengths) and (lengths.min() < 1 or lengths.max() > max_digits):
+        return None
+    values = np.zeros(len(begin), dtype=np.int64)
+    for ends, counts, scale in ((end, np.minimum(lengths, 8), 1), (end - 8, lengths - 8, 100_000_000)):
+        rows = np.flatnonzero(counts > 0)
+        # The digits are the high bytes of the word ending at the field; the bytes before them become zeros
+        shift = ((8 - counts[rows]) * 8).astype(np.uint64)
+        word = words[ends[rows]] >> shift << shift
+        zeros = np.uint64(0x3030303030303030) >> shift << shift
+        if np.any((word & np.uint64(0xF0F0F0F0F0F0F0F0)) != zeros) or np.any(
+                ((word + (np.uint64(0x0606060606060606) >> shift << shift)) & np.uint64(0xF0F0F0F0F0F0F0F0)) != zeros):
+            return None
+        # Pairs of digits, then groups of four, then the two halves
+        v = word - zeros
+        v = (v * np.uint64(10) + (v >> np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+        v = (v * np.uint64(100) + (v >> np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+        v = (v * np.uint64(10000) + (v >> np.uint64(32))) & np.uint64(0x00000000FFFFFFFF)
+        values[rows] += v.astype(np.int64) * scale
+    values[negative] *= -1
+    return values
+
+
+def _parse_moves(chunk, arr, starts, ends):
+    """
+    Vectorized movement parsing for a chunk of complete lines.
+
+    Returns (is_move, t_ns, dx, dy), or None if the chunk has to go through
+    the regex fallback.
+    """
+    # A movement line has the signature right after its first space
+    spaces = np.flatnonzero(arr == 32)
+    if len(spaces) == 0:
+        return None
+    first_space = spaces[np.minimum(np.searchsorted(spaces, starts), len(spaces) - 1)]
+    # words[i] holds the 8 bytes before arr[i] (zeros before the start of the chunk)
+    padded = np.zeros(len(arr) + 24, dtype=np.uint8)
+    padded[8:len(arr) + 8] = arr
+    words = np.ndarray(shape=(len(arr) + 16,), dtype='<u8', buffer=padded, strides=(1,))
+    is_move = ((first_space >= starts) & (first_space + len(_MOVE_SIGNATURE) <= ends)
+               & (words[first_space + 8] == _SIGNATURE_WORDS[0])
+               & (words[first_space + 16] == _SIGNATURE_WORDS[1]))
+    n_moves = int(np.count_nonzero(is_move))
+    if n_moves == 0:
+        return is_move, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32)
+
+    # "sec.frac - MOUSE MOVED: dx, dy": the fields are found from the first '.' and
+    # the first ', ' of each line, and every byte between them is checked
+    move_starts = starts[is_move]
+    move_space = first_space[is_move]
+    move_ends = ends[is_move]
+    move_ends = move_ends - (arr[move_ends - 1] == 13)
+    dots = np.flatnonzero(arr == 46)
+    dot = dots[np.minimum(np.searchsorted(dots, move_starts), len(dots) - 1)] if len(dots) else move_starts
+    dx_start = move_space + len(_MOVE_SIGNATURE)
+    commas = np.flatnonzero(arr == 44)
+    if len(commas) == 0:
+        return None
+    comma = commas[np.minimum(np.searchsorted(commas, dx_start), len(commas) - 1)]
+    if (np.any(dot <= move_starts) or np.any(dot >= move_space) or np.any(comma < dx_start)
+            or np.any(comma + 2 > move_ends) or np.any(arr[np.minimum(comma + 1, len(arr) - 1)] != 32)):
+        return None
+    fraction_digits = move_space - dot - 1
+    if np.any(fraction_digits > 9):
+        return None
+
+    seconds = _field_values(words, move_starts, dot)
+    fraction = _field_values(words, dot + 1, move_space)
+    dx = _field_values(words, dx_start, comma, signed=True, max_digits=_MAX_DELTA_DIGITS)
+    dy = _field_values(words, comma + 2, move_ends, signed=True, max_digits=_MAX_DELTA_DIGITS)
+    if seconds is None or fraction is None or dx is None or dy is None or np.any(seconds > _MAX_SECONDS):
+        return None
+
+    t_ns = seconds * 1_000_000_000 + fraction * 10 ** (9 - fraction_digits)
+    return is_move, t_ns, dx.astype(np.int32), dy.astype(np.int32)
+
+
+def _parse_moves_by_line(chunk, starts, ends):
+    """Regex fallback of _parse_moves, one line at a time."""
+    is_move = np.zeros(len(starts), dtype=bool)
+    t_ns, dx, dy = [], [], []
+    for i, (start, end) in enumerate(zip(starts.tolist(), ends.tolist())):
+        match = _MOVE_RE.match(chunk, start, end)
+        if match and int(match.group(1)) <= _MAX_SECONDS:
+            is_move[i] = True
+            t_ns.append(timestamp_to_ns(match.group(1).decode(), match.group(2).decode()))
+            dx.append(int(match.group(3)))
+            dy.append(int(match.group(4)))
+    return is_move, np.array(t_ns, dtype=np.int64), np.array(dx, dtype=np.int32), np.array(dy, dtype=np.int32)
+
+
+def _empty_columns(**dtypes):
+    return {name: np.zeros(0, dtype=dtype) for name, dtype in dtypes.items()}
+
+
+class LogData:
+    """
+    Columnar contents of one log.
+
+    Attributes:
+        moves: line, t_ns, dx, dy
+        keys: line, t_ns, pressed, code (index into names)
+        buttons: line, t_ns, pressed, code (index into names)
+        scrolls: line, t_ns, dx, dy
+        key_states: line, t_ns, state (KEY_STATE_WORDS words per checkpoint)
+        messages: line, t_ns (-1 if the line has no time), kind (MESSAGE_*)
+        message_text: Text of each message line
+        names: Key and button names referenced by `code`
+        n_lines: Number of lines in the log
+    """
+
+    def __init__(self):
+        self.moves = _empty_columns(line=np.int64, t_ns=np.int64, dx=np.int32, dy=np.int32)
+        self.keys = _empty_columns(line=np.int64, t_ns=np.int64, pressed=bool, code=np.int32)
+        self.buttons = _empty_columns(line=np.int64, t_ns=np.int64, pressed=bool, code=np.int32)
+        self.scrolls = _empty_columns(line=np.int64, t_ns=np.int64, dx=np.int32, dy=np.int32)
+        self.key_states = _empty_columns(line=np.int64, t_ns=np.int64, state=np.uint64)
+        self.key_states['state'] = self.key_states['state'].reshape(0, KEY_STATE_WORDS)
+        self.messages = _empty_columns(line=np.int64, t_ns=np.int64, kind=np.uint8)
+        self.message_text = []
+        self.names = []
+        self.n_lines = 0
+
+    def mouse_positions(self):
+        """Return (t_ns, cumulative_x, cumulative_y) of the raw mouse movements."""
+        return (self.moves['t_ns'],
+                np.cumsum(self.moves['dx'], dtype=np.int64),
+                np.cumsum(self.moves['dy'], dtype=np.int64))
+
+
+class _Builder:
+    """Collects per-chunk column pieces and concatenates them at the end."""
+
+    def __init__(self, moves_only):
+        self.moves_only = moves_only
+        self.move_pieces = []
+        self.rows = {'keys': [], 'buttons': [], 'scrolls': [], 'key_states': [], 'messages': []}
+        self.message_text = []
+        self.names = []
+        self.codes = {}
+        self.n_lines = 0
+
+    def code(self, name):
+        code = self.codes.get(name)
+        if code is None:
+            code = self.codes[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+    def add_chunk(self, chunk):
+        """Parse a chunk made of complete lines."""
+        arr = np.frombuffer(chunk, dtype=np.uint8)
+        ends = np.flatnonzero(arr == 10)
+        if not chunk.endswith(b'\n'):
+            ends = np.append(ends, len(chunk))
+        starts = np.empty(len(ends), dtype=np.int64)
+        starts[:1] = 0
+        starts[1:] = ends[:-1] + 1
+
+        parsed = _parse_moves(chunk, arr, starts, ends)
+        if parsed is None:
+            parsed = _parse_moves_by_line(chunk, starts, ends)
+        is_move, t_ns, dx, dy = parsed
+
+        if len(t_ns):
+            self.move_pieces.append({
+                'line': np.flatnonzero(is_move) + self.n_lines,
+                't_ns': t_ns,
+                'dx': dx,
+                'dy': dy,
+            })
+        if not self.moves_only:
+            for i in np.flatnonzero(~is_move).tolist():
+                text = chunk[starts[i]:ends[i]].decode('utf-8', 'replace').rstrip('\r')
+                self.add_line(self.n_lines + i, text)
+        self.n_lines += len(ends)
+
+    def add_line(self, line_number, text):
+        """Classify one non-movement line."""
+        match = _EVENT_RE.match(text)
+        if match and int(match.group(1)) <= _MAX_SECONDS:
+            t_ns = timestamp_to_ns(match.group(1), match.group(2))
+            prefix = match.group(3)
+            rest = match.group(4)
+            if prefix == 'MOUSE SCROLLED: ':
+                scroll = _SCROLL_RE.match(rest)
+                if scroll:
+                    self.rows['scrolls'].append((line_number, t_ns, int(scroll.group(1)), int(scroll.group(2))))
+                    return
+            elif prefix == 'KEY STATE: ':
+                if _HEX_RE.match(rest):
+                    self.rows['key_states'].append((line_number, t_ns, key_state_words(int(rest, 16))))
+                    return
+            elif prefix in ('PRESSED : ', 'RELEASED: '):
+                self.rows['keys'].append((line_number, t_ns, prefix == 'PRESSED : ', self.code(rest)))
+                return
+            else:
+                self.rows['buttons'].append((line_number, t_ns, prefix == 'MOUSE PRESSED : ', self.code(rest)))
+                return
+
+        # Anything else is a message: session markers, errors, status lines
+        t_ns = -1
+        timestamp = _LEADING_TIMESTAMP_RE.match(text)
+        if timestamp and int(timestamp.group(1)) <= _MAX_SECONDS:
+            t_ns = timestamp_to_ns(timestamp.group(1), timestamp.group(2))
+        start_ns = session_start_ns(text)
+        if start_ns is not None:
+            kind = MESSAGE_SESSION_START
+            t_ns = start_ns
+        elif 'Logging session ended' in text:
+            kind = MESSAGE_SESSION_END
+        elif 'error' in text.lower():
+            kind = MESSAGE_ERROR
+        else:
+            kind = MESSAGE_INFO
+        self.rows['messages'].append((line_number, t_ns, kind))
+        self.message_text.append(text)
+
+    def build(self):
+        data = LogData()
+        data.n_lines = self.n_lines
+        data.names = self.names
+        data.message_text = self.message_text
+        for name, columns in (('keys', data.keys), ('buttons', data.buttons),
+                              ('scrolls', data.scrolls), ('key_states', data.key_states),
+                              ('messages', data.messages)):
+            if self.rows[name]:
+                for column, values in zip(columns, zip(*self.rows[name])):
+                    columns[column] = np.array(values, dtype=columns[column].dtype)
+        if self.move_pieces:
+            data.moves = {column: np.concatenate([piece[column] for piece in self.move_pieces])
+                          for column in data.moves}
+        return data
+
+
+def iter_chunks(f, chunk_size=CHUNK_SIZE):
+    """Yield chunks of complete lines from a binary file object."""
+    remainder = b''
+    while True:
+        block = f.read(chunk_size)
+        if not block:
+            break
+        block = remainder + block
+        cut = block.rfind(b'\n') + 1
+        if cut == 0:
+            remainder = block
+            continue
+        remainder = block[cut:]
+        yield block[:cut]
+    if remainder:
+        yield remainder
+
+
+def parse_bytes(data, moves_only=False):
+    """Parse log contents given as bytes. Returns a LogData."""
+    builder = _Builder(moves_only)
+    if data:
+        builder.add_chunk(data)
+    return builder.build()
+
+
+def parse_log(file_path, moves_only=False, chunk_size=CHUNK_SIZE):
+    """
+    Parse a whole log file. Returns a LogData.
+
+    With moves_only=True the other line types are skipped, which is faster
+    when only mouse movements are needed.
+    """
+    builder = _Builder(moves_only)
+    with open_log(file_path) as f:
+        for chunk in iter_chunks(f, chunk_size):
+            builder.add_chunk(chunk)
+    return builder.build()
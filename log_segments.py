@@ -0,0 +1,393 @@
+"""
+Sessions logged as numbered segments, with a manifest.
+
+With rotation enabled (LOG_ROTATE_MB / LOG_ROTATE_MINUTES in combined_logger)
+a session is written as
+
+    logs/2024-03-21 14-30-45_log.001.txt
+    logs/2024-03-21 14-30-45_log.002.txt
+    ...
+    logs/2024-03-21 14-30-45_manifest.json
+
+(.bin segments for the binary format). The writer starts a new segment when
+the current one reaches the size or duration limit, so a crash can only
+damage the tail of the last segment. The manifest is rewritten (atomically)
+whenever a segment is opened or closed and lists every segment with its
+time range, line/event/movement counts, the sum of its mouse deltas and the
+cumulative mouse position at its start, so segments can be processed
+independently and still be placed on one continuous mouse path. Segments
+marked complete are final and can be processed while the session is still
+being recorded.
+
+Readers accept a manifest wherever they accept a log: load_session_log()
+parses the segments in parallel and merges them, SessionIndex and
+SessionLevelOfDetail read time windows across segments with absolute
+cumulative positions.
+"""
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from binary_log import BinaryLogWriter, EVENT_MOUSE_MOVE
+from decimate import DEFAULT_MAX_POINTS, decimate, load_lod
+from log_cache import _TABLES, load_log
+from log_index import load_index, read_window, window_steps
+from log_parser import LogData
+from log_writer import DURABILITY_BUFFERED, LogWriter
+
+MANIFEST_SUFFIX = '_manifest.json'
+CLEANED_MANIFEST_SUFFIX = '_cleaned_manifest.json'
+MANIFEST_VERSION = 1
+
+
+def manifest_path(session_base):
+    """Manifest of the session whose files start with session_base ('logs/2024-03-21 14-30-45')."""
+    return session_base + MANIFEST_SUFFIX
+
+
+def segment_path(session_base, number, extension='.txt'):
+    """Path of segment `number` (1-based) of a session."""
+    return f"{session_base}_log.{number:03d}{extension}"
+
+
+def is_manifest(path):
+    return path.endswith(MANIFEST_SUFFIX)
+
+
+def cleaned_manifest_path(path):
+    """Manifest of the cleaned segments of a session, given its manifest."""
+    return path[:-len(MANIFEST_SUFFIX)] + CLEANED_MANIFEST_SUFFIX
+
+
+def list_sessions(logs_dir, cleaned=False):
+    """Manifests of the segmented sessions in logs_dir (of their cleaned versions if `cleaned`)."""
+    manifests = []
+    for name in sorted(os.listdir(logs_dir)):
+        if name.startswith('.'):
+            # Not a session (clean_mouse_data's .clean_manifest.json)
+            continue
+        if name.endswith(CLEANED_MANIFEST_SUFFIX):
+            if cleaned:
+                manifests.append(os.path.join(logs_dir, name))
+        elif name.endswith(MANIFEST_SUFFIX) and not cleaned:
+            manifests.append(os.path.join(logs_dir, name))
+    return manifests
+
+
+def write_manifest(path, manifest):
+    """Write a manifest through a temporary file, so readers never see a partial one."""
+    tmp_file = path + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_file, path)
+
+
+def load_manifest(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def segment_files(path, manifest=None, complete_only=False):
+    """Full paths of the segments listed in a manifest, in order."""
+    if manifest is None:
+        manifest = load_manifest(path)
+    folder = os.path.dirname(path)
+    return [os.path.join(folder, segment['file']) for segment in manifest['segments']
+            if segment['complete'] or not complete_only]
+
+
+class SegmentRotation:
+    """
+    Mixin for LogWriter classes that writes a session as numbered segments.
+
+    The segment is rotated on the writer thread, before writing a batch,
+    once it holds `rotate_bytes` bytes or has been open for `rotate_seconds`
+    (so a new segment is only started when there is something to write).
+    Per-segment counters are kept from the queued Events, so they cost no
+    parsing.
+
+    Args:
+        session_base: Path prefix of the session files ('logs/2024-03-21 14-30-45')
+        rotate_bytes: Segment size that triggers a rotation (None = no size limit)
+        rotate_seconds: Segment duration that triggers a rotation (None = no time limit)
+        on_rotate: Called with the new segment number after each rotation (on the writer
+            thread; it must not block on the writer)
+        **kwargs: Arguments of the writer class (max_queue, batch_size, ...)
+    """
+    extension = '.txt'
+    format_name = 'text'
+
+    def __init__(self, session_base, rotate_bytes=None, rotate_seconds=None, on_rotate=None, **kwargs):
+        self.session_base = session_base
+        self.manifest_path = manifest_path(session_base)
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.on_rotate = on_rotate
+        self.segments = []
+        self.rotations = 0
+        self._segment = None
+        self._segment_opened = 0.0
+        super().__init__(segment_path(session_base, 1, self.extension), **kwargs)
+
+    def stats(self):
+        stats = super().stats()
+        stats['segments'] = len(self.segments)
+        return stats
+
+    def close(self):
+        if self._closed:
+            return
+        super().close()
+        self._close_segment(os.path.getsize(self.path))
+        self._write_manifest(complete=True)
+
+    def _open(self):
+        f = super()._open()
+        start_x = start_y = 0
+        if self._segment is not None:
+            start_x = self._segment['start_x'] + self._segment['dx']
+            start_y = self._segment['start_y'] + self._segment['dy']
+        self._segment = {
+            'file': os.path.basename(self.path), 'complete': False, 'first_t_ns': None, 'last_t_ns': None,
+            'lines': 0, 'events': 0, 'moves': 0, 'start_x': start_x, 'start_y': start_y, 'dx': 0, 'dy': 0,
+            'bytes': 0,
+        }
+        self.segments.append(self._segment)
+        self._segment_opened = time.monotonic()
+        self._write_manifest()
+        return f
+
+    def _write_batch(self, batch):
+        try:
+            if self._segment['lines'] and (
+                    (self.rotate_bytes and self._segment['bytes'] >= self.rotate_bytes)
+                    or (self.rotate_seconds and time.monotonic() - self._segment_opened >= self.rotate_seconds)):
+                self._rotate()
+        except Exception as e:
+            print(f"Error rotating log: {e}")
+
+        segment = self._segment
+        segment['lines'] += len(batch)
+        for item in batch:
+            if isinstance(item, str):
+                continue
+            t_ns, event_type, _, dx, dy = item
+            # Aggregated movements arrive after later events: keep the range, not the write order
+            if segment['first_t_ns'] is None or t_ns < segment['first_t_ns']:
+                segment['first_t_ns'] = t_ns
+            if segment['last_t_ns'] is None or t_ns > segment['last_t_ns']:
+                segment['last_t_ns'] = t_ns
+            segment['events'] += 1
+            if event_type == EVENT_MOUSE_MOVE:
+                segment['moves'] += 1
+                segment['dx'] += dx
+                segment['dy'] += dy
+        super()._write_batch(batch)
+        try:
+            segment['bytes'] = self._file.tell()
+        except (OSError, ValueError):
+            pass
+
+    def _rotate(self):
+        self._finish()
+        self._file.flush()
+        if self.durability != DURABILITY_BUFFERED:
+            self._sync()
+        # _finish of a binary segment rewrites its header, so the position is not the size
+        self._close_segment(os.path.getsize(self.path))
+        self._file.close()
+        self.path = segment_path(self.session_base, len(self.segments) + 1, self.extension)
+        self._file = self._open()
+        self.rotations += 1
+        if self.on_rotate:
+            self.on_rotate(len(self.segments))
+
+    def _close_segment(self, size):
+        self._segment['bytes'] = size
+        self._segment['complete'] = True
+
+    def _write_manifest(self, complete=False):
+        try:
+            write_manifest(self.manifest_path, {
+                'version': MANIFEST_VERSION,
+                'session': os.path.basename(self.session_base),
+                'format': self.format_name,
+                'complete': complete,
+                'rotate_bytes': self.rotate_bytes,
+                'rotate_seconds': self.rotate_seconds,
+                'segments': self.segments,
+            })
+        except OSError as e:
+            print(f"Error writing session manifest: {e}")
+
+
+class SegmentedLogWriter(SegmentRotation, LogWriter):
+    """LogWriter writing text segments."""
+
+
+class SegmentedBinaryLogWriter(SegmentRotation, BinaryLogWriter):
+    """BinaryLogWriter writing binary segments."""
+    extension = '.bin'
+    format_name = 'binary'
+
+
+def merge_log_data(parts):
+    """Concatenate the LogData of consecutive segments into one (line numbers and name codes remapped)."""
+    data = LogData()
+    codes = {}
+    pieces = {table: [] for table in _TABLES}
+    for part in parts:
+        remap = np.array([codes.setdefault(name, len(codes)) for name in part.names] or [0], dtype=np.int32)
+        for table, columns in pieces.items():
+            piece = dict(getattr(part, table))
+            piece['line'] = piece['line'] + data.n_lines
+            if 'code' in piece:
+                piece['code'] = remap[piece['code']]
+            columns.append(piece)
+        data.message_text.extend(part.message_text)
+        data.n_lines += part.n_lines
+    data.names = list(codes)
+    for table, columns in pieces.items():
+        if columns:
+            setattr(data, table, {column: np.concatenate([piece[column] for piece in columns])
+                                  for column in getattr(data, table)})
+    return data
+
+
+def _prepare_segment(path):
+    """Build the index and level of detail of a segment, so their sidecars exist."""
+    load_lod(path, index=load_index(path))
+    return path
+
+
+def _map_segments(function, paths, workers=None):
+    """function(path) for every segment, on a process pool when there are several."""
+    if len(paths) < 2 or workers == 1:
+        return [function(path) for path in paths]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(function, paths))
+
+
+def load_session_log(path, workers=None):
+    """Parse every segment of a session (in parallel, through the log cache) and merge them into one LogData."""
+    return merge_log_data(_map_segments(load_log, segment_files(path), workers))
+
+
+def segment_offsets(path, manifest=None):
+    """
+    Cumulative mouse position at the start of every segment, as (start_x, start_y) arrays.
+
+    Complete segments take their movement totals from the manifest; a segment
+    still being written is summed from its parsed movements.
+    """
+    if manifest is None:
+        manifest = load_manifest(path)
+    dx, dy = [], []
+    for segment, segment_file in zip(manifest['segments'], segment_files(path, manifest)):
+        if segment['complete']:
+            dx.append(segment['dx'])
+            dy.append(segment['dy'])
+        else:
+            moves = load_log(segment_file).moves
+            dx.append(int(moves['dx'].sum()))
+            dy.append(int(moves['dy'].sum()))
+    start_x = np.concatenate(([0], np.cumsum(dx[:-1], dtype=np.int64))).astype(np.int64)
+    start_y = np.concatenate(([0], np.cumsum(dy[:-1], dtype=np.int64))).astype(np.int64)
+    return start_x, start_y
+
+
+class SessionIndex:
+    """
+    LogIndex of every segment of a session, with the mouse position at the start of each.
+
+    Attributes:
+        paths: Segment files
+        indexes: LogIndex of each segment
+        start_x, start_y: Cumulative position before each segment
+        first_t_ns, last_t_ns: Earliest and latest movement timestamp of the session (-1 if none)
+        moves: Number of movements in the session
+    """
+
+    def __init__(self, paths, indexes, start_x, start_y):
+        self.paths = paths
+        self.indexes = indexes
+        self.start_x = start_x
+        self.start_y = start_y
+        with_moves = [index for index in indexes if index.moves]
+        self.first_t_ns = min(index.first_t_ns for index in with_moves) if with_moves else -1
+        self.last_t_ns = max(index.last_t_ns for index in with_moves) if with_moves else -1
+        self.moves = sum(index.moves for index in indexes)
+
+    def overlapping(self, start_ns, end_ns):
+        """Numbers of the segments with movements in start_ns <= t <= end_ns."""
+        return [i for i, index in enumerate(self.indexes)
+                if index.moves and index.first_t_ns <= end_ns and index.last_t_ns >= start_ns]
+
+    def read_window(self, start_ns, end_ns):
+        """Movements with start_ns <= t <= end_ns as (t_ns, cumulative_x, cumulative_y) across segments."""
+        windows = []
+        for i in self.overlapping(start_ns, end_ns):
+            t_ns, x, y = read_window(self.paths[i], start_ns, end_ns, self.indexes[i])
+            windows.append((t_ns, x + self.start_x[i], y + self.start_y[i]))
+        return _concatenate(windows)
+
+
+class SessionLevelOfDetail:
+    """LevelOfDetail of every segment of a session, used like decimate.LevelOfDetail."""
+
+    def __init__(self, session_index, lods):
+        self.session_index = session_index
+        self.lods = lods
+
+    def window_stats(self, start_ns, end_ns):
+        """
+        Number of movements and path length within start_ns <= t <= end_ns, at full resolution.
+        The path runs on across segments: the step from the last movement of one segment to
+        the first of the next is counted, so the totals match those of an unsegmented log.
+        """
+        moves, distance = 0, 0.0
+        index = self.session_index
+        for i in index.overlapping(start_ns, end_ns):
+            segment_moves, steps, first_step = window_steps(index.paths[i], start_ns, end_ns, index.indexes[i])
+            if segment_moves:
+                distance += steps if moves else steps - first_step
+                moves += segment_moves
+        return moves, distance
+
+    def window_points(self, start_ns, end_ns, max_points=DEFAULT_MAX_POINTS):
+        """Decimated (t_ns, x, y) across segments, or None if the raw window is small enough to plot as is."""
+        if self.window_stats(start_ns, end_ns)[0] <= max_points:
+            return None
+        index = self.session_index
+        windows = []
+        for i in index.overlapping(start_ns, end_ns):
+            window = self.lods[i].window_points(start_ns, end_ns, max_points)
+            if window is None:
+                window = read_window(index.paths[i], start_ns, end_ns, index.indexes[i])
+            t_ns, x, y = window
+            windows.append((t_ns, x + index.start_x[i], y + index.start_y[i]))
+        return decimate(*_concatenate(windows), max_points=max_points)
+
+
+def _concatenate(windows):
+    if not windows:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    return tuple(np.concatenate(columns) for columns in zip(*windows))
+
+
+def load_session_index(path, workers=None):
+    """
+    SessionIndex and SessionLevelOfDetail of a session. Segments whose
+    sidecars are missing are parsed and indexed in parallel first.
+    """
+    manifest = load_manifest(path)
+    paths = segment_files(path, manifest)
+    _map_segments(_prepare_segment, paths, workers)
+    start_x, start_y = segment_offsets(path, manifest)
+    index = SessionIndex(paths, [load_index(segment) for segment in paths], start_x, start_y)
+    return index, SessionLevelOfDetail(index, [load_lod(segment, index=segment_index)
+                                               for segment, segment_index in zip(paths, index.indexes)])
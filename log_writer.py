@@ -0,0 +1,262 @@
+import os
+import queue
+import threading
+import time
+
+from log_frames import CODEC_NONE, DEFAULT_BLOCK_SIZE, FrameWriter
+
+# Durability levels
+DURABILITY_BUFFERED = 'buffered'  # Written to the OS after every batch; lost if the machine goes down
+DURABILITY_GROUP = 'group'  # Also fsync'ed every sync_interval seconds or sync_events lines
+DURABILITY_STRICT = 'strict'  # fsync'ed after every batch; write() returns once its line is on disk
+DURABILITY_LEVELS = (DURABILITY_BUFFERED, DURABILITY_GROUP, DURABILITY_STRICT)
+
+
+class LogWriter:
+    """
+    Append log lines to a file from a dedicated background thread.
+
+    Producers only enqueue the message; the writer thread keeps the file open
+    and writes batches, flushing when either `batch_size` lines are pending or
+    `flush_interval` seconds have passed since the last flush. When the queue
+    is full the message is dropped (and counted) instead of stalling the
+    input thread, unless `block` is set. Messages are strings or objects
+    whose str() is the line (like binary_log.Event), which are then
+    formatted on the writer thread. Subclasses can change the file
+    format by overriding _open, _encode and _finish.
+
+    `durability` chooses when written lines are forced to disk with fsync:
+    never (buffered), in groups every `sync_interval` seconds or
+    `sync_events` lines, whichever comes first (group commit: one fsync
+    covers everything written since the last), or after every batch
+    (strict). In strict mode write() also waits until its line has been
+    synced, so the input thread pays the fsync latency; concurrent writers
+    share one fsync. With `framed`, every batch is written as a length- and
+    checksum-framed record (see log_frames.py), so a tail torn by a crash
+    can be detected and cut off. With `compression`, the lines are also
+    gathered into blocks of about `block_size` bytes, each compressed as
+    one frame; a block is written when it is full, before every fsync and
+    at the latest `block_interval` seconds after its first line.
+
+    Args:
+        path: Log file to append to
+        max_queue: Maximum number of lines waiting to be written
+        batch_size: Number of lines that triggers a flush
+        flush_interval: Maximum time (in seconds) a line may wait before being flushed
+        block: Wait for free space instead of dropping when the queue is full
+        durability: DURABILITY_BUFFERED, DURABILITY_GROUP or DURABILITY_STRICT
+        sync_interval: Maximum time (in seconds) between fsyncs in group mode
+        sync_events: Number of lines written since the last fsync that triggers one in group mode
+        framed: Write length/checksum framed batches instead of plain lines
+        compression: None, or the codec of compressed frames ('zlib', 'gzip' or 'lzma'); implies framed
+        compression_level: Codec level (0-9), None for the default
+        block_size: Text bytes per compressed block
+        block_interval: Maximum time (in seconds) a line may wait in an unfinished compressed block
+    """
+
+    def __init__(self, path, max_queue=100000, batch_size=1000, flush_interval=0.05, block=False,
+                 durability=DURABILITY_BUFFERED, sync_interval=0.05, sync_events=10000, framed=False,
+                 compression=None, compression_level=None, block_size=DEFAULT_BLOCK_SIZE, block_interval=1.0):
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError(f"Unknown durability '{durability}', expected one of {DURABILITY_LEVELS}")
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.block = block
+        self.durability = durability
+        self.sync_interval = sync_interval
+        self.sync_events = sync_events
+        self.compression = compression or CODEC_NONE
+        self.compression_level = compression_level
+        self.framed = framed or self.compression != CODEC_NONE
+        self.block_size = block_size
+        self.block_interval = block_interval
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._drop_lock = threading.Lock()
+        self._closed = False
+        # Strict mode: lines queued and lines synced so far, in queue order
+        self._order_lock = threading.Lock()
+        self._synced_cond = threading.Condition()
+        self._queued = 0
+        self._synced = 0
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+        # Counters reported by stats()
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.max_queue_depth = 0
+        self.syncs = 0
+        self.sync_time = 0.0
+        self.max_sync_time = 0.0
+
+        self._file = self._open()
+        self._thread = threading.Thread(target=self._run, name="LogWriter", daemon=True)
+        self._thread.start()
+
+    def write(self, message):
+        """Queue one log line. Returns False if the line was dropped."""
+        if self._closed:
+            self._count_drop()
+            return False
+        if self.durability == DURABILITY_STRICT:
+            return self._write_strict(message)
+        try:
+            if self.block:
+                self._queue.put(message)
+            else:
+                self._queue.put_nowait(message)
+            return True
+        except queue.Full:
+            self._count_drop()
+            return False
+
+    def _write_strict(self, message):
+        # Positions must follow queue order, so that `_synced` lines synced covers this one
+        with self._order_lock:
+            try:
+                if self.block:
+                    self._queue.put(message)
+                else:
+                    self._queue.put_nowait(message)
+            except queue.Full:
+                self._count_drop()
+                return False
+            self._queued += 1
+            position = self._queued
+        with self._synced_cond:
+            while self._synced < position and self._thread.is_alive():
+                self._synced_cond.wait(0.1)
+        return True
+
+    def _count_drop(self):
+        with self._drop_lock:
+            self.dropped += 1
+
+    def queue_depth(self):
+        """Number of lines currently waiting to be written."""
+        return self._queue.qsize()
+
+    def stats(self):
+        """Return a dictionary with the writer counters."""
+        return {
+            'queue_depth': self.queue_depth(),
+            'max_queue_depth': self.max_queue_depth,
+            'written': self.written,
+            'dropped': self.dropped,
+            'batches': self.batches,
+            'syncs': self.syncs,
+            'max_sync_ms': self.max_sync_time * 1000,
+        }
+
+    def flush(self):
+        """Block until every queued line has been written and flushed to the OS."""
+        if not self._closed:
+            self._queue.join()
+
+    def close(self):
+        """Write all pending lines, stop the writer thread and close the file."""
+        if self._closed:
+            return
+        self._closed = True
+        self._stop.set()
+        self._thread.join()
+        self._finish()
+        if self.durability != DURABILITY_BUFFERED:
+            self._file.flush()
+            self._sync()
+        self._file.close()
+
+    def _open(self):
+        if not self.framed:
+            return open(self.path, 'a')
+        return FrameWriter(self.path, self.compression, self.compression_level, self.block_size)
+
+    def _encode(self, batch):
+        return '\n'.join(map(str, batch)) + '\n'
+
+    def _finish(self):
+        if self.framed:
+            self._file.end_block()
+
+    def _run(self):
+        batch = []
+        last_flush = time.monotonic()
+        while True:
+            timeout = max(0.0, self.flush_interval - (time.monotonic() - last_flush))
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+                # Drain whatever else is already waiting without blocking
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            now = time.monotonic()
+            # Strict mode writes as soon as the queue is drained: producers are waiting for it
+            if batch and (len(batch) >= self.batch_size or now - last_flush >= self.flush_interval
+                          or self.durability == DURABILITY_STRICT or self._stop.is_set()):
+                self._write_batch(batch)
+                batch = []
+                last_flush = now
+            elif not batch:
+                last_flush = now
+            self._poll(now)
+
+            if self._stop.is_set() and not batch and self._queue.empty():
+                break
+
+    def _write_batch(self, batch):
+        depth = self._queue.qsize() + len(batch)
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+        try:
+            self._file.write(self._encode(batch))
+            self._file.flush()
+        except Exception as e:
+            print(f"Error writing to log: {e}")
+        self.written += len(batch)
+        self.batches += 1
+        if self.durability != DURABILITY_BUFFERED:
+            self._unsynced += len(batch)
+            if (self.durability == DURABILITY_STRICT or self._unsynced >= self.sync_events
+                    or time.monotonic() - self._last_sync >= self.sync_interval):
+                self._sync()
+        for _ in batch:
+            self._queue.task_done()
+
+    def _poll(self, now):
+        """Called on the writer thread at least every flush_interval, with or without new lines."""
+        if self.framed and self._file.pending and now - self._file.block_started >= self.block_interval:
+            self._end_block()
+        if self._unsynced and now - self._last_sync >= self.sync_interval:
+            self._sync()
+
+    def _end_block(self):
+        try:
+            self._file.end_block()
+            self._file.flush()
+        except Exception as e:
+            print(f"Error writing to log: {e}")
+
+    def _sync(self):
+        """fsync the file and release the strict-mode writers waiting for the lines written so far."""
+        if self.framed:
+            self._end_block()
+        start = time.monotonic()
+        try:
+            os.fsync(self._file.fileno())
+        except Exception as e:
+            print(f"Error syncing log: {e}")
+        self._last_sync = time.monotonic()
+        elapsed = self._last_sync - start
+        self.syncs += 1
+        self.sync_time += elapsed
+        self.max_sync_time = max(self.max_sync_time, elapsed)
+        self._unsynced = 0
+        with self._synced_cond:
+            self._synced = self.written
+            self._synced_cond.notify_all()
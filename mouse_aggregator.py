@@ -0,0 +1,126 @@
+"""
+Coalescing of raw mouse deltas before they reach the log.
+
+High polling rate mice deliver up to 8000 WM_INPUT messages per second.
+DeltaAggregator either passes every delta straight through or sums them into
+fixed time bins (for example 1 ms, or one bin per screenshot frame) and emits
+one movement per bin. Summing is exact: the deltas emitted always add up to
+the deltas received, so cumulative positions at bin boundaries are unchanged.
+
+The module has no platform dependencies; combined_logger feeds it from the
+raw input handler and benchmarks.mouse_aggregator drives it with synthetic
+event streams.
+"""
+import time
+
+import numpy as np
+
+
+class DeltaAggregator:
+    """
+    Sum raw mouse deltas into time bins and emit one movement per bin.
+
+    Bins are aligned to multiples of bin_ns on the event clock. A bin is emitted
+    when an event for a later bin arrives, when poll() sees that its end has
+    passed, or on flush(). The emitted movement carries the timestamp of the
+    last event in the bin. Bins whose deltas cancel out completely are not
+    emitted, as a zero movement is never logged.
+
+    Args:
+        emit: Called with (t_ns, dx, dy) for every emitted movement
+        bin_ns: Bin width in nanoseconds (0 = pass every event through)
+        clock: Clock returning nanoseconds, used when add() gets no timestamp
+    """
+
+    def __init__(self, emit, bin_ns=0, clock=time.time_ns):
+        if bin_ns < 0:
+            raise ValueError(f"bin_ns must be >= 0, got {bin_ns}")
+        self.emit = emit
+        self.bin_ns = int(bin_ns)
+        self.clock = clock
+
+        self.bin = None
+        self.last_t_ns = 0
+        self.dx = 0
+        self.dy = 0
+
+        # Statistics reported by stats()
+        self.events = 0
+        self.emitted = 0
+        self.cancelled = 0
+        self.total_dx = 0
+        self.total_dy = 0
+
+    def add(self, dx, dy, t_ns=None):
+        """Add one raw delta."""
+        if t_ns is None:
+            t_ns = self.clock()
+        self.events += 1
+        self.total_dx += dx
+        self.total_dy += dy
+        if self.bin_ns == 0:
+            self._emit(t_ns, dx, dy)
+            return
+
+        current = t_ns // self.bin_ns
+        if current != self.bin:
+            self.flush()
+            self.bin = current
+        self.last_t_ns = t_ns
+        self.dx += dx
+        self.dy += dy
+
+    def poll(self, now_ns=None):
+        """Emit the pending bin if its time span has already passed."""
+        if self.bin is None:
+            return
+        if now_ns is None:
+            now_ns = self.clock()
+        if now_ns // self.bin_ns > self.bin:
+            self.flush()
+
+    def flush(self):
+        """Emit the pending bin, if any."""
+        if self.bin is None:
+            return
+        if self.dx or self.dy:
+            self._emit(self.last_t_ns, self.dx, self.dy)
+        else:
+            self.cancelled += 1
+        self.bin = None
+        self.dx = self.dy = 0
+
+    def _emit(self, t_ns, dx, dy):
+        self.emitted += 1
+        self.emit(t_ns, dx, dy)
+
+    def stats(self):
+        """Return event counters and the delta totals received."""
+        return {
+            'events': self.events,
+            'emitted': self.emitted,
+            'cancelled': self.cancelled,
+            'total_dx': self.total_dx,
+            'total_dy': self.total_dy,
+        }
+
+
+def bin_deltas(t_ns, dx, dy, bin_ns):
+    """
+    Vectorized equivalent of feeding sorted events through DeltaAggregator and flushing.
+
+    Returns (t_ns, dx, dy) of the emitted movements.
+    """
+    t_ns = np.asarray(t_ns, dtype=np.int64)
+    dx = np.asarray(dx, dtype=np.int64)
+    dy = np.asarray(dy, dtype=np.int64)
+    if bin_ns == 0 or len(t_ns) == 0:
+        return t_ns, dx, dy
+
+    bins = t_ns // bin_ns
+    starts = np.flatnonzero(np.concatenate(([True], bins[1:] != bins[:-1])))
+    ends = np.append(starts[1:], len(t_ns)) - 1
+    sum_x = np.add.reduceat(dx, starts)
+    sum_y = np.add.reduceat(dy, starts)
+    keep = (sum_x != 0) | (sum_y != 0)
+    return t_ns[ends][keep], sum_x[keep], sum_y[keep]
@@ -0,0 +1,114 @@
+import time
+
+CATCH_UP = 'catch_up'
+SKIP = 'skip'
+TICK_POLICIES = (CATCH_UP, SKIP)
+
+# Jitter histogram resolution used for percentiles (0.1 ms buckets up to 100 ms)
+_BUCKET = 0.0001
+_BUCKETS = 1000
+
+
+class DeadlineScheduler:
+    """
+    Drift-free periodic scheduler on a monotonic clock.
+
+    Tick n is due at start + n * period, independent of how long the work
+    between ticks took, so the average rate never drifts. When the work
+    overruns a period the policy decides what happens with the missed ticks:
+    'catch_up' fires them back-to-back until the schedule is met again,
+    'skip' drops them and waits for the next deadline on the original grid.
+
+    Args:
+        frequency: Ticks per second
+        policy: 'catch_up' or 'skip'
+        spin: Seconds before each deadline to stop sleeping and busy-wait,
+            trading some CPU for lower jitter on coarse OS timers
+        clock: Monotonic clock returning seconds
+        sleep: Sleep function taking seconds
+    """
+
+    def __init__(self, frequency, policy=SKIP, spin=0.0, clock=time.perf_counter, sleep=time.sleep):
+        if policy not in TICK_POLICIES:
+            raise ValueError(f"Unknown tick policy '{policy}', expected one of {TICK_POLICIES}")
+        self.period = 1 / frequency
+        self.policy = policy
+        self.spin = spin
+        self.clock = clock
+        self.sleep = sleep
+
+        self.start = None
+        self.next_deadline = None
+
+        # Statistics reported by stats()
+        self.ticks = 0
+        self.skipped = 0
+        self.overruns = 0
+        self.max_overrun = 0.0
+        self.jitter_sum = 0.0
+        self.jitter_sq_sum = 0.0
+        self.max_jitter = 0.0
+        self.histogram = [0] * (_BUCKETS + 1)
+
+    def wait(self):
+        """Block until the next tick is due and return its deadline (clock seconds)."""
+        now = self.clock()
+        if self.start is None:
+            self.start = self.next_deadline = now
+
+        deadline = self.next_deadline
+        late = now - deadline
+        if late > self.period:
+            # The work since the previous tick took longer than a whole period
+            self.overruns += 1
+            self.max_overrun = max(self.max_overrun, late)
+            if self.policy == SKIP:
+                missed = int(late / self.period)
+                self.skipped += missed
+                deadline += missed * self.period
+
+        remaining = deadline - now
+        if remaining > self.spin:
+            self.sleep(remaining - self.spin)
+        while self.clock() < deadline:
+            pass
+
+        self._record(self.clock() - deadline)
+        self.next_deadline = deadline + self.period
+        return deadline
+
+    def _record(self, jitter):
+        self.ticks += 1
+        self.jitter_sum += jitter
+        self.jitter_sq_sum += jitter * jitter
+        self.max_jitter = max(self.max_jitter, jitter)
+        self.histogram[min(int(jitter / _BUCKET), _BUCKETS)] += 1
+
+    def _percentile(self, fraction):
+        target = fraction * self.ticks
+        seen = 0
+        for bucket, count in enumerate(self.histogram):
+            seen += count
+            if seen >= target:
+                return min((bucket + 1) * _BUCKET, self.max_jitter)
+        return self.max_jitter
+
+    def stats(self):
+        """Return tick counts and jitter/overrun statistics (times in milliseconds)."""
+        if self.ticks == 0:
+            return {'ticks': 0, 'skipped': 0, 'overruns': 0}
+        mean = self.jitter_sum / self.ticks
+        variance = max(0.0, self.jitter_sq_sum / self.ticks - mean * mean)
+        elapsed = self.clock() - self.start
+        return {
+            'ticks': self.ticks,
+            'skipped': self.skipped,
+            'overruns': self.overruns,
+            'achieved_hz': self.ticks / elapsed if elapsed > 0 else 0.0,
+            'target_hz': 1 / self.period,
+            'jitter_mean_ms': mean * 1000,
+            'jitter_std_ms': variance ** 0.5 * 1000,
+            'jitter_p99_ms': self._percentile(0.99) * 1000,
+            'jitter_max_ms': self.max_jitter * 1000,
+            'max_overrun_ms': self.max_overrun * 1000,
+        }
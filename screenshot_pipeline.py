@@ -0,0 +1,364 @@
+"""
+Producer/consumer screenshot pipeline.
+
+The grab thread only captures and timestamps frames into a bounded queue;
+a dispatcher hands them to a pool of worker processes that encode and
+write the files. This keeps the capture rate independent of how long
+PNG encoding takes.
+
+The frame source is any callable returning a PIL image (ImageGrab.grab on
+Windows, SyntheticFrameSource for benchmarks on other platforms). Every frame
+is reduced and encoded as described by an encoding profile
+(encoding_profiles.py) and written as one image file per frame, or appended to a segmented frame store
+(frame_store.py) with the compression done by the workers. With a change
+detector (frame_dedup.py), frames identical to the last saved one are not
+encoded at all; only a "same as" entry is recorded. That entry is written
+once the frame it refers to has been written; a duplicate of a frame whose
+encoding failed is stored as a frame of its own instead (in the frame store,
+duplicates recorded before the failure was known are lost and counted).
+"""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from PIL import Image
+
+from encoding_profiles import DEFAULT_PROFILE
+from frame_store import compress_payload
+from log_writer import LogWriter
+from scheduler import DeadlineScheduler, SKIP
+
+DROP_OLDEST = 'oldest'
+DROP_NEWEST = 'newest'
+BLOCK = 'block'
+DROP_POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+# Written to the screenshot folder when duplicates are skipped in PNG mode:
+# one "<skipped file> same as <saved file>" line per skipped frame
+DUPLICATES_NAME = 'duplicate_frames.txt'
+
+# Number of recent grab-to-written latencies kept in ScreenshotPipeline.latencies
+LATENCY_SAMPLES = 10000
+
+
+def screenshot_filename(t_ns, extension='.png'):
+    """Screenshot file name for a capture time in integer Unix nanoseconds."""
+    return f"screenshot_{t_ns}{extension}"
+
+
+def encode_frame(path, mode, size, data, profile=DEFAULT_PROFILE):
+    """Worker process entry point: rebuild the image and write it. Returns bytes written."""
+    profile.save(Image.frombytes(mode, size, data), path)
+    return os.path.getsize(path)
+
+
+class SyntheticFrameSource:
+    """
+    Frame source producing synthetic screen-like images without a display.
+
+    Each frame is a gradient background with a moving noise patch, which
+    compresses roughly like real game footage. With `repeat` > 1 every frame
+    is returned that many times in a row, like a paused or idle screen.
+    Call it like ImageGrab.grab.
+    """
+
+    def __init__(self, width=1920, height=1080, repeat=1):
+        self.size = (width, height)
+        self.repeat = max(1, repeat)
+        self.background = Image.linear_gradient('L').resize(self.size).convert('RGB')
+        self.patch = Image.effect_noise((width // 4, height // 4), 64).convert('RGB')
+        self.frame_count = 0
+
+    def __call__(self):
+        frame = self.background.copy()
+        offset = self.frame_count // self.repeat * 16 % (self.size[0] - self.patch.size[0])
+        frame.paste(self.patch, (offset, self.size[1] // 3))
+        self.frame_count += 1
+        return frame
+
+
+class ScreenshotPipeline:
+    """
+    Capture frames at `frequency` and encode them in worker processes.
+
+    Args:
+        folder: Directory the screenshots are written to
+        grab: Callable returning a PIL image
+        frequency: Target screenshots per second
+        workers: Number of encoder processes (defaults to CPU count - 1)
+        max_queue: Maximum number of captured frames waiting for an encoder
+        drop_policy: What to do when the queue is full: 'oldest' drops the oldest
+            queued frame, 'newest' drops the frame just captured, 'block' makes
+            the grab loop wait
+        tick_policy: DeadlineScheduler policy for missed capture ticks ('skip' or 'catch_up')
+        log: Callable receiving error messages
+        frame_store: FrameStoreWriter to append frames to instead of writing PNG
+            files to `folder` (the caller closes it after stop())
+        dedup: FrameChangeDetector; frames it reports as duplicates are recorded as
+            "same as" the last saved frame (in the frame store, or in DUPLICATES_NAME)
+        profile: EncodingProfile applied to every frame (with a frame store only its
+            region, scale and color are used)
+        clock: Clock returning integer Unix nanoseconds for capture times (SessionClock.now_ns
+            in combined_logger)
+    """
+
+    def __init__(self, folder, grab, frequency=60, workers=None, max_queue=32,
+                 drop_policy=DROP_OLDEST, tick_policy=SKIP, log=print, frame_store=None, dedup=None,
+                 profile=DEFAULT_PROFILE, clock=time.time_ns):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy '{drop_policy}', expected one of {DROP_POLICIES}")
+        self.folder = folder
+        self.grab = grab
+        self.frequency = frequency
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.max_queue = max_queue
+        self.drop_policy = drop_policy
+        self.log = log
+        self.frame_store = frame_store
+        self.dedup = dedup
+        self.profile = profile
+        self.clock = clock
+        self._duplicate_log = None
+        # Last frame submitted in PNG mode: its file name, its image (until it is written),
+        # whether it was written (None while encoding) and the duplicates waiting for it
+        self._reference = None
+        self._reference_lock = threading.Lock()
+        self.scheduler = DeadlineScheduler(frequency, policy=tick_policy)
+
+        self._frames = deque()
+        self._cond = threading.Condition()
+        self._in_flight = threading.Semaphore(self.workers * 2)
+        self._running = False
+        self._executor = None
+        self._threads = []
+
+        # Counters reported by stats(); the ones updated by more than one thread (dispatcher,
+        # encoder callbacks) are changed under _stats_lock
+        self._stats_lock = threading.Lock()
+        self.grabbed = 0
+        self.dropped = 0
+        self.encoded = 0
+        self.failed = 0
+        self.duplicates = 0
+        self.bytes_written = 0
+        self.started_at = None
+        self.stopped_at = None
+        # Seconds from grab to the encoded file being written, for recent frames
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def start(self):
+        os.makedirs(self.folder, exist_ok=True)
+        if self.dedup is not None and self.frame_store is None:
+            self._duplicate_log = LogWriter(os.path.join(self.folder, DUPLICATES_NAME))
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        self._running = True
+        self.started_at = time.monotonic()
+        self._threads = [
+            threading.Thread(target=self._grab_loop, name="ScreenshotGrab", daemon=True),
+            threading.Thread(target=self._dispatch_loop, name="ScreenshotDispatch", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """Stop capturing, encode every frame still queued and shut the workers down."""
+        if not self._running:
+            return
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._executor.shutdown(wait=True)
+        if self._duplicate_log is not None:
+            self._duplicate_log.close()
+        self.stopped_at = time.monotonic()
+
+    def stats(self):
+        """
+        Return capture counters and the achieved versus target frame rates.
+
+        bytes_saved estimates the output avoided by skipping duplicates, from the
+        average size of the frames that were written.
+        """
+        end = self.stopped_at or time.monotonic()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        return {
+            'profile': self.profile.name,
+            'target_fps': self.frequency,
+            'capture_fps': self.grabbed / elapsed if elapsed else 0.0,
+            'encoded_fps': self.encoded / elapsed if elapsed else 0.0,
+            'grabbed': self.grabbed,
+            'dropped': self.dropped,
+            'encoded': self.encoded,
+            'failed': self.failed,
+            'queue_depth': len(self._frames),
+            'bytes_written': self.bytes_written,
+            'duplicates': self.duplicates,
+            'bytes_saved': self.duplicates * self.bytes_written // self.encoded if self.encoded else 0,
+        }
+
+    def _grab_loop(self):
+        while self._running:
+            try:
+                self.scheduler.wait()
+                t_ns = self.clock()
+                grabbed_at = time.monotonic()
+                image = self.grab()
+                self.grabbed += 1
+                self._enqueue((t_ns, grabbed_at, image))
+            except Exception as e:
+                self.log(f"Screenshot error: {str(e)}")
+                time.sleep(1)  # Wait a bit before retrying
+
+    def _enqueue(self, frame):
+        with self._cond:
+            if len(self._frames) >= self.max_queue:
+                if self.drop_policy == DROP_NEWEST:
+                    self.dropped += 1
+                    return
+                if self.drop_policy == DROP_OLDEST:
+                    self._frames.popleft()
+                    self.dropped += 1
+                else:
+                    while len(self._frames) >= self.max_queue and self._running:
+                        self._cond.wait()
+            self._frames.append(frame)
+            self._cond.notify_all()
+
+    def _dispatch_loop(self):
+        while True:
+            with self._cond:
+                while not self._frames and self._running:
+                    self._cond.wait()
+                if not self._frames:
+                    break
+                t_ns, grabbed_at, image = self._frames.popleft()
+                self._cond.notify_all()
+
+            try:
+                image = self.profile.transform(image)
+            except Exception as e:
+                with self._stats_lock:
+                    self.failed += 1
+                self.log(f"Screenshot error: {str(e)}")
+                continue
+
+            if self.dedup is not None and self.dedup.is_duplicate(image) and self._record_duplicate(t_ns):
+                continue
+
+            self._in_flight.acquire()
+            job = reference = None
+            try:
+                if self.frame_store is not None:
+                    # Keyframe/delta decisions need capture order, so they are made here
+                    job = self.frame_store.prepare(t_ns, image)
+                    future = self._executor.submit(compress_payload, job[-1], self.frame_store.compression_level)
+                else:
+                    # File names are formatted here rather than on the grab thread
+                    name = screenshot_filename(t_ns, self.profile.extension)
+                    future = self._executor.submit(encode_frame, os.path.join(self.folder, name), image.mode,
+                                                   image.size, image.tobytes(), self.profile)
+                    if self.dedup is not None:
+                        reference = {'name': name, 'image': image, 'saved': None, 'waiting': []}
+                        with self._reference_lock:
+                            self._reference = reference
+            except Exception as e:
+                self._in_flight.release()
+                if job is not None:
+                    self.frame_store.add_failed(job)
+                if self.dedup is not None and self.frame_store is None:
+                    # Duplicates of this frame cannot refer to it
+                    with self._reference_lock:
+                        self._reference = None
+                with self._stats_lock:
+                    self.failed += 1
+                self.log(f"Screenshot error: {str(e)}")
+                continue
+            future.add_done_callback(partial(self._encoded, grabbed_at, job, reference))
+
+    def _record_duplicate(self, t_ns):
+        """
+        Record a duplicate of the last saved frame. Returns False when that frame could not be
+        written, in which case the duplicate has to be encoded like any other frame.
+        """
+        if self.frame_store is not None:
+            if not self.frame_store.add_duplicate(t_ns):
+                return False
+            with self._stats_lock:
+                self.duplicates += 1
+            return True
+        with self._reference_lock:
+            reference = self._reference
+            if reference is None or reference['saved'] is False:
+                return False
+            with self._stats_lock:
+                self.duplicates += 1
+            if reference['saved'] is None:
+                # Written once the frame it refers to is
+                reference['waiting'].append(t_ns)
+                return True
+        self._write_duplicate(t_ns, reference['name'])
+        return True
+
+    def _write_duplicate(self, t_ns, name):
+        self._duplicate_log.write(f"{screenshot_filename(t_ns, self.profile.extension)} same as {name}")
+
+    def _encoded(self, grabbed_at, job, reference, future):
+        self._in_flight.release()
+        saved = False
+        try:
+            if job is not None:
+                written = self.frame_store.add_compressed(job, future.result())
+            else:
+                written = future.result()
+            with self._stats_lock:
+                self.bytes_written += written
+                self.encoded += 1
+                self.latencies.append(time.monotonic() - grabbed_at)
+            saved = True
+        except Exception as e:
+            if job is not None:
+                self.frame_store.add_failed(job)
+            with self._stats_lock:
+                self.failed += 1
+            self.log(f"Screenshot error: {str(e)}")
+        if reference is not None:
+            self._resolve_duplicates(reference, saved)
+
+    def _resolve_duplicates(self, reference, saved):
+        """Write the duplicates that waited for a frame, as "same as" entries or, if it failed, as frames."""
+        with self._reference_lock:
+            reference['saved'] = saved
+            waiting, reference['waiting'] = reference['waiting'], []
+            image = reference.pop('image')
+        if saved:
+            for t_ns in waiting:
+                self._write_duplicate(t_ns, reference['name'])
+            return
+        # The frame they refer to is missing: the first duplicate that can be written takes its
+        # place (encoded here, this is rare) and the others refer to it
+        for i, t_ns in enumerate(waiting):
+            name = screenshot_filename(t_ns, self.profile.extension)
+            with self._stats_lock:
+                self.duplicates -= 1
+            try:
+                written = encode_frame(os.path.join(self.folder, name), image.mode, image.size, image.tobytes(),
+                                       self.profile)
+            except Exception as e:
+                with self._stats_lock:
+                    self.failed += 1
+                self.log(f"Screenshot error: {str(e)}")
+                continue
+            with self._stats_lock:
+                self.bytes_written += written
+                self.encoded += 1
+            for later in waiting[i + 1:]:
+                self._write_duplicate(later, name)
+            with self._reference_lock:
+                if self._reference is reference:
+                    self._reference = {'name': name, 'saved': True, 'waiting': []}
+            return
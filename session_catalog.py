@@ -0,0 +1,422 @@
+"""
+Incremental catalog of the recorded sessions.
+
+Listing sessions used to mean scanning the logs directory and parsing every
+log for anything beyond its name. The catalog keeps one row per session in
+an SQLite database next to the logs (`logs/.catalog.sqlite`): its files,
+time range and duration, event counts, compression, number of frames and,
+once cleaned, how many movements the cleaner removed. A refresh only
+parses the logs whose size or modification time changed since the last one
+(in parallel, through the parsed-log cache), takes the cleaning results from
+clean_mouse_data's manifest, and counts frames from a table of screenshot
+timestamps that is only rebuilt when the screenshot folder changes, or from
+the session's frame store. Sessions are then listed and filtered with one
+query.
+
+Single text or binary logs and segmented sessions (their manifest) are
+cataloged; cleaned logs are attached to the session they come from.
+
+Usage:
+    python session_catalog.py                                  # refresh and list every session
+    python session_catalog.py --min-minutes 10 --not-cleaned   # sessions worth cleaning
+    python session_catalog.py --since 2024-03-01 --with-frames --sort moves
+"""
+import argparse
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from binary_log import read_binary_log, EVENT_BUTTON_PRESS, EVENT_KEY_PRESS, EVENT_MOUSE_MOVE, EVENT_SCROLL
+from clean_mouse_data import cleaned_path, load_manifest as load_clean_manifest
+from dataset_builder import _DUPLICATE_RE, screenshot_time_ns
+from frame_store import INDEX_NAME, FrameStore
+from log_cache import load_log
+from log_frames import log_compression, recover
+from log_parser import MESSAGE_SESSION_END
+from log_segments import (CLEANED_MANIFEST_SUFFIX, MANIFEST_SUFFIX, cleaned_manifest_path, load_manifest,
+                          segment_files)
+from screenshot_pipeline import DUPLICATES_NAME
+
+CATALOG_NAME = '.catalog.sqlite'
+# Bumped whenever the tables change; older catalogs are rebuilt
+SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE sessions (
+    log TEXT PRIMARY KEY,       -- File name of the log, or of the manifest of a segmented session
+    session TEXT NOT NULL,      -- Session name ('2024-03-21 14-30-45')
+    format TEXT NOT NULL,       -- 'text' or 'binary'
+    segments INTEGER NOT NULL,  -- Number of segments, 0 for a single log file
+    signature TEXT NOT NULL,    -- Sizes and modification times of the files the row was computed from
+    size INTEGER NOT NULL,      -- Bytes of all the log files
+    compression TEXT,           -- Codec of compressed text logs, NULL for uncompressed
+    complete INTEGER NOT NULL,  -- 1 if the session was closed properly
+    start_ns INTEGER,           -- First and last timestamp in the log (Unix nanoseconds)
+    end_ns INTEGER,
+    duration_s REAL,
+    lines INTEGER NOT NULL,
+    moves INTEGER NOT NULL,
+    key_presses INTEGER NOT NULL,
+    clicks INTEGER NOT NULL,
+    scrolls INTEGER NOT NULL,
+    frame_source TEXT,          -- 'store' or 'screenshots'
+    frames_signature TEXT,
+    frames INTEGER NOT NULL DEFAULT 0,
+    cleaned_log TEXT,           -- Cleaned log or cleaned manifest, NULL if not cleaned
+    removed INTEGER,            -- Movements removed by the cleaner
+    removal_pct REAL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX sessions_start ON sessions (start_ns);
+CREATE TABLE screenshots (t_ns INTEGER NOT NULL);
+CREATE INDEX screenshots_t ON screenshots (t_ns);
+CREATE TABLE state (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+# Columns that can be sorted on from the command line
+SORT_COLUMNS = ('start_ns', 'duration_s', 'moves', 'frames', 'removal_pct', 'size', 'log')
+
+
+def log_stats(path):
+    """Event counts and time range of one text or binary log file."""
+    if path.endswith('.bin'):
+        records, _ = read_binary_log(path)
+        types = np.asarray(records['type'])
+        t_ns = np.asarray(records['t_ns'])
+        t_ns = t_ns[t_ns > 0]
+        stats = {
+            'lines': len(types),
+            'moves': int(np.count_nonzero(types == EVENT_MOUSE_MOVE)),
+            'key_presses': int(np.count_nonzero(types == EVENT_KEY_PRESS)),
+            'clicks': int(np.count_nonzero(types == EVENT_BUTTON_PRESS)),
+            'scrolls': int(np.count_nonzero(types == EVENT_SCROLL)),
+            'complete': recover(path, dry_run=True).get('closed', False),
+            'compression': None,
+        }
+    else:
+        data = load_log(path)
+        messages = data.messages
+        t_ns = np.concatenate([data.moves['t_ns'], data.keys['t_ns'], data.buttons['t_ns'], data.scrolls['t_ns'],
+                               data.key_states['t_ns'], messages['t_ns'][messages['t_ns'] >= 0]])
+        stats = {
+            'lines': data.n_lines,
+            'moves': len(data.moves['t_ns']),
+            'key_presses': int(np.count_nonzero(data.keys['pressed'])),
+            'clicks': int(np.count_nonzero(data.buttons['pressed'])),
+            'scrolls': len(data.scrolls['t_ns']),
+            'complete': bool(np.any(messages['kind'] == MESSAGE_SESSION_END)),
+            'compression': (log_compression(path) or (None,))[0],
+        }
+    stats['start_ns'] = int(t_ns.min()) if len(t_ns) else None
+    stats['end_ns'] = int(t_ns.max()) if len(t_ns) else None
+    return stats
+
+
+def _session_stats(job):
+    """Catalog columns of one session from its log files (run on the process pool)."""
+    log, paths, complete = job
+    rows = [log_stats(path) for path in paths]
+    starts = [row['start_ns'] for row in rows if row['start_ns'] is not None]
+    ends = [row['end_ns'] for row in rows if row['end_ns'] is not None]
+    stats = {column: sum(row[column] for row in rows)
+             for column in ('lines', 'moves', 'key_presses', 'clicks', 'scrolls')}
+    stats.update(
+        start_ns=min(starts) if starts else None,
+        end_ns=max(ends) if ends else None,
+        compression=rows[0]['compression'] if rows else None,
+        complete=complete if complete is not None else all(row['complete'] for row in rows),
+    )
+    stats['duration_s'] = (stats['end_ns'] - stats['start_ns']) / 1e9 if starts else None
+    return log, stats
+
+
+def _signature(stats, names):
+    """Sizes and modification times of the named files, from an os.scandir listing."""
+    return ';'.join(f"{name}:{stats[name].st_size}:{stats[name].st_mtime_ns}" if name in stats else f"{name}:-"
+                    for name in names)
+
+
+class SessionCatalog:
+    """
+    SQLite catalog of the sessions in a logs directory.
+
+    Args:
+        logs_dir: Directory with the session logs
+        screenshot_dir: Directory with the screenshots and frame stores (default: `screenshots`
+            next to logs_dir)
+        path: Database file (default: `.catalog.sqlite` in logs_dir)
+    """
+
+    def __init__(self, logs_dir, screenshot_dir=None, path=None):
+        self.logs_dir = logs_dir
+        if screenshot_dir is None:
+            screenshot_dir = os.path.join(os.path.dirname(os.path.abspath(logs_dir)), 'screenshots')
+        self.screenshot_dir = screenshot_dir
+        self.path = path or os.path.join(logs_dir, CATALOG_NAME)
+        self._db = sqlite3.connect(self.path)
+        self._db.row_factory = sqlite3.Row
+        if self._db.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+            with self._db:
+                for table in ('sessions', 'screenshots', 'state'):
+                    self._db.execute(f'DROP TABLE IF EXISTS {table}')
+                self._db.executescript(_SCHEMA)
+                self._db.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def refresh(self, workers=None):
+        """
+        Bring the catalog up to date with the logs and screenshot directories.
+
+        Only sessions whose log files changed are parsed. Returns a dict with the
+        number of sessions added, updated, removed and unchanged, and the elapsed time.
+        """
+        start = time.perf_counter()
+        with os.scandir(self.logs_dir) as entries:
+            stats = {entry.name: entry.stat() for entry in entries if entry.is_file()}
+        known = {row['log']: row for row in self._db.execute('SELECT * FROM sessions')}
+        clean_manifest = load_clean_manifest(self.logs_dir)
+
+        sessions = {}  # log -> (session name, format, files, segments, complete)
+        for name in sorted(stats):
+            if name.startswith('.') or name.endswith(CLEANED_MANIFEST_SUFFIX):
+                continue
+            if name.endswith(MANIFEST_SUFFIX):
+                try:
+                    manifest = load_manifest(os.path.join(self.logs_dir, name))
+                    files = [os.path.basename(path) for path in segment_files(os.path.join(self.logs_dir, name),
+                                                                                manifest)]
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"Error reading session manifest {name}: {e}")
+                    continue
+                sessions[name] = (name[:-len(MANIFEST_SUFFIX)], manifest['format'], [name] + files, len(files),
+                                  bool(manifest['complete']))
+            elif name.endswith('_log.txt') or name.endswith('_log.bin'):
+                sessions[name] = (name[:-len('_log.txt')], 'binary' if name.endswith('.bin') else 'text',
+                                  [name], 0, None)
+
+        # Parse the sessions that are new or whose files changed
+        jobs = []
+        signatures = {}
+        for log, (_, _, files, segments, complete) in sessions.items():
+            signatures[log] = _signature(stats, files)
+            if log not in known or known[log]['signature'] != signatures[log]:
+                paths = [os.path.join(self.logs_dir, name) for name in (files[1:] if segments else files)
+                         if name in stats]
+                jobs.append((log, paths, complete))
+        results = {}
+        if len(jobs) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for log, result in executor.map(_session_stats, jobs):
+                    results[log] = result
+        elif jobs:
+            log, result = _session_stats(jobs[0])
+            results[log] = result
+
+        now = time.time()
+        summary = {'added': 0, 'updated': 0, 'removed': 0, 'unchanged': 0}
+        with self._db:
+            for log, result in results.items():
+                session, log_format, files, segments, _ = sessions[log]
+                summary['updated' if log in known else 'added'] += 1
+                self._db.execute(
+                    'INSERT OR REPLACE INTO sessions (log, session, format, segments, signature, size, compression, '
+                    'complete, start_ns, end_ns, duration_s, lines, moves, key_presses, clicks, scrolls, updated_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (log, session, log_format, segments, signatures[log],
+                     sum(stats[name].st_size for name in files if name in stats), result['compression'],
+                     int(result['complete']), result['start_ns'], result['end_ns'], result['duration_s'],
+                     result['lines'], result['moves'], result['key_presses'], result['clicks'], result['scrolls'],
+                     now))
+            for log in known.keys() - sessions.keys():
+                self._db.execute('DELETE FROM sessions WHERE log = ?', (log,))
+                summary['removed'] += 1
+            summary['unchanged'] = len(sessions) - len(results)
+            self._refresh_cleaning(sessions, stats, clean_manifest)
+            self._refresh_frames(force={log for log in results if log in sessions})
+        summary['elapsed'] = time.perf_counter() - start
+        return summary
+
+    def _refresh_cleaning(self, sessions, stats, clean_manifest):
+        """Cleaning results of every session, from clean_mouse_data's manifest (no parsing)."""
+        for log, (_, log_format, files, segments, _) in sessions.items():
+            inputs = files[1:] if segments else files
+            if segments:
+                cleaned = os.path.basename(cleaned_manifest_path(log))
+            else:
+                cleaned = os.path.basename(cleaned_path(log)) if log_format == 'text' else None
+            # Entries of logs changed since they were cleaned are stale, as for clean_logs
+            entries = [clean_manifest.get(name) for name in inputs]
+            entries = [entry for name, entry in zip(inputs, entries)
+                       if entry is not None and entry.get('output') in stats and name in stats
+                       and entry.get('size') == stats[name].st_size and entry.get('mtime_ns') == stats[name].st_mtime_ns]
+            if cleaned not in stats or len(entries) < len(inputs) or not entries:
+                cleaned = removed = removal_pct = None
+            else:
+                removed = sum(entry['removed'] for entry in entries)
+                moves = sum(entry['moves'] for entry in entries)
+                removal_pct = removed / moves * 100 if moves else 0.0
+            self._db.execute('UPDATE sessions SET cleaned_log = ?, removed = ?, removal_pct = ? WHERE log = ? '
+                             'AND (cleaned_log IS NOT ? OR removed IS NOT ? OR removal_pct IS NOT ?)',
+                             (cleaned, removed, removal_pct, log, cleaned, removed, removal_pct))
+
+    def _refresh_frames(self, force=()):
+        """
+        Frame counts: from the session's frame store, or from the screenshot timestamps, which are
+        re-read only when the screenshot folder (or its duplicate list) changed.
+        """
+        folder = self.screenshot_dir
+        signature = '-'
+        if os.path.isdir(folder):
+            duplicates = os.path.join(folder, DUPLICATES_NAME)
+            signature = f"{os.stat(folder).st_mtime_ns}:" + (
+                f"{os.path.getsize(duplicates)}" if os.path.exists(duplicates) else '-')
+        row = self._db.execute("SELECT value FROM state WHERE key = 'screenshots'").fetchone()
+        rescan = row is None or row[0] != signature
+        if rescan:
+            self._db.execute('DELETE FROM screenshots')
+            if os.path.isdir(folder):
+                self._db.executemany('INSERT INTO screenshots (t_ns) VALUES (?)',
+                                     ((t_ns,) for t_ns in _screenshot_times(folder)))
+            self._db.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('screenshots', ?)", (signature,))
+
+        for row in self._db.execute('SELECT log, session, start_ns, end_ns, frames_signature FROM sessions').fetchall():
+            store = os.path.join(folder, row['session'] + '_frames')
+            index = os.path.join(store, INDEX_NAME)
+            if os.path.exists(index):
+                stat = os.stat(index)
+                store_signature = f"store:{stat.st_size}:{stat.st_mtime_ns}"
+                if store_signature == row['frames_signature']:
+                    continue
+                frame_store = FrameStore(store)
+                frames = len(frame_store)
+                frame_store.close()
+                source, frames_signature = 'store', store_signature
+            elif rescan or row['log'] in force or row['frames_signature'] != 'screenshots':
+                frames = 0
+                if row['start_ns'] is not None:
+                    frames = self._db.execute('SELECT COUNT(*) FROM screenshots WHERE t_ns BETWEEN ? AND ?',
+                                              (row['start_ns'], row['end_ns'])).fetchone()[0]
+                source, frames_signature = ('screenshots' if frames else None), 'screenshots'
+            else:
+                continue
+            self._db.execute('UPDATE sessions SET frames = ?, frame_source = ?, frames_signature = ? WHERE log = ?',
+                             (frames, source, frames_signature, row['log']))
+
+    def sessions(self, min_duration=None, cleaned=None, with_frames=False, since_ns=None, until_ns=None,
+                 sort='start_ns', descending=False):
+        """
+        Sessions matching the filters, as dicts of the catalog columns (plus 'path').
+
+        Args:
+            min_duration: Minimum duration in seconds
+            cleaned: True for cleaned sessions only, False for not cleaned ones, None for both
+            with_frames: Only sessions with screenshots or a frame store
+            since_ns, until_ns: Only sessions starting in this time range (Unix nanoseconds)
+            sort: Column to order by (one of SORT_COLUMNS)
+            descending: Reverse the order
+        """
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"Cannot sort on '{sort}', expected one of {SORT_COLUMNS}")
+        conditions, params = [], []
+        if min_duration is not None:
+            conditions.append('duration_s >= ?')
+            params.append(min_duration)
+        if cleaned is not None:
+            conditions.append('cleaned_log IS NOT NULL' if cleaned else 'cleaned_log IS NULL')
+        if with_frames:
+            conditions.append('frames > 0')
+        if since_ns is not None:
+            conditions.append('start_ns >= ?')
+            params.append(since_ns)
+        if until_ns is not None:
+            conditions.append('start_ns < ?')
+            params.append(until_ns)
+        query = 'SELECT * FROM sessions' + (' WHERE ' + ' AND '.join(conditions) if conditions else '')
+        query += f" ORDER BY {sort} {'DESC' if descending else 'ASC'}, log"
+        return [dict(row, path=os.path.join(self.logs_dir, row['log'])) for row in self._db.execute(query, params)]
+
+
+def _screenshot_times(folder):
+    """Capture times of the screenshot files in a folder and of the duplicates listed next to them."""
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            t_ns = screenshot_time_ns(entry.name)
+            if t_ns is not None:
+                yield t_ns
+    duplicates = os.path.join(folder, DUPLICATES_NAME)
+    if os.path.exists(duplicates):
+        with open(duplicates, 'r') as f:
+            for line in f:
+                match = _DUPLICATE_RE.search(line.rstrip('\n'))
+                t_ns = screenshot_time_ns(match.group(1)) if match else None
+                if t_ns is not None:
+                    yield t_ns
+
+
+def open_catalog(logs_dir, screenshot_dir=None, workers=None):
+    """Open the catalog of a logs directory and refresh it. Returns the SessionCatalog."""
+    catalog = SessionCatalog(logs_dir, screenshot_dir)
+    summary = catalog.refresh(workers)
+    if summary['added'] or summary['updated']:
+        print(f"Session catalog: {summary['added']} new, {summary['updated']} changed, {summary['unchanged']} "
+              f"unchanged session(s) ({summary['elapsed']:.1f} s)")
+    return catalog
+
+
+def format_session(row):
+    """One line describing a catalog row."""
+    duration = f"{row['duration_s'] / 60:6.1f} min" if row['duration_s'] is not None else "     - min"
+    cleaned = f"{row['removal_pct']:5.1f}% removed" if row['cleaned_log'] else "  not cleaned"
+    segments = f", {row['segments']} segments" if row['segments'] else ""
+    state = "" if row['complete'] else ", unfinished"
+    return (f"{row['log']:<45} {duration} {row['moves']:>10,} moves {row['frames']:>8,} frames  {cleaned}"
+            f"{segments}{state}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh and query the catalog of recorded sessions.")
+    parser.add_argument('--logs-dir', default="logs", help="Directory with the session logs")
+    parser.add_argument('--screenshot-dir', default=None, help="Directory with the screenshots (default: "
+                                                               "screenshots next to the logs directory)")
+    parser.add_argument('--workers', type=int, default=None, help="Processes parsing changed logs")
+    parser.add_argument('--min-minutes', type=float, default=None, help="Minimum session duration")
+    cleaned = parser.add_mutually_exclusive_group()
+    cleaned.add_argument('--cleaned', dest='cleaned', action='store_true', default=None,
+                         help="Only sessions cleaned by clean_mouse_data.py")
+    cleaned.add_argument('--not-cleaned', dest='cleaned', action='store_false', help="Only sessions not cleaned yet")
+    parser.add_argument('--with-frames', action='store_true', help="Only sessions with screenshots")
+    parser.add_argument('--since', default=None, help="Only sessions started on or after this date (YYYY-MM-DD)")
+    parser.add_argument('--until', default=None, help="Only sessions started before this date (YYYY-MM-DD)")
+    parser.add_argument('--sort', choices=SORT_COLUMNS, default='start_ns')
+    parser.add_argument('--reverse', action='store_true')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.logs_dir):
+        print(f"Logs directory '{args.logs_dir}' not found")
+        return
+    date_ns = lambda text: int(datetime.strptime(text, '%Y-%m-%d').timestamp() * 1e9) if text else None
+    with open_catalog(args.logs_dir, args.screenshot_dir, args.workers) as catalog:
+        rows = catalog.sessions(min_duration=args.min_minutes * 60 if args.min_minutes is not None else None,
+                                cleaned=args.cleaned, with_frames=args.with_frames, since_ns=date_ns(args.since),
+                                until_ns=date_ns(args.until), sort=args.sort, descending=args.reverse)
+    for row in rows:
+        print(format_session(row))
+    hours = sum(row['duration_s'] or 0 for row in rows) / 3600
+    print(f"\n{len(rows)} session(s), {hours:.1f} hours, {sum(row['moves'] for row in rows):,} movements, "
+          f"{sum(row['frames'] for row in rows):,} frames")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Single high-resolution clock for everything recorded in a session.
+
+time.time() is read once, when the clock is created, and paired with
+time.perf_counter_ns(); from then on every timestamp is that wall time plus
+the perf_counter_ns() ticks elapsed since, as integer nanoseconds. Input
+events, screenshots and status lines therefore share one monotonic time
+base with sub-microsecond resolution (high-rate mouse events no longer
+collide on the same millisecond), and reading it is one perf_counter_ns()
+call and an addition, with no string formatting on the capture threads.
+
+The wall time read at the anchor is only as precise as time.time_ns() on the
+platform; the anchor is taken from the tightest of a few
+perf_counter_ns()/time_ns()/perf_counter_ns() samples. Over a session the
+wall clock may drift from the perf counter (NTP adjustments); stats()
+reports how far apart they are.
+"""
+import time
+
+ANCHOR_SAMPLES = 16
+
+
+class SessionClock:
+    """
+    Wall-time-anchored perf_counter_ns() clock.
+
+    Args:
+        samples: Number of anchor readings to choose the tightest from
+    """
+
+    def __init__(self, samples=ANCHOR_SAMPLES):
+        best = None
+        for _ in range(max(1, samples)):
+            before = time.perf_counter_ns()
+            wall_ns = time.time_ns()
+            after = time.perf_counter_ns()
+            if best is None or after - before < best[0]:
+                best = (after - before, wall_ns, (before + after) // 2)
+        self.anchor_uncertainty_ns, self.anchor_wall_ns, self.anchor_perf_ns = best
+        self._offset_ns = self.anchor_wall_ns - self.anchor_perf_ns
+
+    def now_ns(self):
+        """Current session time as integer Unix nanoseconds."""
+        return time.perf_counter_ns() + self._offset_ns
+
+    def from_perf_ns(self, perf_ns):
+        """Session time of a perf_counter_ns() reading."""
+        return perf_ns + self._offset_ns
+
+    def stats(self):
+        """Anchor and current drift (wall clock minus session clock) in nanoseconds."""
+        return {
+            'anchor_wall_ns': self.anchor_wall_ns,
+            'anchor_perf_ns': self.anchor_perf_ns,
+            'anchor_uncertainty_ns': self.anchor_uncertainty_ns,
+            'drift_ns': time.time_ns() - self.now_ns(),
+        }
@@ -1,36 +1,22 @@
 import os
-import re
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.patches import Rectangle
 from datetime import datetime
+from log_cache import load_log
+from decimate import load_lod
+from log_index import load_index, read_window, slice_by_time
+from log_segments import SessionIndex, cleaned_manifest_path, is_manifest, load_session_index, load_session_log
+from session_catalog import format_session, open_catalog
 
 def parse_log_file(file_path):
-    """Parse a log file and return timestamps and movements."""
-    timestamps = []
-    movements_x = []
-    movements_y = []
-    cumulative_x = 0
-    cumulative_y = 0
-    
-    with open(file_path, 'r') as f:
-        for line in f:
-            # Match timestamp and mouse movement data
-            match = re.match(r'(\d+\.\d+) - MOUSE MOVED: (-?\d+), (-?\d+)', line)
-            if match:
-                timestamp = float(match.group(1))
-                dx = int(match.group(2))
-                dy = int(match.group(3))
-                
-                # Accumulate movements to get position
-                cumulative_x += dx
-                cumulative_y += dy
-                
-                timestamps.append(timestamp)
-                movements_x.append(cumulative_x)
-                movements_y.append(cumulative_y)
-    
-    return np.array(timestamps), np.array(movements_x), np.array(movements_y)
+    """
+    Parse a log file, or every segment of a session given its manifest, and return
+    timestamps (seconds) and cumulative mouse positions.
+    """
+    data = load_session_log(file_path) if is_manifest(file_path) else load_log(file_path)
+    t_ns, movements_x, movements_y = data.mouse_positions()
+    return t_ns / 1e9, movements_x, movements_y
 
 def get_time_window(timestamps, total_duration):
     """Get start and end times from user input."""
@@ -52,31 +38,74 @@ def get_time_window(timestamps, total_duration):
             print("Please enter valid numbers")
 
 def filter_data_by_time(t, x, y, start_time, end_time):
-    """Filter data arrays to include only points within the time window."""
-    mask = (t >= start_time) & (t <= end_time)
-    return t[mask], x[mask], y[mask]
+    """Filter data arrays (sorted by time) to include only points within the time window."""
+    return slice_by_time(t, start_time, end_time, x, y)
+
+def load_time_window(file_path, index, start_time, end_time, lod=None):
+    """
+    Load the movements of a log within a time window (seconds since its first movement).
+
+    With a LevelOfDetail, wide windows are decimated to about one point per pixel.
+    """
+    start_ns = index.first_t_ns + int(start_time * 1e9)
+    end_ns = index.first_t_ns + int(end_time * 1e9)
+    window = lod.window_points(start_ns, end_ns) if lod is not None else None
+    if window is None and isinstance(index, SessionIndex):
+        window = index.read_window(start_ns, end_ns)
+    elif window is None:
+        window = read_window(file_path, start_ns, end_ns, index)
+    t_ns, x, y = window
+    return (t_ns - index.first_t_ns) / 1e9, x, y
+
+def window_stats(index, lod, start_time, end_time):
+    """Full-resolution movement count and path length of a log within a time window."""
+    return lod.window_stats(index.first_t_ns + int(start_time * 1e9), index.first_t_ns + int(end_time * 1e9))
 
 def plot_comparison(original_file):
-    """Plot original vs cleaned mouse movements."""
+    """Plot original vs cleaned mouse movements of a log or a segmented session (its manifest)."""
     # Get the cleaned file path
-    base, ext = os.path.splitext(original_file)
-    cleaned_file = f"{base}_cleaned{ext}"
+    if is_manifest(original_file):
+        cleaned_file = cleaned_manifest_path(original_file)
+    else:
+        base, ext = os.path.splitext(original_file)
+        cleaned_file = f"{base}_cleaned{ext}"
     
     if not os.path.exists(cleaned_file):
         print(f"Cleaned file not found: {cleaned_file}")
         return
     
-    # Parse both files
-    orig_t, orig_x, orig_y = parse_log_file(original_file)
-    clean_t, clean_x, clean_y = parse_log_file(cleaned_file)
+    # Index both files once; each time window then only parses the part of the logs it needs,
+    # or takes decimated points from the multi-resolution pyramid when it is wide. Sessions
+    # index their segments in parallel and place them on one path with the manifest offsets
+    if is_manifest(original_file):
+        orig_index, orig_lod = load_session_index(original_file)
+        clean_index, clean_lod = load_session_index(cleaned_file)
+    else:
+        orig_index = load_index(original_file)
+        clean_index = load_index(cleaned_file)
+    if orig_index.moves == 0:
+        print(f"No mouse movements found in {original_file}")
+        return
+    if not is_manifest(original_file):
+        orig_lod = load_lod(original_file, index=orig_index)
+        clean_lod = load_lod(cleaned_file, index=clean_index)
     
+    while True:
+        plot_time_window(original_file, orig_index, orig_lod, cleaned_file, clean_index, clean_lod)
+        
+        # Ask if user wants to view another time window
+        if not input("\nWould you like to view another time window? (y/n): ").lower().startswith('y'):
+            break
+
+def plot_time_window(original_file, orig_index, orig_lod, cleaned_file, clean_index, clean_lod):
+    """Ask for a time window and plot original vs cleaned movements within it."""
     # Get the time window from user
-    total_duration = orig_t[-1] - orig_t[0]
-    start_time, end_time = get_time_window(orig_t, total_duration)
+    total_duration = (orig_index.last_t_ns - orig_index.first_t_ns) / 1e9
+    start_time, end_time = get_time_window(None, total_duration)
     
-    # Filter data to the selected time window
-    orig_t, orig_x, orig_y = filter_data_by_time(orig_t - orig_t[0], orig_x, orig_y, start_time, end_time)
-    clean_t, clean_x, clean_y = filter_data_by_time(clean_t - clean_t[0], clean_x, clean_y, start_time, end_time)
+    # Load only the data in the selected time window (decimated for plotting when wide)
+    orig_t, orig_x, orig_y = load_time_window(original_file, orig_index, start_time, end_time, orig_lod)
+    clean_t, clean_x, clean_y = load_time_window(cleaned_file, clean_index, start_time, end_time, clean_lod)
     
     # Create figure with subplots
     fig = plt.figure(figsize=(15, 10))
@@ -115,15 +144,12 @@ def plot_comparison(original_file):
     ax4 = plt.subplot(224)
     ax4.axis('off')
     
-    # Calculate statistics for the selected window
-    orig_movements = len(orig_t)
-    clean_movements = len(clean_t)
+    # Calculate statistics for the selected window (on every movement, not the plotted points)
+    orig_movements, orig_total_dist = window_stats(orig_index, orig_lod, start_time, end_time)
+    clean_movements, clean_total_dist = window_stats(clean_index, clean_lod, start_time, end_time)
     removed = orig_movements - clean_movements
     removal_percent = (removed / orig_movements) * 100 if orig_movements > 0 else 0
     
-    orig_total_dist = np.sum(np.sqrt(np.diff(orig_x)**2 + np.diff(orig_y)**2))
-    clean_total_dist = np.sum(np.sqrt(np.diff(clean_x)**2 + np.diff(clean_y)**2))
-    
     stats_text = (
         f"Statistics (Time Window: {start_time:.2f}s - {end_time:.2f}s):\n\n"
         f"Original movements: {orig_movements}\n"
@@ -148,10 +174,6 @@ def plot_comparison(original_file):
     
     # Show plot
     plt.show()
-    
-    # Ask if user wants to view another time window
-    if input("\nWould you like to view another time window? (y/n): ").lower().startswith('y'):
-        plot_comparison(original_file)
 
 def main():
     # Look for logs in the logs directory
@@ -160,18 +182,19 @@ def main():
         print(f"Logs directory '{logs_dir}' not found")
         return
     
-    # Get list of original log files (excluding cleaned ones)
-    log_files = [f for f in os.listdir(logs_dir) 
-                 if f.endswith('_log.txt') and not f.endswith('_cleaned_log.txt')]
+    # Sessions from the catalog (text logs and segmented text sessions), refreshed for new or changed logs
+    with open_catalog(logs_dir) as catalog:
+        sessions = [row for row in catalog.sessions() if row['format'] == 'text']
+    log_files = [row['log'] for row in sessions]
     
     if not log_files:
         print("No log files found in logs directory")
         return
     
-    # Print available files
+    # Print available sessions
     print("\nAvailable log files:")
-    for i, file in enumerate(log_files):
-        print(f"{i+1}. {file}")
+    for i, row in enumerate(sessions):
+        print(f"{i+1}. {format_session(row)}")
     
     # Get user selection
     while True: